@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+"""
+Micro-benchmark of parsing GUANO metadata with a large vendor namespace.
+
+usage::
+
+    $> python benchmarks/bench_parse.py [NFIELDS]
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import timeit
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'tests')]
+import guano
+from guano import GuanoFile
+from helpers import coersion_rules, ReferenceParser
+
+
+def make_metadata(nfields=1000):
+    """Build GUANO metadata with well-known fields and a large vendor namespace"""
+    lines = [
+        'GUANO|Version: 1.0',
+        'Timestamp: 2017-04-20T01:23:45-07:00',
+        'Loc Position: 41.713889 -121.508333',
+        'Length: 2.5',
+        'Note: This is a \\nmultiline text note',
+    ]
+    lines += ['Vendor|Field %d: value number %d' % (i, i) for i in range(nfields)]
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def main():
+    nfields = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    md = make_metadata(nfields)
+    number, repeat = max(1, 20000 // nfields), 50
+
+    # an application's own rules for some of the vendor fields, which the reference parser looks
+    # up in a flat map of full keys, rather than by namespace in a `Registry`
+    registry = guano.Registry(GuanoFile.registry)
+    registry.register('Vendor', ['Field %d' % i for i in range(0, nfields, 10)], str.upper, str.lower)
+
+    rules, vendor_rules = coersion_rules(GuanoFile.registry), coersion_rules(registry)
+
+    gfile = GuanoFile.from_string(md)
+    keys = list(gfile)
+
+    def reference(): return ReferenceParser(rules)._parse(md)
+    def vendor_reference(): return ReferenceParser(vendor_rules)._parse(md)
+
+    rows = [
+        ('reference parser', reference, None),
+        ('iter_fields', lambda: list(guano.iter_fields(md)), reference),
+        ('GuanoFile.from_string', lambda: GuanoFile.from_string(md), reference),
+        ('  reference', vendor_reference, None),
+        ('  with vendor rules', lambda: GuanoFile.from_string(md, registry=registry), vendor_reference),
+        ('GuanoFile.to_string', lambda: GuanoFile.from_string(md).to_string(), None),
+        ('GuanoFile.items', lambda: list(gfile.items()), None),
+        ('GuanoFile.__getitem__', lambda: [gfile[k] for k in keys], None),
+    ]
+
+    # rounds are interleaved so that parsing can be fairly timed relative to the original parser
+    # (verbatim, from tests/helpers.py), given the same coercion rules
+    best = {}
+    for _ in range(repeat):
+        for name, stmt, baseline in rows:
+            best[stmt] = min(best.get(stmt, float('inf')), timeit.timeit(stmt, number=number) / number)
+    for name, stmt, baseline in rows:
+        relative = '  %5.2fx reference' % (best[baseline] / best[stmt]) if baseline else ''
+        print('%-24s %8.1f us/parse  %6.0f ns/field%s' % (name, best[stmt] * 1e6, best[stmt] * 1e9 / (nfields + 5), relative))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+"""
+Benchmark of startup cost: the import time of the `guano` module (as reported by
+`python -X importtime`), and the per-file cost of running `guano dump` once per file versus
+feeding it many paths on stdin in a single process.
+
+usage::
+
+    $> python benchmarks/bench_startup.py [NFILES]
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import shutil
+import tempfile
+import subprocess
+import time
+
+ROOT = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, ROOT)
+from guano import GuanoFile, wavparams
+
+CLI = os.path.join(ROOT, 'guano_cli.py')
+ENV = dict(os.environ, PYTHONPATH=ROOT)
+
+
+def import_times(module='guano', repeat=10):
+    """Get the best cumulative import time in microseconds of a module and each module it imports"""
+    best = {}
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+                             env=ENV, stderr=subprocess.PIPE, universal_newlines=True, check=True).stderr
+        for line in out.splitlines():
+            if not line.startswith('import time:') or 'cumulative' in line:
+                continue
+            self_us, cumulative_us, name = line[len('import time:'):].split('|')
+            name = name.strip()
+            best[name] = min(best.get(name, float('inf')), int(cumulative_us))
+    return best
+
+
+def make_files(dirname, nfiles):
+    fnames = []
+    for i in range(nfiles):
+        g = GuanoFile.from_string('GUANO|Version: 1.0\nSpecies Manual ID: Mylu')
+        g.filename = os.path.join(dirname, 'rec%04d.wav' % i)
+        g.wav_params = wavparams(1, 2, 250000, 1000, 'NONE', None)
+        g.wav_data = b'\0' * 2000
+        g.write(make_backup=False)
+        fnames.append(g.filename)
+    return fnames
+
+
+def main():
+    nfiles = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+
+    times = import_times()
+    print('import guano: %8.1f ms' % (times['guano'] / 1000.0))
+    deps = sorted(((us, name) for name, us in times.items() if name != 'guano' and not name.startswith('encodings')),
+                  reverse=True)
+    for us, name in deps[:5]:
+        print('  %-24s %6.1f ms' % (name, us / 1000.0))
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        fnames = make_files(tmpdir, nfiles)
+        devnull = subprocess.DEVNULL
+
+        start = time.time()
+        for fname in fnames:
+            subprocess.run([sys.executable, CLI, 'dump', fname], env=ENV, stdout=devnull, stderr=devnull, check=True)
+        per_process = (time.time() - start) / nfiles
+
+        start = time.time()
+        subprocess.run([sys.executable, CLI, 'dump', '-'], env=ENV, input='\n'.join(fnames).encode(),
+                       stdout=devnull, stderr=devnull, check=True)
+        batched = (time.time() - start) / nfiles
+
+        print('guano dump, one process per file: %6.1f ms/file' % (per_process * 1000))
+        print('guano dump -, paths on stdin:      %6.1f ms/file' % (batched * 1000))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -64,7 +64,7 @@ def batlogger2guano(fname):
     return g
 
 
-if __name__ == '__main__':
+def main():
     from glob import glob
 
     if len(sys.argv) < 2:
@@ -80,3 +80,7 @@ if __name__ == '__main__':
         print(fname, '...')
         batlogger2guano(fname)
         print()
+
+
+if __name__ == '__main__':
+    main()
@@ -119,7 +119,7 @@ def d500x2guano(fname):
     gfile.write()
 
 
-if __name__ == '__main__':
+def main():
     from glob import glob
 
     if len(sys.argv) < 2:
@@ -133,3 +133,7 @@ if __name__ == '__main__':
 
     for fname in fnames:
         d500x2guano(fname)
+
+
+if __name__ == '__main__':
+    main()
@@ -24,7 +24,7 @@ import guano
 def get_species(fname):
     """Get the species label from a GUANO file, or `None`. Prefer `Manual ID` over 'Auto ID'."""
     try:
-        f = guano.GuanoFile(fname)
+        f = guano.GuanoFile(fname, fields=['Species Manual ID', 'Species Auto ID'])
     except ValueError:
         return None
 
@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+"""
+guano_activity.py - Report bat activity as passes per species, per night, per site.
+
+Each recording is one pass. Recordings are bucketed by "night", from noon to noon in the
+recording's own local time (from its `Timestamp`), so that a night's activity isn't split
+at midnight; the night is named by the date on which it began. Passes are grouped by
+species (the first of `Species Manual ID` or `Species Auto ID` present, or the fields
+specified with `--species`) and optionally by a site field (`--site`), and both the number
+of passes and their total `Length` are reported.
+
+Only each file's `guan` subchunk is read, and files are read concurrently. Each file's
+contribution is cached in a `.guano_activity.jsonl` file (in the first directory specified,
+or the file specified with `--cache`), so re-running only reads new or changed files, and
+the aggregates are updated rather than recomputed.
+
+The report is printed as tab-separated columns, or as JSON (`--json`).
+
+usage::
+
+    $> guano_activity.py [--site FIELD] [--species FIELD]... [--json] [--jobs N] PATH...
+
+    # passes per species per night at each NABat grid cell
+    $> guano_activity.py --site "NABat|Grid Cell ID" ~/bat_calls/
+"""
+
+from __future__ import print_function
+
+import json
+import os
+import os.path
+import sys
+from datetime import datetime, timedelta
+
+import guano
+from guano import GuanoFile
+
+
+ACTIVITY_CACHE_FILENAME = '.guano_activity.jsonl'
+DEFAULT_SPECIES_KEYS = 'Species Manual ID', 'Species Auto ID'
+
+
+def night_of(timestamp: datetime) -> str:
+    """
+    Get the night of a timestamp, as the ISO date on which its noon-to-noon period began. A
+    timezone-aware timestamp is bucketed by its own local time, not converted to ours.
+    """
+    return (timestamp - timedelta(hours=12)).date().isoformat()
+
+
+class Activity(object):
+    """
+    Aggregate counts of passes and their total length by site, night, and species, which are
+    updated incrementally as files are added, changed, or removed.
+
+    :ivar dict files:  absolute file path -> the file's entry, a dict with keys `size`,
+                       `mtime`, `site`, `night`, `species`, and `length`
+    :ivar dict totals:  (site, night, species) -> [passes, total length]
+    """
+
+    def __init__(self, species_keys=DEFAULT_SPECIES_KEYS, site_key: str = None, strict=False):
+        self.species_keys = tuple(species_keys)
+        self.site_key = site_key
+        self.strict = strict
+        self.files = {}
+        self.totals = {}
+
+    @property
+    def grouping(self) -> str:
+        """Description of our grouping fields, which cached entries must match to be reused"""
+        return '%s / %s' % (self.site_key or '', ', '.join(self.species_keys))
+
+    def summarize(self, metadata) -> dict:
+        """
+        Extract just the fields which we aggregate from GUANO metadata.
+
+        :param metadata:  GUANO metadata string or bytes
+        :return:  dict with keys `site`, `night` (`None` if there's no `Timestamp`), `species`, and `length`
+        """
+        coerce = GuanoFile(strict=self.strict)._coerce
+        wanted = set(self.species_keys) | {'Timestamp', 'Length', self.site_key}
+        fields = {}
+        for namespace, key, full_key, val in guano.iter_fields(metadata):
+            if full_key in wanted and full_key not in fields:
+                fields[full_key] = val
+        timestamp = coerce('Timestamp', fields['Timestamp']) if fields.get('Timestamp') else None
+        length = coerce('Length', fields['Length']) if fields.get('Length') else 0.0
+        return {
+            'site': fields.get(self.site_key, '') if self.site_key else '',
+            'night': night_of(timestamp) if isinstance(timestamp, datetime) else None,
+            'species': next((fields[key] for key in self.species_keys if fields.get(key)), ''),
+            'length': length if isinstance(length, float) else 0.0,
+        }
+
+    def add(self, path: str, entry: dict):
+        """Add (or replace) a file's contribution to our totals"""
+        path = os.path.abspath(path)
+        self.remove(path)
+        self.files[path] = entry
+        if entry['night'] is not None:
+            total = self.totals.setdefault((entry['site'], entry['night'], entry['species']), [0, 0.0])
+            total[0] += 1
+            total[1] += entry['length']
+
+    def remove(self, path: str):
+        """Remove a file's contribution to our totals, if it has one"""
+        entry = self.files.pop(os.path.abspath(path), None)
+        if entry is None or entry['night'] is None:
+            return
+        group = entry['site'], entry['night'], entry['species']
+        total = self.totals[group]
+        total[0] -= 1
+        total[1] -= entry['length']
+        if not total[0]:
+            del self.totals[group]
+
+    def update(self, paths, index: dict = None, workers=None) -> int:
+        """
+        Add new and changed files to our totals, reading only their GUANO metadata, and remove
+        files which no longer exist.
+
+        :param paths:  a file or directory path, or an iterable of them; directories are searched recursively
+        :param dict index:  a metadata index (see :func:`guano.read_indexes`) to use for unchanged files
+        :param int workers:  number of concurrent worker threads
+        :return:  number of files which were added or changed
+        """
+        def read(fname):
+            try:
+                return self.summarize(guano.read_guano_chunk(fname, index=index))
+            except (ValueError, EnvironmentError) as e:
+                print('Failed reading %s: %s' % (fname, e), file=sys.stderr)
+
+        changed = 0
+        for path, entry, updated in guano.update_cache(self.files, paths, read, workers):
+            if updated:
+                if entry is None:
+                    self.remove(path)
+                else:
+                    self.add(path, entry)
+                changed += 1
+        return changed
+
+    def rows(self) -> list:
+        """Get our totals as a sorted list of (site, night, species, passes, total length)"""
+        return sorted((site, night, species, passes, length)
+                      for (site, night, species), (passes, length) in self.totals.items())
+
+    def load(self, fname: str):
+        """Load the file entries cached by :meth:`save`, for the same grouping fields as ours"""
+        for path, entry in guano.read_cache(fname, grouping=self.grouping).items():
+            self.add(path, dict((k, entry[k]) for k in ('size', 'mtime', 'site', 'night', 'species', 'length')))
+
+    def save(self, fname: str):
+        """Cache our file entries, along with our grouping fields (see :func:`guano.write_cache`)"""
+        guano.write_cache(fname, self.files, grouping=self.grouping)
+
+def main():
+    """Commandline interface"""
+    import argparse
+    parser = argparse.ArgumentParser(description='Report passes per species, per night, per site')
+    parser.add_argument('--site', metavar='FIELD', help='field identifying the site, like "NABat|Grid Cell ID"')
+    parser.add_argument('--species', metavar='FIELD', action='append',
+                        help='species field, using the first present if repeated (default: %s)' %
+                             ', '.join(DEFAULT_SPECIES_KEYS))
+    parser.add_argument('-i', '--index', help='metadata index file to use')
+    parser.add_argument('--cache', help='activity cache file (default: FIRSTDIR/%s)' % ACTIVITY_CACHE_FILENAME)
+    parser.add_argument('--no-cache', action='store_true', help="don't read or write an activity cache file")
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    parser.add_argument('-j', '--jobs', type=int, help='number of concurrent workers')
+    parser.add_argument('--strict', action='store_true', help='fail on values which cannot be coerced')
+    parser.add_argument('paths', nargs='+', metavar='PATH')
+    args = parser.parse_args()
+
+    activity = Activity(args.species or DEFAULT_SPECIES_KEYS, args.site, strict=args.strict)
+    dirs = [path for path in args.paths if os.path.isdir(path)]
+    cache_fname = args.cache
+    if not cache_fname and not args.no_cache and dirs:
+        cache_fname = os.path.join(dirs[0], ACTIVITY_CACHE_FILENAME)
+    if cache_fname:
+        activity.load(cache_fname)
+
+    index = guano.read_indexes(args.paths, args.index)
+    if activity.update(args.paths, index=index, workers=args.jobs) and cache_fname:
+        activity.save(cache_fname)
+
+    rows = activity.rows()
+    if args.json:
+        keys = 'site', 'night', 'species', 'passes', 'length'
+        print(json.dumps([dict(zip(keys, row)) for row in rows], indent=2, ensure_ascii=False))
+        return
+    print('site\tnight\tspecies\tpasses\tlength')
+    for site, night, species, passes, length in rows:
+        print('%s\t%s\t%s\t%d\t%.1f' % (site, night, species, passes, length))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+"""
+guano_compact.py - Embed sidecar metadata files into their .WAV files.
+
+Metadata saved to sidecar files (like `file.wav.guano`, as written by
+`guano_edit.py --sidecar`) is merged into each .WAV file's embedded GUANO
+metadata, and the sidecar file is then removed.
+
+usage::
+
+    $> guano_compact.py [--backup] [--dry-run] [--durability none|per-file] [--jobs N] PATH...
+"""
+
+from __future__ import print_function
+
+import os
+import os.path
+import sys
+
+import guano
+from guano import GuanoFile
+
+
+def compact(fname: str, make_backup=False, dry_run=False, durability=None) -> bool:
+    """
+    Embed a .WAV file's sidecar metadata into the file itself, then remove the sidecar.
+    With a `per-file` `durability` policy (see :class:`guano.Durability`), the .WAV file is
+    flushed to stable storage before its sidecar is removed.
+
+    :return:  whether the file had a sidecar to embed
+    """
+    sidecar = guano.sidecar_filename(fname)
+    if not os.path.isfile(sidecar):
+        return False
+    gfile = GuanoFile(fname, sidecar=True)
+    gfile.sidecar = False
+    if not dry_run:
+        gfile.write(make_backup=make_backup, durability=durability)
+        os.remove(sidecar)
+    return True
+
+
+def main():
+    """Commandline interface"""
+    import argparse
+    parser = argparse.ArgumentParser(description='Embed sidecar metadata files into their .WAV files')
+    parser.add_argument('--backup', action='store_true', help='back up .WAV files before rewriting them')
+    parser.add_argument('--dry-run', action='store_true', help="report files with sidecars, but don't change them")
+    parser.add_argument('--durability', choices=('none', 'per-file'), default='none',
+                        help='whether to fsync each rewritten file before removing its sidecar (default: none)')
+    parser.add_argument('-j', '--jobs', type=int, help='number of concurrent workers')
+    parser.add_argument('paths', nargs='+', metavar='PATH')
+    args = parser.parse_args()
+
+    def run(fname):
+        try:
+            return fname, compact(fname, make_backup=args.backup, dry_run=args.dry_run, durability=durability)
+        except (ValueError, EnvironmentError) as e:
+            print('Failed compacting %s: %s' % (fname, e), file=sys.stderr)
+            return fname, False
+
+    with guano.Durability(args.durability) as durability:
+        for fname, compacted in guano._parallel_map(run, guano.iter_wav_paths(args.paths), args.jobs):
+            if compacted:
+                print(fname)
+
+
+if __name__ == '__main__':
+    main()
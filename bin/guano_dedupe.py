@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+"""
+guano_dedupe.py - Find recordings with identical audio data, even if their metadata differs.
+
+Only each file's audio data (its `data` subchunk) is hashed, so copies of a recording which
+have been renamed, re-tagged, or re-converted are still recognized as duplicates. The audio
+is streamed in blocks rather than read into memory, and files are hashed concurrently.
+
+Digests are cached in a `.guano_hashes.jsonl` file (in the first directory specified, or
+the file specified with `--cache`), keyed by each file's size and modification time, so that
+re-running only hashes new or changed files.
+
+Each group of duplicates is printed as its paths, separated by a blank line. With `--link`,
+duplicates whose entire contents are identical (not just their audio) are replaced with
+hard links to the first file of their group; duplicates with differing metadata are never
+replaced, so no metadata is lost.
+
+usage::
+
+    $> guano_dedupe.py [--link] [--cache CACHEFILE] [--jobs N] PATH...
+"""
+
+from __future__ import print_function
+
+import filecmp
+import os
+import os.path
+import sys
+
+import guano
+from guano import GuanoFile
+
+
+HASH_CACHE_FILENAME = '.guano_hashes.jsonl'
+ALGORITHM = 'sha256'
+
+
+def hash_file(fname: str) -> str:
+    """Compute the digest of a .WAV file's audio data"""
+    return GuanoFile(fname, fields=()).audio_digest(ALGORITHM)  # don't bother parsing metadata
+
+
+def digests(paths, cache_fname=None, workers=None) -> dict:
+    """
+    Get the audio digests of many .WAV files, hashing only those not already in the cache.
+
+    :param paths:  a file or directory path, or an iterable of them; directories are searched recursively
+    :param str cache_fname:  digest cache file to use and update, or `None` for no caching
+    :param int workers:  number of concurrent worker threads
+    :return:  mapping of file path to hex digest
+    """
+    cache = guano.read_cache(cache_fname, algorithm=ALGORITHM) if cache_fname else {}
+
+    def digest(fname):
+        try:
+            return {'digest': hash_file(fname)}
+        except (ValueError, EnvironmentError) as e:
+            print('Failed hashing %s: %s' % (fname, e), file=sys.stderr)
+
+    results, changed = {}, False
+    for fname, entry, updated in guano.update_cache(cache, paths, digest, workers):
+        if updated:
+            changed = True
+            if entry is None:
+                del cache[fname]
+                continue
+            cache[os.path.abspath(fname)] = entry
+        if entry is not None:
+            results[fname] = entry['digest']
+    if cache_fname and changed:
+        guano.write_cache(cache_fname, cache, algorithm=ALGORITHM)
+    return results
+
+
+def duplicate_groups(digests: dict) -> list:
+    """Group file paths by digest, producing only groups of two or more files, in path order"""
+    groups = {}
+    for fname, digest in digests.items():
+        groups.setdefault(digest, []).append(fname)
+    return sorted(sorted(group) for group in groups.values() if len(group) > 1)
+
+
+def link_duplicates(group: list) -> list:
+    """
+    Replace the files of a duplicate group which are entirely identical to the first file with
+    hard links to it.
+
+    :return:  list of the paths which were replaced
+    """
+    first, linked = group[0], []
+    for fname in group[1:]:
+        if os.path.samefile(first, fname) or not filecmp.cmp(first, fname, shallow=False):
+            continue
+        tmp = os.path.join(os.path.dirname(fname), '.%s.guano_link' % os.path.basename(fname))
+        try:
+            os.link(first, tmp)
+            os.replace(tmp, fname)
+        except OSError as e:
+            print('Failed linking %s: %s' % (fname, e), file=sys.stderr)
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            continue
+        linked.append(fname)
+    return linked
+
+
+def main():
+    """Commandline interface"""
+    import argparse
+    parser = argparse.ArgumentParser(description='Find recordings with identical audio data')
+    parser.add_argument('--link', action='store_true',
+                        help='replace duplicates which are entirely identical with hard links')
+    parser.add_argument('--cache', help='digest cache file (default: FIRSTDIR/%s)' % HASH_CACHE_FILENAME)
+    parser.add_argument('--no-cache', action='store_true', help="don't read or write a digest cache file")
+    parser.add_argument('-j', '--jobs', type=int, help='number of concurrent workers')
+    parser.add_argument('paths', nargs='+', metavar='PATH')
+    args = parser.parse_args()
+
+    cache_fname = args.cache
+    if not cache_fname and not args.no_cache:
+        dirs = [path for path in args.paths if os.path.isdir(path)]
+        cache_fname = os.path.join(dirs[0], HASH_CACHE_FILENAME) if dirs else None
+
+    for i, group in enumerate(duplicate_groups(digests(args.paths, cache_fname, args.jobs))):
+        if i:
+            print()
+        linked = link_duplicates(group) if args.link else []
+        for fname in group:
+            print('%s%s' % (fname, '\t(linked)' if fname in linked else ''))
+
+
+if __name__ == '__main__':
+    main()
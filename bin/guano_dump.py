@@ -4,7 +4,11 @@ Print the GUANO metadata found in a file or files.
 
 usage::
 
-    $> guano_dump.py [--strict] WAVFILE...
+    $> guano_dump.py [--strict] [--sidecar] WAVFILE...
+
+With `--sidecar`, metadata from any sidecar files (like `file.wav.guano`) is included.
+
+The .WAV files within zip and tar archives are dumped without extracting them.
 """
 
 from __future__ import print_function
@@ -13,23 +17,35 @@ import sys
 import os
 import os.path
 
+import guano
 from guano import GuanoFile
 
 
-def dump(fname, strict=False):
+ARCHIVE_EXTS = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+
+
+def dump(fname, strict=False, sidecar=False):
     print()
     print(fname)
-    gfile = GuanoFile(fname, strict=strict)
+    gfile = GuanoFile(fname, strict=strict, sidecar=sidecar)
     print(gfile.to_string())
 
 
-if __name__ == '__main__':
+def dump_archive(fname, strict=False):
+    for gfile in guano.scan_archive(fname, strict=strict):
+        print()
+        print(gfile.filename)
+        print(gfile.to_string())
+
+
+def main():
+    """Commandline interface"""
     from glob import glob
     import logging
     logging.basicConfig(level=logging.DEBUG, format='%(asctime)s\t%(levelname)s\t%(message)s')
 
     if len(sys.argv) < 2:
-        print('usage: %s [--strict] FILE...' % os.path.basename(sys.argv[0]), file=sys.stderr)
+        print('usage: %s [--strict] [--sidecar] FILE...' % os.path.basename(sys.argv[0]), file=sys.stderr)
         sys.exit(2)
 
     if os.name == 'nt' and '*' in sys.argv[1]:
@@ -42,9 +58,20 @@ if __name__ == '__main__':
         fnames.remove('--strict')
         strict = True
 
+    sidecar = False
+    if '--sidecar' in fnames:
+        fnames.remove('--sidecar')
+        sidecar = True
+
     for fname in fnames:
         if os.path.isdir(fname):
             for subfname in glob(os.path.join(fname, '*.[Ww][Aa][Vv]')):
-                dump(subfname, strict=strict)
+                dump(subfname, strict=strict, sidecar=sidecar)
+        elif fname.lower().endswith(ARCHIVE_EXTS):
+            dump_archive(fname, strict=strict)
         else:
-            dump(fname, strict=strict)
+            dump(fname, strict=strict, sidecar=sidecar)
+
+
+if __name__ == '__main__':
+    main()
@@ -12,6 +12,20 @@ if using value templates! Study the examples below.
 Add the `--dry-run` argument and no changes will be saved, but you'll be
 able to review the proposed metadata changes on stdout.
 
+Add the `--sidecar` argument to save changes to sidecar files (like
+`file.wav.guano`) rather than rewriting the .WAV files themselves. Existing
+sidecar metadata is then also used for value templates. Use `guano_compact.py`
+to later embed sidecar metadata into the .WAV files.
+
+Add the `--checksum=ALGORITHM` argument (like `crc32` or `sha256`) to also record
+a checksum of each file's audio data in its `Checksum|Data` field, which can later
+be checked with `guano_verify.py`. The audio is hashed as the file is rewritten.
+
+Add the `--durability=POLICY` argument to flush rewritten files to stable storage:
+`per-file` (safest, but slowest) fsyncs each file and its directory as it's
+written, while `group` also fsyncs each file, and batches only the directory
+fsyncs, once per 100 files. The default, `none`, leaves it to the operating system.
+
 
 Examples::
 
@@ -46,27 +60,27 @@ class GuanoTemplate(Template):
     idpattern = r'[_a-z][_a-z0-9| ]*'  # added support for spaces and pipe char
 
 
-def locate_files(rootdir):
+def locate_files(rootdir, sidecar=False):
     """Find files with GUANO metadata"""
     if os.path.isdir(rootdir):
         for root, dirnames, filenames in os.walk(rootdir):
             for filename in filenames:
                 if filename.endswith('.wav') or filename.endswith('.WAV'):
                     try:
-                        yield guano.GuanoFile(os.path.join(root, filename))
+                        yield guano.GuanoFile(os.path.join(root, filename), sidecar=sidecar)
                     except ValueError as e:
                         pass  # no guano metadata
     elif os.path.isfile(rootdir):
         filename = rootdir
         try:
-            yield guano.GuanoFile(filename)
+            yield guano.GuanoFile(filename, sidecar=sidecar)
         except ValueError as e:
             pass
     else:
         raise RuntimeError(rootdir)
 
 
-def update(gfile, md, dry_run=False):
+def update(gfile, md, dry_run=False, checksum=None, durability=None):
     """Update the GUANO metadata in a specified file"""
     print()
     print(gfile.filename)
@@ -78,7 +92,7 @@ def update(gfile, md, dry_run=False):
 
     print(gfile.to_string())
     if not dry_run:
-        gfile.write(make_backup=MAKE_BACKUPS)
+        gfile.write(make_backup=MAKE_BACKUPS, checksum=checksum, durability=durability)
 
 
 def main():
@@ -86,10 +100,23 @@ def main():
     md = {}      # new metadata values
     inputs = []  # files and folders we're operating on
     dry_run = False
+    sidecar = False
+    checksum = None
+    policy = 'none'
 
     for arg in sys.argv[1:]:
         if arg == '--dry-run':
             dry_run = True
+        elif arg == '--sidecar':
+            sidecar = True
+        elif arg.startswith('--checksum='):
+            checksum = arg.split('=', 1)[1]
+        elif arg.startswith('--durability='):
+            policy = arg.split('=', 1)[1]
+            if policy not in guano.Durability.POLICIES:
+                print('%s: error: invalid --durability %r (choose from %s)'
+                      % (os.path.basename(sys.argv[0]), policy, ', '.join(guano.Durability.POLICIES)), file=sys.stderr)
+                sys.exit(2)
         elif ':' in arg:
             k, v = (x.strip() for x in arg.split(':', 1))
             md[k] = v
@@ -98,9 +125,10 @@ def main():
 
     print(md)
 
-    for input in inputs:
-        for gfile in locate_files(input):
-            update(gfile, md, dry_run=dry_run)
+    with guano.Durability(policy) as durability:
+        for input in inputs:
+            for gfile in locate_files(input, sidecar=sidecar):
+                update(gfile, md, dry_run=dry_run, checksum=checksum, durability=durability)
 
 
 if __name__ == '__main__':
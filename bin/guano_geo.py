@@ -0,0 +1,282 @@
+#!/usr/bin/env python
+"""
+guano_geo.py - Find recordings by location: within a bounding box, within a radius, or nearest a point.
+
+Recordings are located by their `Loc Position` field. Their positions are kept in a spatial
+index, a grid of cells (0.1 degree by default) keyed by cell, so that a query only examines
+the recordings in nearby cells rather than every file. The index is saved as
+`.guano_geo.jsonl` (in the first directory specified, or the file specified with `--cache`),
+so re-running only reads new or changed files.
+
+Matching file paths are printed one per line (with their distance in km, for radius and
+nearest queries), or as a GeoJSON FeatureCollection of points with `--geojson`.
+
+usage::
+
+    $> guano_geo.py (--bbox LAT1,LON1,LAT2,LON2 | --radius LAT,LON,KM | --nearest LAT,LON[,N])
+                    [--geojson] [--jobs N] PATH...
+
+    # recordings within 5 km of a roost
+    $> guano_geo.py --radius 41.7,-121.5,5 ~/bat_calls/
+"""
+
+from __future__ import print_function
+
+import json
+import math
+import os
+import os.path
+import sys
+
+import guano
+from guano import GuanoFile
+
+
+GEO_CACHE_FILENAME = '.guano_geo.jsonl'
+DEFAULT_CELL_SIZE = 0.1  # degrees
+EARTH_RADIUS = 6371.0088  # km, mean radius
+KM_PER_DEGREE = math.pi * EARTH_RADIUS / 180
+
+
+def distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance in km between two WGS84 positions, by the haversine formula"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = math.sin((phi2 - phi1) / 2) ** 2 + \
+        math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _parse_numbers(value: str, counts, name: str) -> list:
+    try:
+        numbers = [float(v) for v in value.replace(',', ' ').split()]
+    except ValueError:
+        numbers = []
+    if len(numbers) not in counts:
+        raise ValueError('Expected %s but found "%s"' % (name, value))
+    return numbers
+
+
+class SpatialIndex(object):
+    """
+    A grid index of the positions of recordings, supporting bounding box, radius, and nearest
+    queries which examine only the grid cells near the query.
+
+    :ivar dict files:  absolute file path -> the file's entry, a dict with keys `size`,
+                       `mtime`, and `position` (a (lat, lon) tuple, or `None`)
+    """
+
+    def __init__(self, cell_size: float = DEFAULT_CELL_SIZE, strict=False):
+        if not 0 < cell_size <= 90:
+            raise ValueError('Expected cell size between 0 and 90 degrees')
+        self.cell_size = cell_size
+        self.strict = strict
+        self.files = {}
+        self._cells = {}  # (row, col) -> {path: (lat, lon)}
+
+    def __len__(self) -> int:
+        return len(self.files)
+
+    def _cell(self, lat: float, lon: float) -> tuple:
+        return int(math.floor(lat / self.cell_size)), int(math.floor(lon / self.cell_size))
+
+    def add(self, path: str, entry: dict):
+        """Add (or replace) a file's entry"""
+        path = os.path.abspath(path)
+        self.remove(path)
+        self.files[path] = entry
+        if entry['position'] is not None:
+            self._cells.setdefault(self._cell(*entry['position']), {})[path] = entry['position']
+
+    def remove(self, path: str):
+        """Remove a file's entry, if it has one"""
+        entry = self.files.pop(os.path.abspath(path), None)
+        if entry is None or entry['position'] is None:
+            return
+        cell = self._cell(*entry['position'])
+        del self._cells[cell][os.path.abspath(path)]
+        if not self._cells[cell]:
+            del self._cells[cell]
+
+    def position_of(self, metadata) -> tuple:
+        """Get the (lat, lon) `Loc Position` from GUANO metadata, or `None`"""
+        for namespace, key, full_key, val in guano.iter_fields(metadata):
+            if full_key == 'Loc Position':
+                position = GuanoFile(strict=self.strict)._coerce(full_key, val)
+                if isinstance(position, tuple) and len(position) == 2 \
+                        and -90 <= position[0] <= 90 and -180 <= position[1] <= 180:
+                    return position
+                return None
+        return None
+
+    def update(self, paths, index: dict = None, workers=None) -> int:
+        """
+        Add new and changed files, reading only their GUANO metadata, and remove files which no
+        longer exist.
+
+        :param paths:  a file or directory path, or an iterable of them; directories are searched recursively
+        :param dict index:  a metadata index (see :func:`guano.read_indexes`) to use for unchanged files
+        :param int workers:  number of concurrent worker threads
+        :return:  number of files which were added, changed, or removed
+        """
+        def read(fname):
+            try:
+                return {'position': self.position_of(guano.read_guano_chunk(fname, index=index))}
+            except (ValueError, EnvironmentError) as e:
+                print('Failed reading %s: %s' % (fname, e), file=sys.stderr)
+
+        changed = 0
+        for path, entry, updated in guano.update_cache(self.files, paths, read, workers):
+            if updated:
+                if entry is None:
+                    self.remove(path)
+                else:
+                    self.add(path, entry)
+                changed += 1
+        return changed
+
+    def _iter_cells(self, lat1: float, lon1: float, lat2: float, lon2: float):
+        """Iterate over the (path, position) in all cells which intersect a bounding box"""
+        row1, col1 = self._cell(lat1, lon1)
+        row2, col2 = self._cell(lat2, lon2)
+        if (row2 - row1 + 1) * (col2 - col1 + 1) > len(self._cells):
+            # a large box covering more cells than are occupied; check the occupied ones instead
+            cells = (points for (row, col), points in self._cells.items() if row1 <= row <= row2 and col1 <= col <= col2)
+        else:
+            cells = (self._cells.get((row, col)) for row in range(row1, row2 + 1) for col in range(col1, col2 + 1))
+        for points in cells:
+            if points:
+                for item in points.items():
+                    yield item
+
+    def within_bbox(self, lat1: float, lon1: float, lat2: float, lon2: float) -> list:
+        """Find the files within a bounding box, as a sorted list of paths"""
+        lat1, lat2 = min(lat1, lat2), max(lat1, lat2)
+        lon1, lon2 = min(lon1, lon2), max(lon1, lon2)
+        return sorted(path for path, (lat, lon) in self._iter_cells(lat1, lon1, lat2, lon2)
+                      if lat1 <= lat <= lat2 and lon1 <= lon <= lon2)
+
+    def within_radius(self, lat: float, lon: float, km: float) -> list:
+        """Find the files within a distance of a position, as a list of (distance in km, path), nearest first"""
+        dlat = km / KM_PER_DEGREE
+        lat1, lat2 = max(-90.0, lat - dlat), min(90.0, lat + dlat)
+        coslat = min(math.cos(math.radians(lat1)), math.cos(math.radians(lat2)))
+        dlon = km / (KM_PER_DEGREE * coslat) if coslat > 1e-9 else 360.0
+        if dlon >= 180:
+            boxes = [(lat1, -180.0, lat2, 180.0)]
+        else:  # split a box which crosses the antimeridian
+            boxes = [(lat1, max(-180.0, lon - dlon), lat2, min(180.0, lon + dlon))]
+            if lon - dlon < -180:
+                boxes.append((lat1, lon - dlon + 360, lat2, 180.0))
+            if lon + dlon > 180:
+                boxes.append((lat1, -180.0, lat2, lon + dlon - 360))
+        results = []
+        for box in boxes:
+            for path, position in self._iter_cells(*box):
+                d = distance(lat, lon, position[0], position[1])
+                if d <= km:
+                    results.append((d, path))
+        return sorted(results)
+
+    def nearest(self, lat: float, lon: float, n: int = 1) -> list:
+        """Find the `n` files nearest a position, as a list of (distance in km, path), nearest first"""
+        if not self._cells or n < 1:
+            return []
+        # search rings of cells outward until we've seen enough files, then find the true nearest
+        # by searching the radius of the farthest of them, as positions in outer cells may be nearer
+        row, col = self._cell(lat, lon)
+        found, ring = [], 0
+        while len(found) < n:
+            if (2 * ring + 1) ** 2 > len(self._cells):
+                # the rings now cover more cells than are occupied; check every occupied one instead
+                found = [position for points in self._cells.values() for position in points.values()]
+                break
+            for r in range(row - ring, row + ring + 1):
+                step = 1 if abs(r - row) == ring else 2 * ring  # only the cells on the ring's edge
+                for c in range(col - ring, col + ring + 1, step or 1):
+                    found.extend(self._cells.get((r, c), {}).values())
+            ring += 1
+        farthest = sorted(distance(lat, lon, p[0], p[1]) for p in found)[min(n, len(found)) - 1]
+        return self.within_radius(lat, lon, farthest * (1 + 1e-9))[:n]
+
+    def to_geojson(self, paths) -> dict:
+        """
+        Build a GeoJSON FeatureCollection of points for files in the index.
+
+        :param paths:  iterable of paths, or of (distance in km, path) as returned by our queries
+        """
+        features = []
+        for item in paths:
+            dist, path = item if isinstance(item, tuple) else (None, item)
+            lat, lon = self.files[os.path.abspath(path)]['position']
+            properties = {'path': path}
+            if dist is not None:
+                properties['distance_km'] = round(dist, 6)
+            features.append({'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': [lon, lat]},
+                             'properties': properties})
+        return {'type': 'FeatureCollection', 'features': features}
+
+    def load(self, fname: str):
+        """Load the file entries saved by :meth:`save`"""
+        for path, entry in guano.read_cache(fname).items():
+            position = tuple(entry['position']) if entry.get('position') else None
+            self.add(path, {'size': entry['size'], 'mtime': entry['mtime'], 'position': position})
+
+    def save(self, fname: str):
+        """Save our file entries (see :func:`guano.write_cache`)"""
+        guano.write_cache(fname, self.files)
+
+def main():
+    """Commandline interface"""
+    import argparse
+    parser = argparse.ArgumentParser(description='Find recordings by their Loc Position')
+    query = parser.add_mutually_exclusive_group(required=True)
+    query.add_argument('--bbox', metavar='LAT1,LON1,LAT2,LON2', help='find recordings within a bounding box')
+    query.add_argument('--radius', metavar='LAT,LON,KM', help='find recordings within a distance of a position')
+    query.add_argument('--nearest', metavar='LAT,LON[,N]', help='find the N (default: 1) recordings nearest a position')
+    parser.add_argument('--geojson', action='store_true', help='print the results as GeoJSON')
+    parser.add_argument('-i', '--index', help='metadata index file to use')
+    parser.add_argument('--cache', help='spatial index file (default: FIRSTDIR/%s)' % GEO_CACHE_FILENAME)
+    parser.add_argument('--no-cache', action='store_true', help="don't read or write a spatial index file")
+    parser.add_argument('-j', '--jobs', type=int, help='number of concurrent workers')
+    parser.add_argument('--strict', action='store_true', help='fail on values which cannot be coerced')
+    parser.add_argument('paths', nargs='+', metavar='PATH')
+    args = parser.parse_args()
+
+    try:
+        if args.bbox:
+            bbox = _parse_numbers(args.bbox, (4,), 'bounding box LAT1,LON1,LAT2,LON2')
+        elif args.radius:
+            radius = _parse_numbers(args.radius, (3,), 'LAT,LON,KM')
+        else:
+            nearest = _parse_numbers(args.nearest, (2, 3), 'LAT,LON[,N]')
+    except ValueError as e:
+        parser.error(str(e))
+
+    spatial = SpatialIndex(strict=args.strict)
+    dirs = [path for path in args.paths if os.path.isdir(path)]
+    cache_fname = args.cache
+    if not cache_fname and not args.no_cache and dirs:
+        cache_fname = os.path.join(dirs[0], GEO_CACHE_FILENAME)
+    if cache_fname:
+        spatial.load(cache_fname)
+
+    index = guano.read_indexes(args.paths, args.index)
+    if spatial.update(args.paths, index=index, workers=args.jobs) and cache_fname:
+        spatial.save(cache_fname)
+
+    if args.bbox:
+        results = spatial.within_bbox(*bbox)
+    elif args.radius:
+        results = spatial.within_radius(*radius)
+    else:
+        results = spatial.nearest(nearest[0], nearest[1], int(nearest[2]) if len(nearest) > 2 else 1)
+
+    if args.geojson:
+        print(json.dumps(spatial.to_geojson(results), indent=2, ensure_ascii=False))
+        return
+    for item in results:
+        print('%s\t%.3f' % (item[1], item[0]) if isinstance(item, tuple) else item)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+"""
+guano_index.py - Build an index of the GUANO metadata of every .WAV file under a directory.
+
+The index is written as `.guano_index.jsonl` in the root directory (or to the file
+specified with `--output`), and is used by other tools like `guano_query.py` to
+avoid re-reading files which haven't changed since they were indexed.
+
+usage::
+
+    $> guano_index.py [--output INDEXFILE] [--jobs N] ROOTDIR
+"""
+
+from __future__ import print_function
+
+import os.path
+
+import guano
+
+
+def build_index(rootdir, index_fname=None, strict=False, workers=None):
+    """
+    Index the GUANO metadata of all .WAV files under a directory.
+
+    :param str rootdir:  the root directory where we search for GUANO files
+    :param str index_fname:  optional index file path (default: `.guano_index.jsonl` in `rootdir`)
+    :return:  tuple of (index file path, number of files indexed)
+    """
+    index_fname = index_fname or os.path.join(rootdir, guano.INDEX_FILENAME)
+    count = guano.write_index(index_fname, guano.scan(rootdir, strict=strict, workers=workers))
+    return index_fname, count
+
+
+def main():
+    """Commandline interface"""
+    import argparse
+    parser = argparse.ArgumentParser(description='Index the GUANO metadata of all files under a directory')
+    parser.add_argument('-o', '--output', help='index file to write (default: ROOTDIR/%s)' % guano.INDEX_FILENAME)
+    parser.add_argument('-j', '--jobs', type=int, help='number of concurrent workers')
+    parser.add_argument('--strict', action='store_true', help='skip files with values which cannot be coerced')
+    parser.add_argument('rootdir')
+    args = parser.parse_args()
+    index_fname, count = build_index(args.rootdir, args.output, strict=args.strict, workers=args.jobs)
+    print('Indexed %d files to %s' % (count, index_fname))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+"""
+guano_query.py - Find files whose GUANO metadata matches some conditions.
+
+Conditions are specified as `FIELD OPERATOR VALUE`, where the operator is one of
+`=`, `!=`, `<`, `<=`, `>`, `>=`, `~` (regular expression search), or `within`
+(a `Loc Position` bounding box of `LAT1,LON1,LAT2,LON2`). Values are coerced to the
+field's data type before comparing, so timestamps and numbers compare correctly.
+A file only matches if it has every field mentioned and satisfies every condition.
+
+Matching file paths are printed one per line as soon as they're found, so they may be
+piped into other tools like `guano_edit.py` or `disperse.py`.
+
+Examples::
+
+    # All Little Brown Bat recordings from April 2017 within a bounding box
+    $> guano_query.py -w "Species Manual ID = Mylu" \\
+                      -w "Timestamp >= 2017-04-01T00:00:00" -w "Timestamp < 2017-05-01T00:00:00" \\
+                      -w "Loc Position within 41.5,-121.6,41.9,-121.4"  ~/bat_calls/
+
+    # Tag every matching file
+    $> guano_query.py -0 -w "Species Auto ID = Epfu" ~/bat_calls/ | xargs -0 guano_edit.py "Note: Auto-ID'd"
+"""
+
+from __future__ import print_function
+
+import re
+import sys
+from datetime import datetime
+from typing import Iterable, List, Optional
+
+import guano
+from guano import GuanoFile
+
+
+OPERATORS = '!=', '<=', '>=', '=', '<', '>', '~', 'within'
+
+_EXPR_RE = re.compile(r'^\s*(.+?)\s*(!=|<=|>=|=|<|>|~|\swithin\s)\s*(.*?)\s*$')
+
+
+class Predicate(object):
+    """
+    A single typed condition on a GUANO field, like `Timestamp >= 2017-04-01T00:00:00`.
+
+    Calling a `Predicate` with a (coerced) field value returns whether the condition holds.
+    """
+
+    def __init__(self, key: str, op: str, operand: str, strict=False):
+        if op not in OPERATORS:
+            raise ValueError('Unknown operator "%s"' % op)
+        self.key = key
+        self.op = op
+        if op == '~':
+            self.operand = re.compile(operand)
+        elif op == 'within':
+            try:
+                lat1, lon1, lat2, lon2 = (float(v) for v in operand.replace(',', ' ').split())
+            except ValueError:
+                raise ValueError('Expected bounding box LAT1,LON1,LAT2,LON2 but found "%s"' % operand)
+            self.operand = min(lat1, lat2), min(lon1, lon2), max(lat1, lat2), max(lon1, lon2)
+        else:
+            self.operand = GuanoFile(strict=strict)._coerce(key, operand)
+
+    @classmethod
+    def parse(cls, expr: str, strict=False) -> 'Predicate':
+        """Parse a condition expression of the form `FIELD OPERATOR VALUE`"""
+        m = _EXPR_RE.match(expr)
+        if not m:
+            raise ValueError('Expected condition of the form "FIELD OPERATOR VALUE" but found "%s"' % expr)
+        key, op, operand = m.groups()
+        return cls(key, op.strip(), operand, strict=strict)
+
+    def __call__(self, value) -> bool:
+        op, operand = self.op, self.operand
+        if op == '~':
+            return bool(operand.search(str(value)))
+        if op == 'within':
+            try:
+                lat, lon = value[0], value[1]
+                return operand[0] <= lat <= operand[2] and operand[1] <= lon <= operand[3]
+            except (TypeError, IndexError):
+                return False
+        if isinstance(value, datetime) and isinstance(operand, datetime) \
+                and (value.tzinfo is None) != (operand.tzinfo is None):
+            # compare naive and timezone-aware timestamps by their "wall clock" local time
+            value, operand = value.replace(tzinfo=None), operand.replace(tzinfo=None)
+        try:
+            if op == '=':
+                return value == operand
+            elif op == '!=':
+                return value != operand
+            elif op == '<':
+                return value < operand
+            elif op == '<=':
+                return value <= operand
+            elif op == '>':
+                return value > operand
+            elif op == '>=':
+                return value >= operand
+        except TypeError:
+            return False  # value couldn't be coerced, so it isn't comparable
+
+    def __repr__(self):
+        return 'Predicate(%r, %r, %r)' % (self.key, self.op, self.operand)
+
+
+def match_metadata(metadata, predicates: List[Predicate], strict=False) -> bool:
+    """
+    Test whether GUANO metadata satisfies all `predicates`.
+
+    Only the fields which are mentioned by a predicate are coerced, and parsing stops as soon as
+    any predicate fails or all of them have been satisfied.
+
+    :param metadata:  GUANO metadata string or bytes
+    :param predicates:  list of :class:`Predicate`
+    :param bool strict:  whether to raise `ValueError` for field values which can't be coerced
+    """
+    coerce = GuanoFile(strict=strict)._coerce
+    by_key = {}
+    for predicate in predicates:
+        by_key.setdefault(predicate.key, []).append(predicate)
+    remaining = set(by_key)
+    if not remaining:
+        return True
+
+    for namespace, key, full_key, val in guano.iter_fields(metadata):
+        if full_key not in by_key:
+            continue
+        value = coerce(full_key, val)
+        for predicate in by_key[full_key]:
+            if not predicate(value):
+                return False
+        remaining.discard(full_key)
+        if not remaining:
+            return True
+    return False  # some field wasn't present at all
+
+
+def query(paths, predicates: List[Predicate], index_fname: Optional[str] = None, strict=False, workers=None) -> Iterable[str]:
+    """
+    Find .WAV files whose GUANO metadata satisfies all `predicates`.
+
+    :param paths:  a file or directory path, or an iterable of them; directories are searched recursively
+    :param predicates:  list of :class:`Predicate`
+    :param str index_fname:  an explicit metadata index to use; by default, an index found in any
+                             of the specified directories is used
+    :param bool strict:  whether to raise `ValueError` for field values which can't be coerced
+    :param int workers:  number of concurrent worker threads
+    :return:  iterable of matching file paths
+    """
+    if isinstance(paths, str):
+        paths = [paths]
+    index = guano.read_indexes(paths, index_fname)
+
+    def match(fname):
+        try:
+            metadata = guano.read_guano_chunk(fname, index=index)
+        except (ValueError, EnvironmentError) as e:
+            guano.log.debug('Skipping %s: %s', fname, e)
+            return None
+        return fname if match_metadata(metadata, predicates, strict=strict) else None
+
+    for fname in guano._parallel_map(match, guano.iter_wav_paths(paths), workers):
+        if fname is not None:
+            yield fname
+
+
+def main():
+    """Commandline interface"""
+    import argparse
+    parser = argparse.ArgumentParser(description='Find files whose GUANO metadata matches some conditions')
+    parser.add_argument('-w', '--where', action='append', default=[], metavar='CONDITION',
+                        help='condition of the form "FIELD OPERATOR VALUE" (may be repeated)')
+    parser.add_argument('-i', '--index', help='metadata index file to use')
+    parser.add_argument('-j', '--jobs', type=int, help='number of concurrent workers')
+    parser.add_argument('-0', '--null', action='store_true', help='separate output paths with NUL rather than newline')
+    parser.add_argument('--strict', action='store_true', help='fail on values which cannot be coerced')
+    parser.add_argument('paths', nargs='+', metavar='PATH')
+    args = parser.parse_args()
+
+    try:
+        predicates = [Predicate.parse(expr, strict=args.strict) for expr in args.where]
+    except (ValueError, re.error) as e:
+        parser.error(str(e))
+
+    end = '\0' if args.null else '\n'
+    try:
+        for fname in query(args.paths, predicates, index_fname=args.index, strict=args.strict, workers=args.jobs):
+            sys.stdout.write(fname + end)
+            sys.stdout.flush()
+    except BrokenPipeError:
+        pass
+
+
+if __name__ == '__main__':
+    main()
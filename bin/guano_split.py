@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+"""
+guano_split.py - Cut long recordings into shorter clips.
+
+Either split each file into consecutive clips of a fixed duration, or extract specific
+time ranges. Times are seconds of real time (accounting for time expansion) from the start
+of the recording.
+
+Only the needed part of each recording's audio data is copied, so this works on very long
+recordings without loading them into memory. Each clip carries over the original file's
+GUANO metadata, with its `Timestamp` shifted to the start of the clip and its `Length`
+recomputed. Clips are named after the original file and their start time.
+
+Examples::
+
+    # Split all-night recordings into 15 second clips
+    $> guano_split.py --duration 15 --output ~/clips/  ~/bat_calls/*.wav
+
+    # Extract two calls from a recording
+    $> guano_split.py --range 12.5 14 --range 31 32.25  ~/bat_calls/long_recording.wav
+"""
+
+from __future__ import print_function
+
+import os
+import os.path
+import sys
+
+import guano
+from guano import GuanoFile
+
+
+def clip_filename(fname: str, start: float, outdir=None) -> str:
+    """Name a clip after its original file and start time, like `recording_0012.500.wav`"""
+    stem, ext = os.path.splitext(os.path.basename(fname))
+    return os.path.join(outdir or os.path.dirname(fname), '%s_%08.3f%s' % (stem, start, ext or '.wav'))
+
+
+def split(fname: str, duration: float = None, ranges=None, outdir=None):
+    """
+    Split a recording into clips of a fixed duration, or extract specific time ranges.
+
+    :param str fname:  the recording to split
+    :param float duration:  length in seconds of each consecutive clip
+    :param ranges:  alternately, a sequence of (start, end) tuples in seconds
+    :param str outdir:  directory where clips are written (default: the recording's directory)
+    :return:  iterable of new :class:`GuanoFile` clips
+    """
+    gfile = GuanoFile(fname)
+    if ranges is None:
+        if not duration or duration <= 0:
+            raise ValueError('Expected a positive clip duration')
+        te = gfile.get('TE', 1)
+        if not isinstance(te, (int, float)) or te <= 0:
+            te = 1
+        length = gfile.wav_params.nframes / float(gfile.wav_params.framerate * te)
+        ranges, start = [], 0.0
+        while start < length:
+            ranges.append((start, min(start + duration, length)))
+            start += duration
+    for start, end in ranges:
+        yield gfile.extract(clip_filename(fname, start, outdir), start, end)
+
+
+def main():
+    """Commandline interface"""
+    import argparse
+    parser = argparse.ArgumentParser(description='Cut recordings into shorter clips')
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument('-d', '--duration', type=float, help='split into consecutive clips of this many seconds')
+    mode.add_argument('-r', '--range', nargs=2, type=float, action='append', metavar=('START', 'END'),
+                      help='extract a time range in seconds (may be repeated)')
+    parser.add_argument('-o', '--output', help='directory where clips are written (default: alongside originals)')
+    parser.add_argument('files', nargs='+', metavar='WAVFILE')
+    args = parser.parse_args()
+
+    if args.output and not os.path.isdir(args.output):
+        os.makedirs(args.output)
+
+    for fname in guano.iter_wav_paths(args.files):
+        try:
+            for clip in split(fname, duration=args.duration, ranges=args.range, outdir=args.output):
+                print(clip.filename)
+        except ValueError as e:
+            print('Failed splitting %s: %s' % (fname, e), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
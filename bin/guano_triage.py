@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+"""
+guano_triage.py - Compute audio statistics for triaging noise files vs. bat passes.
+
+For each .WAV file, the peak level (dBFS), RMS level (dBFS), ratio of clipped samples, and
+the fraction of energy within a frequency band (by default 15-120 kHz, adjusted for time
+expansion) are computed with NumPy, reading the audio data a block at a time. Files are
+processed concurrently.
+
+The results are stored in each file's GUANO metadata under the `Triage` namespace, so that
+later runs skip files whose cached statistics are still current. Requires NumPy.
+
+usage::
+
+    $> guano_triage.py [--band LOW HIGH] [--force] [--dry-run] [--jobs N] PATH...
+"""
+
+from __future__ import print_function
+
+import math
+import sys
+
+import guano
+from guano import GuanoFile
+
+
+NAMESPACE = 'Triage'
+VERSION = '1'  # bump if the calculations change, so that cached statistics are recomputed
+
+DEFAULT_BAND = 15000.0, 120000.0  # Hz
+DEFAULT_BLOCK = 65536  # frames
+
+GuanoFile.register(NAMESPACE, ['Peak', 'RMS', 'Clipping', 'Band Energy'], float, lambda value: '%.4f' % value)
+GuanoFile.register(NAMESPACE, 'Band', lambda value: tuple(float(v) for v in value.split()), lambda value: '%g %g' % value)
+GuanoFile.register(NAMESPACE, 'Data Size', int)
+
+
+def compute_stats(gfile: GuanoFile, band=DEFAULT_BAND, block=DEFAULT_BLOCK) -> dict:
+    """
+    Compute triage statistics for a file's audio data, streaming it a block at a time.
+
+    :param gfile:  a :class:`GuanoFile` with audio data
+    :param band:  tuple of (low, high) frequency in Hz, in real-time frequency
+    :param int block:  number of frames to process at a time
+    :return:  dict of statistics, keyed by their GUANO key within the `Triage` namespace
+    """
+    np = guano._import_numpy()
+    sampwidth = gfile.wav_params.sampwidth
+    full_scale = float(2 ** (8 * sampwidth - 1))
+    clip_level = (full_scale - 1) / full_scale
+    te = gfile.get('TE', 1) or 1
+    freqs = np.fft.rfftfreq(block, 1.0 / gfile.wav_params.framerate) * te
+    in_band = (freqs >= band[0]) & (freqs <= band[1])
+
+    peak, sumsq, clipped, count, band_energy, total_energy = 0.0, 0.0, 0, 0, 0.0, 0.0
+    for frames in gfile.iter_blocks(block):
+        x = frames.astype(np.float64)
+        if sampwidth == 1:
+            x -= 128  # 8-bit .WAV is unsigned
+        x /= full_scale
+        magnitude = np.abs(x)
+        peak = max(peak, float(magnitude.max()))
+        sumsq += float(np.einsum('ij,ij->', x, x))
+        clipped += int(np.count_nonzero(magnitude >= clip_level))
+        count += x.size
+        energy = (np.abs(np.fft.rfft(x, n=block, axis=0)) ** 2).sum(axis=1)
+        band_energy += float(energy[in_band].sum())
+        total_energy += float(energy.sum())
+
+    def dbfs(value):
+        return 20 * math.log10(value) if value > 0 else float('-inf')
+
+    return {
+        'Peak': dbfs(peak),
+        'RMS': dbfs(math.sqrt(sumsq / count)) if count else float('-inf'),
+        'Clipping': clipped / float(count) if count else 0.0,
+        'Band Energy': band_energy / total_energy if total_energy else 0.0,
+        'Band': (float(band[0]), float(band[1])),
+        'Data Size': gfile._wav_data_size,
+        'Version': VERSION,
+    }
+
+
+def is_current(gfile: GuanoFile, band=DEFAULT_BAND) -> bool:
+    """Whether a file's cached triage statistics are still current"""
+    return gfile.get((NAMESPACE, 'Version')) == VERSION \
+        and gfile.get((NAMESPACE, 'Data Size')) == gfile._wav_data_size \
+        and gfile.get((NAMESPACE, 'Band')) == (float(band[0]), float(band[1]))
+
+
+def triage(fname: str, band=DEFAULT_BAND, block=DEFAULT_BLOCK, force=False, dry_run=False, make_backup=False,
+           file_pool=None):
+    """
+    Compute and store the triage statistics of a single file, unless they're already current.
+    The file is read several times, so a :class:`guano.FilePool` saves reopening it.
+
+    :return:  tuple of (dict of statistics, whether they were cached), or `None` if the file is unreadable
+    """
+    try:
+        cached = GuanoFile(fname, namespaces=[NAMESPACE], file_pool=file_pool)  # cheap, no need to read the audio
+        if not force and is_current(cached, band):
+            return dict(cached.items(NAMESPACE)), True
+        gfile = GuanoFile(fname, file_pool=file_pool)
+        stats = compute_stats(gfile, band, block)
+    except (ValueError, EnvironmentError) as e:
+        print('Failed reading %s: %s' % (fname, e), file=sys.stderr)
+        return None
+    for key, value in stats.items():
+        gfile[NAMESPACE, key] = value
+    if not dry_run:
+        gfile.write(make_backup=make_backup)
+    return stats, False
+
+
+def main():
+    """Commandline interface"""
+    import argparse
+    parser = argparse.ArgumentParser(description='Compute and cache audio statistics for triaging recordings')
+    parser.add_argument('--band', nargs=2, type=float, default=DEFAULT_BAND, metavar=('LOW', 'HIGH'),
+                        help='frequency band in Hz for the band energy ratio (default: %g %g)' % DEFAULT_BAND)
+    parser.add_argument('--block', type=int, default=DEFAULT_BLOCK, help='frames per processing block')
+    parser.add_argument('--force', action='store_true', help='recompute even if cached statistics are current')
+    parser.add_argument('--dry-run', action='store_true', help="compute, but don't save statistics to files")
+    parser.add_argument('--backup', action='store_true', help='back up files before saving statistics')
+    parser.add_argument('-j', '--jobs', type=int, help='number of concurrent workers')
+    parser.add_argument('paths', nargs='+', metavar='PATH')
+    args = parser.parse_args()
+    guano._import_numpy()
+
+    pool = guano.FilePool()
+
+    def run(fname):
+        return fname, triage(fname, tuple(args.band), args.block, args.force, args.dry_run, args.backup, pool)
+
+    print('\t'.join(['Path', 'Peak', 'RMS', 'Clipping', 'Band Energy', 'Cached']))
+    with pool:
+        for fname, result in guano._parallel_map(run, guano.iter_wav_paths(args.paths), args.jobs):
+            if result is None:
+                continue
+            stats, cached = result
+            print('%s\t%.1f\t%.1f\t%.4f\t%.4f\t%s' % (fname, stats['Peak'], stats['RMS'], stats['Clipping'],
+                                                      stats['Band Energy'], 'yes' if cached else 'no'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+"""
+guano_validate.py - Audit the GUANO metadata of many files against the specification.
+
+Unlike parsing with `--strict`, which stops at the first bad value, every file is checked
+against every rule: that `GUANO|Version` is present and supported, that well-known fields
+have values of the correct type, that values are within sensible ranges (like `Loc Position`
+within WGS84 bounds, or a positive `Samplerate`), and that no field is repeated. Only each
+file's `guan` subchunk is read, and files are checked concurrently.
+
+The result is an aggregate report of how many files failed each rule, with a sample of the
+failing paths, either as text or as JSON (`--json`). The exit status is 1 if any file failed.
+
+usage::
+
+    $> guano_validate.py [--json] [--samples N] [--jobs N] PATH...
+"""
+
+from __future__ import print_function
+
+import json
+import sys
+from collections import OrderedDict, namedtuple
+from datetime import datetime
+
+import guano
+from guano import GuanoFile
+
+
+SUPPORTED_VERSIONS = '1.0',
+DEFAULT_SAMPLES = 10  # failing paths to keep for each rule
+
+Rule = namedtuple('Rule', 'name description check')
+
+
+def _check_range(key, low=None, high=None):
+    """Build a check that a (coerced) numeric field is within a range, if present"""
+    def check(fields):
+        value = fields.get(key)
+        if not isinstance(value, (int, float)):
+            return True  # missing, or already failed its type rule
+        return (low is None or value >= low) and (high is None or value <= high)
+    return check
+
+
+def _check_position(fields):
+    value = fields.get('Loc Position')
+    if not isinstance(value, tuple):
+        return True
+    return len(value) == 2 and -90 <= value[0] <= 90 and -180 <= value[1] <= 180
+
+
+def _check_timestamp(fields):
+    value = fields.get('Timestamp')
+    if not isinstance(value, datetime):
+        return True
+    return 1980 <= value.year <= datetime.now().year + 1
+
+
+# rules checked against the coerced values of each file's fields (besides the `type` and
+# `duplicate` rules, which are checked while coercing); a check returns whether the file passes
+RULES = [
+    Rule('version-missing', 'GUANO|Version field is missing', lambda fields: 'GUANO|Version' in fields),
+    Rule('version-unsupported', 'GUANO|Version is not a supported version',
+         lambda fields: 'GUANO|Version' not in fields or fields['GUANO|Version'] in SUPPORTED_VERSIONS),
+    Rule('loc-position-range', 'Loc Position is not a latitude and longitude within WGS84 bounds', _check_position),
+    Rule('loc-accuracy-range', 'Loc Accuracy is negative', _check_range('Loc Accuracy', low=0)),
+    Rule('samplerate-range', 'Samplerate is not positive', _check_range('Samplerate', low=1)),
+    Rule('te-range', 'TE (time expansion factor) is less than 1', _check_range('TE', low=1)),
+    Rule('length-range', 'Length is not positive', _check_range('Length', low=0.000001)),
+    Rule('filter-hp-range', 'Filter HP is negative', _check_range('Filter HP', low=0)),
+    Rule('timestamp-range', 'Timestamp is implausibly old or in the future', _check_timestamp),
+]
+
+UNREADABLE = 'unreadable'
+ENCODING = 'encoding'
+DUPLICATE = 'duplicate'
+TYPE = 'type'  # a rule per well-known field, named like `type:Timestamp`
+
+
+def validate_metadata(metadata, registry=None) -> list:
+    """
+    Check GUANO metadata against all our rules.
+
+    :param metadata:  the raw `guan` subchunk bytes, or a string of GUANO metadata
+    :param registry:  the :class:`guano.Registry` of field types (default: :attr:`GuanoFile.registry`)
+    :return:  list of the names of rules which failed
+    """
+    failures = []
+    if isinstance(metadata, bytes):
+        try:
+            metadata = metadata.decode('utf-8')
+        except UnicodeDecodeError:
+            failures.append(ENCODING)
+            metadata = metadata.decode('latin-1')
+
+    gfile = GuanoFile(strict=True, registry=registry)
+    coerce, coercer = gfile._coerce, gfile.registry.coercer
+    fields = {}
+    try:
+        for namespace, key, full_key, val in guano.iter_fields(metadata):
+            if full_key in fields:
+                if DUPLICATE not in failures:
+                    failures.append(DUPLICATE)
+                continue
+            function = coercer(namespace, key)
+            if function is not None:
+                try:
+                    fields[full_key] = coerce(full_key, val, function)
+                except (ValueError, TypeError):
+                    failures.append('%s:%s' % (TYPE, full_key))
+                    fields[full_key] = val
+            else:
+                fields[full_key] = val
+    except ValueError:
+        failures.append(UNREADABLE)  # a malformed line
+        return failures
+
+    for rule in RULES:
+        if not rule.check(fields):
+            failures.append(rule.name)
+    return failures
+
+
+def validate_file(fname: str) -> list:
+    """Check a single .WAV file's GUANO metadata, returning the names of rules which failed"""
+    try:
+        metadata = guano.read_guano_chunk(fname)
+    except (ValueError, EnvironmentError):
+        return [UNREADABLE]
+    return validate_metadata(metadata)
+
+
+def describe(rule_name: str) -> str:
+    """Get the human-readable description of a rule"""
+    if rule_name.startswith(TYPE + ':'):
+        return '%s value has the wrong type' % rule_name[len(TYPE) + 1:]
+    descriptions = {
+        UNREADABLE: 'File is not a valid .WAV, or its metadata is malformed',
+        ENCODING: 'Metadata is not UTF-8 encoded',
+        DUPLICATE: 'A field appears more than once',
+    }
+    descriptions.update((rule.name, rule.description) for rule in RULES)
+    return descriptions.get(rule_name, rule_name)
+
+
+class Report(object):
+    """Aggregate validation results: counts of failures per rule, with a sample of failing paths"""
+
+    def __init__(self, samples: int = DEFAULT_SAMPLES):
+        self.samples = samples
+        self.files = 0
+        self.failed_files = 0
+        self.counts = {}    # rule name -> number of files which failed it
+        self.examples = {}  # rule name -> sample of failing paths
+
+    def add(self, fname: str, failures: list):
+        self.files += 1
+        if failures:
+            self.failed_files += 1
+        for rule_name in failures:
+            self.counts[rule_name] = self.counts.get(rule_name, 0) + 1
+            examples = self.examples.setdefault(rule_name, [])
+            if len(examples) < self.samples:
+                examples.append(fname)
+
+    def to_dict(self) -> dict:
+        rules = OrderedDict()
+        for rule_name in sorted(self.counts, key=lambda name: (-self.counts[name], name)):
+            rules[rule_name] = {
+                'description': describe(rule_name),
+                'count': self.counts[rule_name],
+                'examples': self.examples[rule_name],
+            }
+        return OrderedDict([('files', self.files), ('failed', self.failed_files), ('rules', rules)])
+
+    def to_text(self) -> str:
+        lines = ['%d files checked, %d failed' % (self.files, self.failed_files)]
+        for rule_name, result in self.to_dict()['rules'].items():
+            lines.append('')
+            lines.append('%-24s %8d  %s' % (rule_name, result['count'], result['description']))
+            lines.extend('    ' + fname for fname in result['examples'])
+        return '\n'.join(lines)
+
+
+def validate(paths, samples: int = DEFAULT_SAMPLES, workers=None) -> Report:
+    """
+    Check the GUANO metadata of many .WAV files concurrently.
+
+    :param paths:  a file or directory path, or an iterable of them; directories are searched recursively
+    :param int samples:  number of failing paths to keep as examples for each rule
+    :param int workers:  number of concurrent worker threads
+    :rtype:  Report
+    """
+    report = Report(samples)
+    def check(fname):
+        return fname, validate_file(fname)
+    for fname, failures in guano._parallel_map(check, guano.iter_wav_paths(paths), workers):
+        report.add(fname, failures)
+    return report
+
+
+def main():
+    """Commandline interface"""
+    import argparse
+    parser = argparse.ArgumentParser(description='Check the GUANO metadata of many files and report failures')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    parser.add_argument('--samples', type=int, default=DEFAULT_SAMPLES,
+                        help='failing paths to list for each rule (default: %d)' % DEFAULT_SAMPLES)
+    parser.add_argument('-j', '--jobs', type=int, help='number of concurrent workers')
+    parser.add_argument('paths', nargs='+', metavar='PATH')
+    args = parser.parse_args()
+
+    report = validate(args.paths, samples=args.samples, workers=args.jobs)
+    if args.json:
+        print(json.dumps(report.to_dict(), indent=2, ensure_ascii=False))
+    else:
+        print(report.to_text())
+    return 1 if report.failed_files else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
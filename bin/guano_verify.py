@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+"""
+guano_verify.py - Check the integrity of recordings against their embedded audio checksums.
+
+A checksum of each file's audio data (its `data` subchunk) can be recorded in its
+`Checksum|Data` field when it is written, eg. with `guano_edit.py --checksum`. This re-hashes
+the audio of every file and reports those which no longer match. The audio is streamed in
+large blocks, and files are hashed concurrently, so verification is limited by disk bandwidth
+rather than by Python.
+
+Mismatched and unreadable files are printed, followed by a summary of how many files were
+verified, failed, or had no checksum. The exit status is 1 if any file failed.
+
+usage::
+
+    $> guano_verify.py [--jobs N] [--quiet] PATH...
+"""
+
+from __future__ import print_function
+
+import sys
+
+import guano
+from guano import GuanoFile
+
+
+OK, MISMATCH, MISSING, UNREADABLE = 'ok', 'MISMATCH', 'missing', 'UNREADABLE'
+
+
+def verify_file(fname: str) -> str:
+    """Verify a single .WAV file's audio against its checksum, returning one of our status constants"""
+    try:
+        matched = GuanoFile(fname, fields=(guano.CHECKSUM_KEY,)).verify_checksum()
+    except (ValueError, ImportError, EnvironmentError):
+        return UNREADABLE
+    if matched is None:
+        return MISSING
+    return OK if matched else MISMATCH
+
+
+def verify(paths, workers=None):
+    """
+    Verify many .WAV files concurrently.
+
+    :param paths:  a file or directory path, or an iterable of them; directories are searched recursively
+    :param int workers:  number of concurrent worker threads
+    :return:  iterable of (path, status) in path order
+    """
+    def check(fname):
+        return fname, verify_file(fname)
+    return guano._parallel_map(check, guano.iter_wav_paths(paths), workers)
+
+
+def main():
+    """Commandline interface"""
+    import argparse
+    parser = argparse.ArgumentParser(description='Verify the audio data of files against their embedded checksums')
+    parser.add_argument('-j', '--jobs', type=int, help='number of concurrent workers')
+    parser.add_argument('-q', '--quiet', action='store_true', help="don't print the summary")
+    parser.add_argument('paths', nargs='+', metavar='PATH')
+    args = parser.parse_args()
+
+    counts = {OK: 0, MISMATCH: 0, MISSING: 0, UNREADABLE: 0}
+    for fname, status in verify(args.paths, args.jobs):
+        counts[status] += 1
+        if status in (MISMATCH, UNREADABLE):
+            print('%s\t%s' % (status, fname))
+    if not args.quiet:
+        print('%d verified, %d mismatched, %d unreadable, %d without a checksum' %
+              (counts[OK], counts[MISMATCH], counts[UNREADABLE], counts[MISSING]), file=sys.stderr)
+    return 1 if counts[MISMATCH] or counts[UNREADABLE] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,326 @@
+#!/usr/bin/env python
+"""
+guano_watch.py - Watch directories for new or changed recordings and ingest their GUANO metadata.
+
+Rather than periodically rescanning an entire directory tree, this long-running process
+only reads the files which have been added or modified. On Linux the kernel's `inotify`
+facility is used; elsewhere (or with `--poll`) the tree is polled for changed file sizes
+and modification times, which is much cheaper than re-reading every file.
+
+A file is only ingested once its size and modification time have been stable for a short
+"settle" period, so that partially written .WAV files aren't read while still being
+copied or synced.
+
+Ingested metadata is written to a metadata index (see `guano_index.py`), to a JSON Lines
+file of metadata fields, or otherwise the file path is printed to stdout.
+
+usage::
+
+    $> guano_watch.py [--poll] [--settle SECONDS] [--index INDEXFILE | --jsonl JSONLFILE] ROOTDIR...
+"""
+
+from __future__ import print_function
+
+import os
+import os.path
+import sys
+import json
+import logging
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, List, Optional
+
+import guano
+from guano import GuanoFile
+
+
+log = logging.getLogger('guano_watch')
+
+
+def _is_wav(fname: str) -> bool:
+    """Whether a path looks like a (non-hidden, non-backup) .WAV file we should ingest"""
+    basename = os.path.basename(fname)
+    return basename.lower().endswith('.wav') and not basename.startswith('.') \
+        and os.path.basename(os.path.dirname(fname)) != 'GUANO_BACKUP'
+
+
+class PollingWatcher(object):
+    """
+    Detect new and changed .WAV files by periodically comparing the size and modification time
+    of every file under the root directories. Works on any platform.
+    """
+
+    def __init__(self, roots: Iterable[str], interval=5.0):
+        self.roots = list(roots)
+        self.interval = interval
+        self._seen = self._snapshot()
+        self._next_poll = time.time() + interval
+
+    def _snapshot(self) -> dict:
+        snapshot = {}
+        for fname in guano.iter_wav_paths(self.roots):
+            try:
+                st = os.stat(fname)
+            except EnvironmentError:
+                continue
+            snapshot[fname] = st.st_size, st.st_mtime
+        return snapshot
+
+    def poll(self, timeout: float) -> List[str]:
+        """Wait up to `timeout` seconds, then return paths which are new or changed"""
+        delay = self._next_poll - time.time()
+        if delay > timeout:
+            time.sleep(timeout)
+            return []
+        if delay > 0:
+            time.sleep(delay)
+        self._next_poll = time.time() + self.interval
+        snapshot = self._snapshot()
+        changed = [fname for fname, key in snapshot.items() if self._seen.get(fname) != key and _is_wav(fname)]
+        self._seen = snapshot
+        return changed
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher(object):
+    """
+    Detect new and changed .WAV files with Linux's `inotify` facility, recursively watching
+    each directory under the root directories.
+    """
+
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ISDIR = 0x40000000
+
+    MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+    _event = struct.Struct('iIII')  # wd, mask, cookie, len
+
+    def __init__(self, roots: Iterable[str]):
+        self.roots = list(roots)
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c') or None, use_errno=True)
+        if not hasattr(self._libc, 'inotify_init1'):
+            raise OSError(errno.ENOSYS, 'inotify is not available on this platform')
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1() failed')
+        self._watches = {}  # watch descriptor -> directory path
+        for root in self.roots:
+            self._add_tree(root)
+
+    def _add_tree(self, path: str) -> List[str]:
+        """Watch a directory tree, returning any .WAV files already present in it"""
+        found = []
+        for dirpath, dirnames, filenames in os.walk(path):
+            dirnames[:] = [d for d in dirnames if d != 'GUANO_BACKUP']
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(dirpath), self.MASK)
+            if wd < 0:
+                log.warning('Failed watching %s: %s', dirpath, os.strerror(ctypes.get_errno()))
+                continue
+            self._watches[wd] = dirpath
+            found.extend(os.path.join(dirpath, f) for f in filenames)
+        return found
+
+    def poll(self, timeout: float) -> List[str]:
+        """Wait up to `timeout` seconds for events, then return paths which are new or changed"""
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            buf = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        changed = []
+        offset = 0
+        while offset < len(buf):
+            wd, mask, cookie, length = self._event.unpack_from(buf, offset)
+            name = buf[offset + self._event.size:offset + self._event.size + length].rstrip(b'\0')
+            offset += self._event.size + length
+
+            if mask & self.IN_Q_OVERFLOW:
+                log.warning('inotify event queue overflowed, rescanning all watched directories')
+                changed.extend(guano.iter_wav_paths(self.roots))
+                continue
+            if mask & self.IN_IGNORED:
+                self._watches.pop(wd, None)
+                continue
+            dirpath = self._watches.get(wd)
+            if dirpath is None:
+                continue
+            path = os.path.join(dirpath, os.fsdecode(name))
+            if mask & self.IN_ISDIR:
+                if mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                    changed.extend(self._add_tree(path))  # files may have arrived before we watched
+            else:
+                changed.append(path)
+        return [fname for fname in changed if _is_wav(fname)]
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+def create_watcher(roots: Iterable[str], polling=False, interval=5.0):
+    """Create an :class:`InotifyWatcher` if supported, falling back to a :class:`PollingWatcher`"""
+    roots = list(roots)
+    if not polling and sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(roots)
+        except OSError as e:
+            log.warning('Falling back to polling for changes: %s', e)
+    return PollingWatcher(roots, interval=interval)
+
+
+class JsonlSink(object):
+    """Sink which appends each file's path and serialized metadata fields to a JSON Lines file"""
+
+    def __init__(self, fname: str):
+        self._f = open(fname, 'a', encoding='utf-8')
+
+    def __call__(self, gfile: GuanoFile):
+        fields = dict((k, gfile._serialize(k, v)) for k, v in gfile.items())
+        self._f.write(json.dumps({'path': os.path.abspath(gfile.filename), 'metadata': fields}, ensure_ascii=False) + '\n')
+        self._f.flush()
+
+    def close(self):
+        self._f.close()
+
+
+class IndexSink(object):
+    """Sink which appends each file to a metadata index, as read by :func:`guano.read_index`"""
+
+    def __init__(self, fname: str):
+        self.fname = fname
+
+    def __call__(self, gfile: GuanoFile):
+        guano.write_index(self.fname, [gfile], append=True)
+
+
+class Ingester(object):
+    """
+    Debounce the changes reported by a watcher, parse settled files with a pool of worker
+    threads, and pass each parsed :class:`GuanoFile` to a sink callable.
+    """
+
+    def __init__(self, watcher, sink: Callable[[GuanoFile], None], settle=2.0, workers: Optional[int] = None, strict=False):
+        self.watcher = watcher
+        self.sink = sink
+        self.settle = settle
+        self.strict = strict
+        self._pending = {}   # path -> ((size, mtime), time of last observed change)
+        self._inflight = []  # futures of files being parsed, in submission order
+        self._executor = ThreadPoolExecutor(max_workers=workers or min(32, (os.cpu_count() or 1) + 4))
+
+    def add(self, fname: str, now: Optional[float] = None):
+        """Note that a file has (possibly) changed; it will be ingested once it settles"""
+        try:
+            st = os.stat(fname)
+        except EnvironmentError:
+            self._pending.pop(fname, None)  # deleted or moved away already
+            return
+        key = st.st_size, st.st_mtime
+        prev = self._pending.get(fname)
+        if prev is None or prev[0] != key:
+            self._pending[fname] = key, time.time() if now is None else now
+
+    def _load(self, fname: str) -> Optional[GuanoFile]:
+        try:
+            return GuanoFile(fname, strict=self.strict)
+        except (ValueError, EnvironmentError) as e:
+            log.warning('Failed ingesting %s: %s', fname, e)
+            return None
+
+    def step(self, timeout=1.0) -> int:
+        """Process one round of changes, returning the number of files passed to the sink"""
+        for fname in self.watcher.poll(timeout):
+            self.add(fname)
+
+        now = time.time()
+        for fname, (key, changed) in list(self._pending.items()):
+            if now - changed < self.settle:
+                continue
+            self.add(fname, now)  # re-check that it's really stopped changing
+            if fname in self._pending and self._pending[fname][0] == key:
+                del self._pending[fname]
+                self._inflight.append(self._executor.submit(self._load, fname))
+
+        count = 0
+        while self._inflight and self._inflight[0].done():
+            gfile = self._inflight.pop(0).result()
+            if gfile is not None:
+                self.sink(gfile)
+                count += 1
+        return count
+
+    def run(self, stop=None, timeout=1.0):
+        """Run until interrupted, or until the optional `stop` :class:`threading.Event` is set"""
+        while stop is None or not stop.is_set():
+            self.step(timeout)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        for future in self._inflight:
+            gfile = future.result()
+            if gfile is not None:
+                self.sink(gfile)
+        self._inflight = []
+        self.watcher.close()
+
+
+def main():
+    """Commandline interface"""
+    import argparse
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s\t%(levelname)s\t%(message)s')
+
+    parser = argparse.ArgumentParser(description='Watch directories and ingest the GUANO metadata of new files')
+    parser.add_argument('--poll', action='store_true', help='poll for changes rather than using inotify')
+    parser.add_argument('--interval', type=float, default=5.0, help='polling interval in seconds (default: 5)')
+    parser.add_argument('--settle', type=float, default=2.0,
+                        help='seconds a file must be unchanged before it is ingested (default: 2)')
+    parser.add_argument('--initial', action='store_true', help='also ingest all existing files at startup')
+    parser.add_argument('-j', '--jobs', type=int, help='number of concurrent workers')
+    sinks = parser.add_mutually_exclusive_group()
+    sinks.add_argument('--index', help='append ingested files to this metadata index')
+    sinks.add_argument('--jsonl', help='append ingested metadata to this JSON Lines file')
+    parser.add_argument('roots', nargs='+', metavar='ROOTDIR')
+    args = parser.parse_args()
+
+    if args.index:
+        sink = IndexSink(args.index)
+    elif args.jsonl:
+        sink = JsonlSink(args.jsonl)
+    else:
+        def sink(gfile):
+            print(gfile.filename)
+            sys.stdout.flush()
+
+    ingester = Ingester(create_watcher(args.roots, polling=args.poll, interval=args.interval),
+                        sink, settle=args.settle, workers=args.jobs)
+    if args.initial:
+        for fname in guano.iter_wav_paths(args.roots):
+            ingester.add(fname, now=0)
+    try:
+        ingester.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        ingester.close()
+        if hasattr(sink, 'close'):
+            sink.close()
+
+
+if __name__ == '__main__':
+    main()
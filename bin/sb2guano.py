@@ -159,7 +159,7 @@ def sonobat2guano(fname):
     gfile.write()
 
 
-if __name__ == '__main__':
+def main():
     from glob import glob
 
     if len(sys.argv) < 2:
@@ -173,3 +173,7 @@ if __name__ == '__main__':
 
     for fname in fnames:
         sonobat2guano(fname)
+
+
+if __name__ == '__main__':
+    main()
@@ -13,30 +13,60 @@ Application code may wish to enable logging with the :func:`logging.basicConfig`
 
 """
 
+import io
 import os
-import wave
 import struct
 import os.path
-import shutil
 from datetime import datetime, tzinfo, timedelta
-from contextlib import closing
-from tempfile import NamedTemporaryFile
 from collections import OrderedDict, namedtuple
-from base64 import standard_b64encode as base64encode
-from base64 import standard_b64decode as base64decode
-from typing import Any, BinaryIO, Callable, Iterable, Tuple, Union
+from collections.abc import Mapping, MutableMapping
 
-import logging
-log = logging.Logger(__name__)
+# Modules needed only by some features are imported where they're used, and type annotations
+# which name :mod:`typing` constructs (or optional `numpy`) are quoted so they aren't evaluated,
+# so that importing this module (and starting the `guano` commandline tool) stays fast.
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Any, BinaryIO, Callable, Dict, Iterable, Optional, Tuple, Union
+    import numpy
+
+
+class _LazyLogger(object):
+    """Stand-in for our module's :class:`logging.Logger`, which imports :mod:`logging` when first used"""
+
+    def __getattr__(self, name):
+        global log
+        if isinstance(log, _LazyLogger):
+            import logging
+            log = logging.Logger(__name__)
+            # prevents a warning if application-level code doesn't configure logging
+            log.addHandler(logging.NullHandler())
+        return getattr(log, name)
+
+
+log = _LazyLogger()
 
 
 __version__ = '1.0.16'
 
-__all__ = 'GuanoFile',
+__all__ = ('GuanoFile', 'peek', 'sidecar_filename', 'iter_fields', 'read_guano_chunk', 'iter_wav_paths', 'scan',
+           'scan_archive', 'Registry', 'read_index', 'write_index', 'is_index_current', 'read_indexes', 'read_cache',
+           'write_cache', 'update_cache', 'RangeFile', 'HTTPRangeFile', 'Durability', 'edit', 'FilePool', 'AudioCache')
 
 
 WHITESPACE = ' \t\n\x0b\x0c\r\0'
 
+def base64encode(value: bytes) -> bytes:
+    """Encode bytes as standard base64, eg. for serializing binary metadata values"""
+    import base64
+    return base64.standard_b64encode(value)
+
+
+def base64decode(value: 'Union[str, bytes]') -> bytes:
+    """Decode standard base64, eg. as a coersion function for binary metadata values"""
+    import base64
+    return base64.standard_b64decode(value)
+
+
 wavparams = namedtuple('wavparams', 'nchannels, sampwidth, framerate, nframes, comptype, compname')
 
 
@@ -128,17 +158,755 @@ def parse_timestamp(s) -> datetime:
 
 _chunkid = struct.Struct('> 4s')
 _chunksz = struct.Struct('< L')
+_chunkhdr = struct.Struct('< 4s L')
+
+
+_ds64 = struct.Struct('< Q Q Q L')  # RF64 riff size, data size, sample count, table length
+_ds64_entry = struct.Struct('< 4s Q')
+
+_MAX_CHUNK_SIZE = 0xFFFFFFFF  # beyond which we must write RF64
+
+
+def _fileno(f: 'BinaryIO') -> 'Optional[int]':
+    """Get the file descriptor of a regular (possibly buffered) file object, if we can read it directly"""
+    if not hasattr(os, 'pread'):
+        return None
+    # only trust the descriptor of real files: wrappers like `gzip.GzipFile` return their
+    # underlying (compressed) file's descriptor
+    raw = f if isinstance(f, io.FileIO) else getattr(f, 'raw', None)
+    if not isinstance(raw, io.FileIO):
+        return None
+    try:
+        return raw.fileno()
+    except ValueError:
+        return None  # closed
+
+
+def _pread(f: 'BinaryIO', offset: int, size: int) -> bytes:
+    """
+    Read up to `size` bytes at `offset` of a file, without using or changing its file position,
+    so that many threads may safely share one open file. File-like objects without a file
+    descriptor fall back to seeking and reading.
+    """
+    fd = _fileno(f)
+    if fd is None:
+        f.seek(offset)
+        return f.read(size)
+    buf = os.pread(fd, size, offset)
+    if 0 < len(buf) < size:
+        chunks = [buf]
+        while size > len(buf):  # short reads are rare, but allowed
+            more = os.pread(fd, size - len(buf), offset + len(buf))
+            if not more:
+                break
+            chunks.append(more)
+            buf = b''.join(chunks)
+    return buf
+
+
+def _file_size(f: 'BinaryIO') -> int:
+    """Get the size of an open file, without changing its file position if possible"""
+    fd = _fileno(f)
+    if fd is not None:
+        return os.fstat(fd).st_size
+    f.seek(0, 2)
+    return f.tell()
+
+
+def _iter_chunks(f: 'BinaryIO', fsize: int) -> 'Iterable[Tuple[bytes, int, int]]':
+    """
+    Iterate over the RIFF subchunks of an open .WAV file as (chunkid, data offset, size).
+    For RF64 files, the 64-bit sizes from the `ds64` subchunk are used where appropriate.
+    """
+    sizes64 = {}  # chunkid -> 64-bit size, from the RF64 `ds64` subchunk
+    offset = 0x0c
+    while offset < fsize - 1:
+        try:
+            chunkid, size = _chunkhdr.unpack(_pread(f, offset, 8))
+            if chunkid == b'ds64':
+                ds64 = _pread(f, offset + 8, size)
+                riff_size, sizes64[b'data'], sample_count, table_length = _ds64.unpack_from(ds64)
+                for i in range(table_length):
+                    table_chunkid, table_size = _ds64_entry.unpack_from(ds64, _ds64.size + i * _ds64_entry.size)
+                    sizes64[table_chunkid] = table_size
+        except struct.error as e:
+            raise ValueError(e)
+        if size == _MAX_CHUNK_SIZE and chunkid in sizes64:
+            size = sizes64[chunkid]
+        yield chunkid, offset + 8, size
+        offset += 8 + size + size % 2  # subchunks are aligned to 16-bit boundary
+
+
+def _check_riff(f: 'BinaryIO') -> 'Tuple[int, bool]':
+    """
+    Verify that an open file looks like a RIFF (or RF64) "WAVE" file.
+
+    :return:  tuple of (file size in bytes, whether it's RF64)
+    """
+    fsize = _file_size(f)
+    if fsize < 12:
+        raise ValueError('File too small to contain valid RIFF "WAVE" header (size %d bytes)' % fsize)
+
+    header = _pread(f, 0, 12)
+    riff = _chunkid.unpack_from(header, 0)[0]
+    chunk = _chunkid.unpack_from(header, 0x08)[0]
+    if chunk != b'WAVE':
+        raise ValueError('Expected RIFF chunk "WAVE" at 0x08, but found "%s"' % repr(chunk))
+    return fsize, riff == b'RF64'
+
+
+def _parse_fmt(fmt: bytes, data_size: int) -> 'wavparams':
+    """Parse a PCM `fmt ` subchunk, as :mod:`wave` would for a regular RIFF file"""
+    try:
+        format_tag, nchannels, framerate, byterate, blockalign, bits = struct.unpack_from('< H H L L H H', fmt)
+    except struct.error as e:
+        raise ValueError(e)
+    if format_tag not in (0x0001, 0xFFFE):  # PCM, or WAVE_FORMAT_EXTENSIBLE
+        raise ValueError('Unsupported .WAV format: 0x%04x' % format_tag)
+    sampwidth = (bits + 7) // 8
+    if not nchannels or not sampwidth:
+        raise ValueError('Bad .WAV format, %d channels of %d bits' % (nchannels, bits))
+    return wavparams(nchannels, sampwidth, framerate, data_size // (nchannels * sampwidth), 'NONE', 'not compressed')
+
+
+def _wav_header(nchannels: int, sampwidth: int, framerate: int, data_size: int, rf64=False) -> bytes:
+    """
+    Build the RIFF (or RF64) header, `fmt ` subchunk, and `data` subchunk header of a PCM .WAV
+    file. The RIFF size should be patched with :func:`_patch_riff_size` once it's known.
+    """
+    if nchannels < 1 or sampwidth not in (1, 2, 3, 4) or framerate < 1:
+        raise ValueError('Bad .WAV parameters, %d channels of %d bytes at %d Hz' % (nchannels, sampwidth, framerate))
+    blockalign = nchannels * sampwidth
+    fmt = struct.pack('< 4s L H H L L H H', b'fmt ', 16, 1, nchannels, framerate, framerate * blockalign,
+                      blockalign, sampwidth * 8)
+    if rf64:
+        return _chunkhdr.pack(b'RF64', _MAX_CHUNK_SIZE) + b'WAVE' \
+            + _chunkhdr.pack(b'ds64', _ds64.size) + _ds64.pack(0, data_size, data_size // blockalign, 0) \
+            + fmt + _chunkhdr.pack(b'data', _MAX_CHUNK_SIZE)
+    return _chunkhdr.pack(b'RIFF', 36 + data_size) + b'WAVE' + fmt + _chunkhdr.pack(b'data', data_size)
+
+
+def _patch_riff_size(f: 'BinaryIO', total_size: int, rf64=False):
+    """Fix the RIFF size in a header written by :func:`_wav_header` for a file of `total_size` bytes"""
+    if rf64:
+        f.seek(0x14)  # riff size within the `ds64` subchunk
+        f.write(struct.pack('< Q', total_size - 8))
+    else:
+        f.seek(0x04)
+        f.write(_chunksz.pack(total_size - 8))
+
+
+def _copy_range(src: 'BinaryIO', dst: 'BinaryIO', offset: int, size: int, bufsize: int = 1 << 20, hasher=None):
+    """
+    Copy `size` bytes from `offset` of `src` to the current position of `dst`, within the kernel
+    (without copying through user space) where the platform and file objects allow. If a
+    `hasher` is specified, the copied bytes are also fed to its `update()` method as they pass
+    through user space.
+    """
+    copied = 0
+    if hasattr(os, 'copy_file_range') and hasher is None:
+        in_fd, out_fd = _fileno(src), _fileno(dst)  # not the descriptors of eg. compressed files
+        if in_fd is not None and out_fd is not None:
+            dst.flush()
+            pos = dst.tell()
+            try:
+                while copied < size:
+                    n = os.copy_file_range(in_fd, out_fd, size - copied, offset + copied, pos + copied)
+                    if not n:
+                        break
+                    copied += n
+            except OSError as e:
+                log.debug('copy_file_range() failed, falling back to read/write: %s', e)
+            dst.seek(pos + copied)
+
+    while copied < size:
+        buf = _pread(src, offset + copied, min(bufsize, size - copied))
+        if not buf:
+            raise ValueError('Unexpected end of file copying %d bytes at offset %d' % (size, offset))
+        dst.write(buf)
+        if hasher is not None:
+            hasher.update(buf)
+        copied += len(buf)
+
+
+def read_guano_chunk(file: 'Union[str, BinaryIO]', index: 'Optional[Dict[str, dict]]' = None) -> 'Union[bytes, str]':
+    """
+    Read the raw `guan` subchunk of a .WAV file without parsing it or the rest of the file.
+
+    This is considerably cheaper than constructing a :class:`GuanoFile`, as the audio parameters
+    are not read and the `data` subchunk is simply skipped over.
+
+    :param file:  path to a .WAV file, or a seekable file-like object
+    :param dict index:  a metadata index (see :func:`read_indexes`); a file which hasn't changed
+                        since it was indexed isn't read at all, and its indexed metadata string
+                        is returned instead
+    :return:  the undecoded GUANO metadata, or empty bytes if the file has no `guan` subchunk
+    :raises ValueError:  if the file doesn't represent a valid .WAV
+    """
+    if index and isinstance(file, str):
+        entry = index.get(os.path.abspath(file))
+        if entry is not None and is_index_current(entry, os.stat(file)):
+            return entry['guano']
+    opener = open(file, 'rb') if isinstance(file, str) else nullcontext(file)
+    with opener as f:
+        fsize, rf64 = _check_riff(f)
+        for chunkid, offset, size in _iter_chunks(f, fsize):
+            if chunkid == b'guan':
+                return _pread(f, offset, size)
+    return b''
+
+
+def iter_fields(metadata: 'Union[str, bytes]', empty=False) -> 'Iterable[Tuple[str, str, str, str]]':
+    """
+    Leniently split GUANO metadata into its individual fields, without coercing their values.
 
+    Fields are produced lazily, in the order they appear, so that callers interested in only
+    some fields may stop early.
 
-class GuanoFile(object):
+    :param metadata:  a string or UTF-8 encoded bytes of GUANO metadata
+    :param bool empty:  also produce fields which have an empty value
+    :return:  iterable of (namespace, key, full key, value string) for each non-empty field; the
+              full key is normalized, without whitespace around its `|` separator
+    """
+    if not isinstance(metadata, str):
+        try:
+            metadata = metadata.decode('utf-8')
+        except UnicodeDecodeError as e:
+            log.warning('GUANO metadata is not UTF-8 encoded! Attempting to coerce. %s', e)
+            metadata = metadata.decode('latin-1')
+
+    # this is the hot loop when reading large vendor namespaces, so make as few method calls per
+    # line as we can. Stripping the key and value strips all of our WHITESPACE but NUL, so lines
+    # only need stripping first if there are NULs. A namespace is usually repeated on many lines
+    # in a row, so it's only stripped when it differs from the previous line's.
+    strip_lines = '\0' in metadata
+    raw_namespace, namespace, prefix = None, None, None
+    for line in metadata.split('\n'):
+        if strip_lines:
+            line = line.strip(WHITESPACE)
+        full_key, sep, val = line.partition(':')
+        if not sep:
+            line = line.strip(WHITESPACE)
+            if line:
+                raise ValueError('Malformed GUANO metadata line, expected "key: value" but found %r' % line)
+            continue
+        val = val.strip()
+        if not val and not empty:
+            continue
+        raw, sep, key = full_key.partition('|')
+        if sep:
+            if raw != raw_namespace:
+                raw_namespace, namespace = raw, raw.strip()
+                prefix = namespace + '|' if namespace else ''
+            key = key.strip()
+            if key:
+                yield namespace, key, prefix + key, val
+        else:
+            key = raw.strip()
+            if key:
+                yield '', key, key, val
+
+
+SIDECAR_EXT = '.guano'
+
+
+def sidecar_filename(fname: str) -> str:
+    """Get the path of the sidecar metadata file for a .WAV file, like `file.wav.guano`"""
+    return fname + SIDECAR_EXT
+
+
+def _full_key(item) -> str:
+    """Normalize a key or (namespace, key) tuple to its full pipe-delimited key"""
+    if isinstance(item, tuple):
+        return '%s|%s' % item if item[0] else item[1]
+    return item
+
+
+def peek(file: 'Union[str, BinaryIO]', key, default=None, strict=False, registry: 'Optional[Registry]' = None) -> 'Any':
+    """
+    Get a single metadata value from a .WAV file with as little I/O and parsing as possible.
+
+    Only the `guan` subchunk is read, and parsing stops once `key` has been found and can't occur
+    again; no other fields are coerced. As with :class:`GuanoFile`, the last value of a repeated
+    field wins. Use this rather than :class:`GuanoFile` when just one value is needed.
+
+    :param file:  path to a .WAV file, or a seekable file-like object
+    :param key:  a well-known key, namespaced key, or tuple of (namespace, key)
+    :param default:  value returned if the file has no such field
+    :param bool strict:  whether to raise `ValueError` if the value can't be coerced
+    :param registry:  the :class:`Registry` of coercion rules (default: :attr:`GuanoFile.registry`)
+    :raises ValueError:  if the file doesn't represent a valid .WAV
+    """
+    full_key = _full_key(key)
+    metadata = read_guano_chunk(file)
+    if not metadata:
+        return default
+    gfile = GuanoFile(strict=strict, fields=[full_key], registry=registry)._parse(metadata)
+    return gfile.get(full_key, default)
+
+
+class Registry(object):
+    """
+    Rules for coercing metadata values from their string representation to specific data types,
+    and for serializing them back, indexed by (namespace, key).
+
+    Rules are kept in a dispatch table per namespace, so that parsing the fields of a namespace
+    without any rules (like most vendor namespaces) costs only a single lookup per field.
+
+    Each :class:`GuanoFile` uses the registry it was created with, or by default the shared
+    :attr:`GuanoFile.registry` of well-known fields. Applications which need their own rules,
+    without affecting other code in the same process, should use their own registry::
+
+        registry = Registry(GuanoFile.registry)  # start with the rules for well-known fields
+        registry.register('User', 'Answer', int)
+        gfile = GuanoFile('myfile.wav', registry=registry)
+
+    :ivar dict coercers:  map of maps of coerce functions:  namespace->key->function
+    :ivar dict serializers:  map of maps of serialize functions:  namespace->key->function
+    """
+
+    def __init__(self, base: 'Optional[Registry]' = None):
+        """
+        :param base:  an existing registry whose rules are copied into this one
+        """
+        self.coercers = {}
+        self.serializers = {}
+        if base is not None:
+            for namespace, table in base.coercers.items():
+                self.coercers[namespace] = dict(table)
+            for namespace, table in base.serializers.items():
+                self.serializers[namespace] = dict(table)
+
+    @classmethod
+    def from_rules(cls, coersion_rules: 'Dict[str, Callable]', serialization_rules: 'Dict[str, Callable]') -> 'Registry':
+        """Create a registry from dicts of rules keyed by full (pipe-delimited) key"""
+        registry = cls()
+        for full_key, function in coersion_rules.items():
+            namespace, key = full_key.split('|', 1) if '|' in full_key else ('', full_key)
+            registry.coercers.setdefault(namespace, {})[key] = function
+        for full_key, function in serialization_rules.items():
+            namespace, key = full_key.split('|', 1) if '|' in full_key else ('', full_key)
+            registry.serializers.setdefault(namespace, {})[key] = function
+        return registry
+
+    def register(self, namespace: str, keys: 'Union[str, Iterable[str]]', coerce_function: 'Callable', serialize_function: 'Callable' = str):
+        """
+        Add rules for coercing and serializing the values of keys.
+
+        :param namespace:  namespace which the keys belong to, or '' for well-known keys
+        :param keys:  a key or sequence of keys under the specified namespace
+        :param coerce_function:  a function for coercing the UTF-8 value to any desired data type
+        :param serialize_function:  an optional function for serializing the value to UTF-8 string
+        """
+        if isinstance(keys, str):
+            keys = [keys]
+        coercers = self.coercers.setdefault(namespace, {})
+        serializers = self.serializers.setdefault(namespace, {})
+        for k in keys:
+            coercers[k] = coerce_function
+            serializers[k] = serialize_function
+
+    def coercer(self, namespace: str, key: str) -> 'Optional[Callable]':
+        """Get the coerce function for a key, or `None` if its values are left as strings"""
+        table = self.coercers.get(namespace)
+        return table.get(key) if table else None
+
+    def serializer(self, namespace: str, key: str) -> 'Callable':
+        """Get the serialize function for a key"""
+        table = self.serializers.get(namespace)
+        return table.get(key, str) if table else str
+
+    def keys(self) -> 'Iterable[str]':
+        """Iterate over the full keys which have a rule"""
+        for rules in self.coercers, self.serializers:
+            for namespace, table in rules.items():
+                for key in table:
+                    yield '%s|%s' % (namespace, key) if namespace else key
+
+    def __repr__(self) -> str:
+        return '%s(%s)' % (self.__class__.__name__, ', '.join(sorted(set(self.keys()))))
+
+
+_SAMPLE_DTYPES = {1: 'u1', 2: '<i2', 4: '<i4'}  # 8-bit .WAV is unsigned; 24-bit is special
+
+
+def _import_numpy():
+    """Import NumPy, which is an optional dependency"""
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError('NumPy is required for this feature, install it with `pip install numpy`')
+    return numpy
+
+
+#: the GUANO field in which :meth:`GuanoFile.write` records a checksum of the audio data
+CHECKSUM_KEY = 'Checksum|Data'
+
+
+class _CRC32(object):
+    """A :mod:`hashlib`-like interface to CRC-32"""
+    name = 'crc32'
+
+    def __init__(self):
+        import zlib
+        self._crc32 = zlib.crc32
+        self._value = 0
+
+    def update(self, data):
+        self._value = self._crc32(data, self._value)
+
+    def hexdigest(self) -> str:
+        return '%08x' % self._value
+
+
+def _new_hash(algorithm: str):
+    """
+    Create a hash object for a named algorithm: `crc32`, an `xxh*` algorithm of the optional
+    `xxhash` package (like `xxh64` or `xxh3_128`), or any :mod:`hashlib` algorithm.
+    """
+    if algorithm == 'crc32':
+        return _CRC32()
+    if algorithm.startswith('xxh'):
+        try:
+            import xxhash
+        except ImportError:
+            raise ImportError('xxhash is required for %s checksums, install it with `pip install xxhash`' % algorithm)
+        if not hasattr(xxhash, algorithm):
+            raise ValueError('Unsupported hash algorithm: %s' % algorithm)
+        return getattr(xxhash, algorithm)()
+    import hashlib
+    return hashlib.new(algorithm)
+
+
+def _fsync_path(path: str):
+    """Flush a file or directory to stable storage, by path"""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError as e:
+        log.debug('Cannot open %s to fsync it: %s', path, e)  # eg. directories on Windows
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class Durability(object):
+    """
+    A policy for flushing written files to stable storage (with `fsync`), trading throughput
+    for safety against power loss. Pass one to :meth:`GuanoFile.write` or :func:`edit`, sharing
+    a single `Durability` between all the files of a bulk operation.
+
+    - `none`:  never fsync; the operating system writes files back at its leisure (the default)
+    - `per-file`:  fsync each file before it replaces the original, and then its directory,
+      before `write()` returns
+    - `group`:  batched directory fsyncs only. Each file is still fsynced before it replaces
+      the original, like `per-file`, but their directories are fsynced after every `group_size`
+      commits (and on :meth:`flush`, or leaving a `with` block), so a directory of many files is
+      fsynced once per batch rather than once per file. That saves at most half of the fsyncs
+      of `per-file`. A crash may undo the replacements of an unflushed batch, leaving those
+      original files in place, but never leaves a partially written file.
+
+    A `Durability` may be shared between threads, and used as a context manager which flushes
+    any pending files when it exits::
+
+        with guano.Durability('group', group_size=500) as durability:
+            for fname in fnames:
+                with guano.edit(fname, durability=durability) as g:
+                    g['Note'] = 'Reviewed'
+    """
+
+    POLICIES = 'none', 'per-file', 'group'
+
+    def __init__(self, policy: str = 'none', group_size: int = 100):
+        if policy not in self.POLICIES:
+            raise ValueError('Unknown durability policy %r, expected one of: %s' % (policy, ', '.join(self.POLICIES)))
+        if group_size < 1:
+            raise ValueError('Expected group_size >= 1')
+        import threading
+        self.policy = policy
+        self.group_size = group_size
+        self._pending = []  # paths committed since our last group flush, whose directories need an fsync
+        self._lock = threading.Lock()
+
+    def sync_file(self, f: 'BinaryIO'):
+        """Called with a newly written file before it replaces the original"""
+        if self.policy != 'none':
+            # its data must be stable before the rename is, or a crash could leave a torn file
+            f.flush()
+            os.fsync(f.fileno())
+
+    def commit(self, fname: str):
+        """Called after a newly written file has replaced the original"""
+        if self.policy == 'per-file':
+            _fsync_path(os.path.dirname(os.path.abspath(fname)))  # the file itself was already synced
+        elif self.policy == 'group':
+            with self._lock:
+                self._pending.append(fname)
+                if len(self._pending) < self.group_size:
+                    return
+                pending, self._pending = self._pending, []
+            self._sync(pending)
+
+    def flush(self):
+        """Fsync the directories of any files committed since the last flush"""
+        with self._lock:
+            pending, self._pending = self._pending, []
+        self._sync(pending)
+
+    @staticmethod
+    def _sync(fnames: list):
+        dirs = set(os.path.dirname(os.path.abspath(fname)) for fname in fnames)  # the files were already synced
+        for dirname in sorted(dirs):
+            _fsync_path(dirname)
+
+    def __enter__(self) -> 'Durability':
+        return self
+
+    def __exit__(self, *excinfo):
+        self.flush()
+
+    def __repr__(self) -> str:
+        return '%s(%r, group_size=%d)' % (self.__class__.__name__, self.policy, self.group_size)
+
+
+def _durability(durability: 'Union[Durability, str, None]') -> 'Optional[Durability]':
+    """Get a :class:`Durability` from a policy name, or `None` for the default of no fsync"""
+    if durability is None or isinstance(durability, Durability):
+        return durability
+    if durability == 'group':
+        raise ValueError('The group durability policy requires a Durability object shared between writes')
+    return Durability(durability) if durability != 'none' else None
+
+
+class FilePool(object):
+    """
+    A bounded pool of open read-only file handles, shared by :class:`GuanoFile` objects, so that
+    a file which is read several times (loaded, then its audio read, then rewritten) is opened
+    only once, and many concurrent readers can't exhaust the process's file descriptors.
+
+    At most `max_open` idle handles are kept, closing the least recently used first. Handles
+    in use are never closed, so the limit may be briefly exceeded by as many handles as there
+    are concurrent readers. A pooled handle is reopened if its file has since been replaced or
+    changed. As all reads are positional (see :func:`_pread`), threads may share a handle.
+
+    Pass a `FilePool` to :class:`GuanoFile`, or assign one to :attr:`GuanoFile.file_pool` to
+    share it between all instances::
+
+        with guano.FilePool(max_open=256) as pool:
+            for fname in fnames:
+                g = GuanoFile(fname, file_pool=pool)
+                ...
+
+    :ivar int hits:  number of times an open handle was reused
+    :ivar int misses:  number of times a file had to be opened
+    """
+
+    def __init__(self, max_open: int = 64):
+        if max_open < 1:
+            raise ValueError('Expected max_open >= 1')
+        import threading
+        self.max_open = max_open
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # path -> [path, file, identity, users], least recently used first
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def open(self, path: str) -> '_Lease':
+        """
+        Get an open handle for a file, as a context manager which returns it to the pool on exit::
+
+            with pool.open(fname) as f:
+                header = guano._pread(f, 0, 12)
+        """
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        identity = st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[2] == identity:
+                self._entries.move_to_end(path)
+                entry[3] += 1
+                self.hits += 1
+                return _Lease(self, entry)
+            self.misses += 1
+        f = open(path, 'rb')  # not holding our lock, as opening can be slow on network filesystems
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[2] == identity:  # another thread beat us to it
+                f.close()
+                entry[3] += 1
+                return _Lease(self, entry)
+            if entry is not None:
+                self._retire(entry)
+            entry = self._entries[path] = [path, f, identity, 1]
+            self._evict()
+        return _Lease(self, entry)
+
+    def _release(self, entry: list):
+        with self._lock:
+            entry[3] -= 1
+            if entry[3]:
+                return
+            if self._entries.get(entry[0]) is not entry:
+                entry[1].close()  # retired while in use
+            else:
+                self._evict()
+
+    def _retire(self, entry: list):
+        """Remove an entry from the pool, closing its handle unless it's in use"""
+        del self._entries[entry[0]]
+        if not entry[3]:
+            entry[1].close()
+
+    def _evict(self):
+        excess = len(self._entries) - self.max_open
+        for entry in [entry for entry in self._entries.values() if not entry[3]][:max(0, excess)]:
+            self._retire(entry)
+
+    def discard(self, path: str):
+        """Close a file's pooled handle (once it's no longer in use), eg. after it's been replaced"""
+        with self._lock:
+            entry = self._entries.get(os.path.abspath(path))
+            if entry is not None:
+                self._retire(entry)
+
+    def close(self):
+        """Close all pooled handles (those in use are closed once they're returned)"""
+        with self._lock:
+            for entry in list(self._entries.values()):
+                self._retire(entry)
+
+    def __enter__(self) -> 'FilePool':
+        return self
+
+    def __exit__(self, *excinfo):
+        self.close()
+
+    def __repr__(self) -> str:
+        return '%s(max_open=%d)' % (self.__class__.__name__, self.max_open)
+
+
+class _Lease(object):
+    """A handle borrowed from a :class:`FilePool`, which is returned when its context exits"""
+
+    def __init__(self, pool: 'FilePool', entry: list):
+        self._pool = pool
+        self._entry = entry
+
+    def __enter__(self) -> 'BinaryIO':
+        return self._entry[1]
+
+    def __exit__(self, *excinfo):
+        self._pool._release(self._entry)
+
+
+class AudioCache(object):
+    """
+    A byte-budgeted, least-recently-used cache of audio data read by :class:`GuanoFile` objects,
+    shared by all of them (see :attr:`GuanoFile.audio_cache`), so that memory use stays bounded
+    however many files a long-running process touches, while recently used audio is still
+    read only once.
+
+    Audio data is keyed by the identity of the file it was read from (device, inode, size, and
+    modification time) and the byte range of its `data` subchunk, so a changed file is never
+    served stale data. Audio data larger than the whole budget isn't cached, so a `GuanoFile`
+    keeps such audio data itself rather than reading it again each time it's needed.
+
+    :ivar int max_bytes:  the budget, in bytes
+    :ivar int size:  bytes of audio data currently cached
+    :ivar int hits:  number of lookups which found cached audio data
+    :ivar int misses:  number of lookups which didn't
+    """
+
+    def __init__(self, max_bytes: int = 64 << 20):
+        if max_bytes < 0:
+            raise ValueError('Expected max_bytes >= 0')
+        import threading
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> data, least recently used first
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: tuple) -> 'Optional[bytes]':
+        """Get cached audio data, or `None`"""
+        with self._lock:
+            data = self._entries.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key: tuple, data: bytes) -> bool:
+        """
+        Cache audio data, evicting the least recently used audio data to stay within our budget.
+
+        :return:  whether the audio data was cached, which it isn't if it exceeds our whole budget
+        """
+        if len(data) > self.max_bytes:
+            return False
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._entries[key] = data
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+        return True
+
+    def clear(self):
+        """Drop all cached audio data"""
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def __repr__(self) -> str:
+        return '%s(max_bytes=%d)' % (self.__class__.__name__, self.max_bytes)
+
+
+def _file_identity(f: 'BinaryIO') -> 'Optional[tuple]':
+    """Identify the version of a real file which a file object reads, or `None` for other file-like objects"""
+    fd = _fileno(f)
+    if fd is None:
+        return None
+    st = os.fstat(fd)
+    return st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns
+
+
+class _LazyAudioCache(object):
+    """Stand-in for the shared :attr:`GuanoFile.audio_cache`, which is created when first used"""
+
+    def __get__(self, instance, owner) -> AudioCache:
+        cache = self.__dict__.get('cache')
+        if cache is None:
+            cache = self.__dict__.setdefault('cache', AudioCache())  # atomic, so racing threads share one
+        return cache
+
+
+class GuanoFile(MutableMapping):
     """
     An abstraction of a .WAV file with GUANO metadata.
 
-    A `GuanoFile` object behaves like a normal Python :class:`dict`, where keys can either be
-    well-known metadata keys, namespaced keys, or a tuple of (namespace, key).
+    A `GuanoFile` object behaves like a normal Python :class:`dict` (it's a
+    :class:`~collections.abc.MutableMapping`), where keys can either be well-known metadata keys,
+    namespaced keys, or a tuple of (namespace, key). Iterating over it yields full keys, in the
+    order in which they were loaded or added.
 
     Well-known keys will have their values coerced into the correct data type. The parser may be
-    configured to coerce new namespaced keys with the :func:`register()` function.
+    configured to coerce new namespaced keys with the :func:`register()` function, or by
+    creating it with its own :class:`Registry` of rules.
 
     Example usage::
 
@@ -157,11 +925,13 @@ class GuanoFile(object):
     :ivar str filename:  path to the file which this object represents, or `None` if a "new" file
     :ivar bool strict_mode:  whether the GUANO parser is configured for strict or lenient parsing
     :ivar bytes wav_data:  the `data` subchunk of a .WAV file consisting of its actual audio data,
-                           lazily-loaded and cached for performance
+                           lazily loaded, and kept in the shared :attr:`audio_cache` (or by this
+                           object, if it's too large for the cache or the cache is disabled)
     :ivar wavparams wav_params:  namedtuple of .WAV parameters (nchannels, sampwidth, framerate, nframes, comptype, compname)
     """
 
-    _coersion_rules = {
+    #: the shared :class:`Registry` used by default, with rules for the well-known fields
+    registry = Registry.from_rules({
         'Filter HP': float,
         'Length': float,
         'Loc Accuracy': float,
@@ -171,15 +941,23 @@ class GuanoFile(object):
         'Samplerate': int,
         'TE': lambda value: int(value) if value else 1,
         'Timestamp': parse_timestamp,
-    }
-    _serialization_rules = {
+    }, {
         'Length': lambda value: '%.2f' % value,
         'Loc Position': lambda value: '%f %f' % value,
         'Note': lambda value: value.replace('\n', '\\n'),
         'Timestamp': lambda value: value.isoformat() if value else '',
-    }
+    })
+
+    #: the :class:`FilePool` shared by default for reading files, or `None` to open files as needed
+    file_pool = None
+
+    #: the shared :class:`AudioCache` of audio data read from files, or `None` to keep each
+    #: file's audio data on its `GuanoFile` once read
+    audio_cache = _LazyAudioCache()
 
-    def __init__(self, file: Union[str, BinaryIO] = None, strict=False):
+    def __init__(self, file: 'Union[str, BinaryIO]' = None, strict=False,
+                 fields: 'Optional[Iterable]' = None, namespaces: 'Optional[Iterable[str]]' = None, sidecar=False,
+                 registry: 'Optional[Registry]' = None, file_pool: 'Optional[FilePool]' = None):
         """
         Create a GuanoFile instance which represents a single file's GUANO metadata.
         If the file already contains GUANO metadata, it will be parsed immediately. If not, then
@@ -192,6 +970,17 @@ class GuanoFile(object):
                              encountering bad metadata values, or whether it should be as lenient
                              as possible (default: False, lenient); if in lenient mode, bad values
                              will remain in their UTF-8 string form as found persisted in the file
+        :param fields:  only load these keys (or (namespace, key) tuples), skipping all others
+        :param namespaces:  only load keys in these namespaces, skipping all others; use '' for
+                            the well-known fields; if combined with `fields`, load keys matching either.
+                            A selectively loaded file doesn't read `wav_params`, and can't be written
+        :param bool sidecar:  whether metadata from a sidecar file (see :func:`sidecar_filename`)
+                              overlays the embedded `guan` subchunk, and whether :meth:`write`
+                              saves changes to that sidecar rather than rewriting the .WAV file
+        :param registry:  the :class:`Registry` of rules for coercing and serializing values
+                          (default: the shared :attr:`GuanoFile.registry`)
+        :param file_pool:  a :class:`FilePool` of open handles to read the file through, rather
+                           than opening it for each read (default: the shared :attr:`GuanoFile.file_pool`)
         :raises ValueError:  if the specified file doesn't represent a valid .WAV or if its
                              existing GUANO metadata is broken
         """
@@ -200,35 +989,59 @@ class GuanoFile(object):
             self._file = None
         else:
             self.filename = file.name if hasattr(file, 'name') else None
-            self._file: BinaryIO = file  # a file-like object
+            self._file: 'BinaryIO' = file  # a file-like object
 
         self.strict_mode = strict
+        if registry is not None:
+            self.registry = registry
+        if file_pool is not None:
+            self.file_pool = file_pool
+        self._fields = set(_full_key(k) for k in fields) if fields is not None else None
+        self._namespaces = set(namespaces) if namespaces is not None else None
 
         self.wav_params = None
         self._md = OrderedDict()  # metadata storage - map of maps:  namespace->key->val
+        self._keys = {}           # flattened index of `_md`:  full key->(namespace, key)
 
-        self._wav_data = None  # lazily-loaded and cached
+        self._wav_data = None  # audio data which was assigned, or which can't be kept in our `audio_cache`
+        self._source_identity = None  # see `_file_identity()`
         self._wav_data_offset = 0
         self._wav_data_size = 0
+        self._wav_data_modified = False
+
+        self._raw_md = None       # the `guan` subchunk exactly as loaded
+        self._loaded_state = None  # (filename, wav_params) as loaded, or None if a "new" file
+        self._dirty = set()       # (namespace, key) which were changed or deleted since loading
+        self._lines = {}          # cache of serialized lines:  (namespace, key)->line
+
+        self.sidecar = sidecar
+        self._embedded_keys = set()    # (namespace, key) found in the embedded `guan` subchunk
+        self._sidecar_loaded = False  # whether a sidecar's metadata overlays the embedded metadata
 
         if self._file or (self.filename and os.path.isfile(self.filename)):
             self._load()
+        if sidecar and self.filename and os.path.isfile(sidecar_filename(self.filename)):
+            self._load_sidecar()
 
-    def _coerce(self, key: str, value: str) -> Any:
+    def _coerce(self, key: str, value: str, coerce: 'Optional[Callable]' = None) -> 'Any':
         """Coerce a value from its Unicode representation to a specific data type"""
-        if key in self._coersion_rules:
-            try:
-                return self._coersion_rules[key](value)
-            except (ValueError, TypeError) as e:
-                if self.strict_mode:
-                    raise
-                else:
-                    log.warning('Failed coercing "%s": %s', key, e)
-        return value  # default should already be a Unicode string
+        if coerce is None:
+            coerce = self.registry.coercer(*self._split_key(key))
+            if coerce is None:
+                return value  # default should already be a Unicode string
+        try:
+            return coerce(value)
+        except (ValueError, TypeError) as e:
+            if self.strict_mode:
+                raise
+            else:
+                log.warning('Failed coercing "%s": %s', key, e)
+        return value
 
-    def _serialize(self, key: str, value: Any) -> str:
+    def _serialize(self, key: str, value: 'Any', serialize: 'Optional[Callable]' = None) -> str:
         """Serialize a value from its real representation to GUANO Unicode representation"""
-        serialize = self._serialization_rules.get(key, str)
+        if serialize is None:
+            serialize = self.registry.serializer(*self._split_key(key))
         try:
             return serialize(value)
         except (ValueError, TypeError) as e:
@@ -238,56 +1051,84 @@ class GuanoFile(object):
                 log.warning('Failed serializing "%s": %s', key, e)
 
     def _load(self):
-        """Load the contents of our underlying .WAV file"""
-        opener = open(self.filename, 'rb') if self._file is None else nullcontext(self._file)
-        with opener as f:
-            # check filesize: seek to end of file and tell its byte offset
-            f.seek(0, 2)
-            fsize = f.tell()
-            if fsize < 8:
-                raise ValueError('File too small to contain valid RIFF "WAVE" header (size %d bytes)' % fsize)
-
-            f.seek(0x08)
-            chunk = _chunkid.unpack(f.read(4))[0]
-            if chunk != b'WAVE':
-                raise ValueError('Expected RIFF chunk "WAVE" at 0x08, but found "%s"' % repr(chunk))
-
-            try:
-                f.seek(0)
-                self.wav_params = wavparams(*wave.open(f).getparams())
-            except RuntimeError as e:
-                return ValueError(e)  # Python's chunk.py throws this inappropriate exception
+        """
+        Load the contents of our underlying .WAV file. Only positional reads are used (see
+        :func:`_pread`), so threads may share one open file object.
+        """
+        with self._open_source() as f:
+            fsize, rf64 = _check_riff(f)
+            self._source_identity = _file_identity(f)
 
             # iterate through the file until we find our 'guan' subchunk
-            metadata_buf = None
-            f.seek(0x0c)
-            while f.tell() < fsize - 1:
-                try:
-                    chunkid = _chunkid.unpack(f.read(4))[0]
-                    size = _chunksz.unpack(f.read(4))[0]
-                except struct.error as e:
-                    raise ValueError(e)
-
+            metadata_buf, fmt = None, None
+            for chunkid, offset, size in _iter_chunks(f, fsize):
                 if chunkid == b'guan':
-                    metadata_buf = f.read(size)
+                    metadata_buf = _pread(f, offset, size)
                 elif chunkid == b'data':
-                    self._wav_data_offset = f.tell()
+                    self._wav_data_offset = offset
                     self._wav_data_size = size
-                    f.seek(size, 1)  # skip over wav data
-                else:
-                    f.seek(size, 1)  # skip over wav data
-
-                if size % 2:
-                    f.read(1)  # align to 16-bit boundary
+                elif chunkid == b'fmt ' and not self.partial:
+                    fmt = _pread(f, offset, min(size, 40))
 
             if not self._wav_data_offset:
                 raise ValueError('No DATA sub-chunk found in .WAV file')
+            if not self.partial:
+                if not fmt:
+                    raise ValueError('No FMT sub-chunk found in .WAV file')
+                # rather than Python's `wave`, which can't read RF64 and seeks our file object
+                self.wav_params = _parse_fmt(fmt, self._wav_data_size)
 
             if metadata_buf:
                 self._parse(metadata_buf)
+                if self.sidecar:
+                    self._embedded_keys = set((ns, k) for ns, data in self._md.items() for k in data)
+            self._raw_md = bytes(metadata_buf or b'')
+            self._loaded_state = self.filename, self.wav_params
+
+    def _open_source(self):
+        """
+        Open the file we were loaded from for reading (even if we've since been given a new
+        filename), as a context manager: the file object we were given, a handle borrowed from
+        our :attr:`file_pool`, or else a newly opened file.
+        """
+        if self._file is not None:
+            return nullcontext(self._file)
+        fname = self._loaded_state[0] if self._loaded_state else self.filename
+        if self.file_pool is not None:
+            return self.file_pool.open(fname)
+        return open(fname, 'rb')
+
+    def close(self):
+        """
+        Release the resources held by this object: a file object which it was created with is
+        closed, and audio data read into memory is dropped (unless it has been changed). Its
+        metadata remains available. Handles borrowed from a :class:`FilePool` are only ever
+        held during a single read, and stay open in the pool.
+        """
+        if self._file is not None:
+            self._file.close()
+        if not self._wav_data_modified:
+            self._wav_data = None
 
-    def _parse(self, metadata_str):
-        """Parse metadata and populate our internal mappings"""
+    def __enter__(self) -> 'GuanoFile':
+        return self
+
+    def __exit__(self, *excinfo):
+        self.close()
+
+    def _load_sidecar(self):
+        """Overlay the metadata from our sidecar file onto the embedded metadata"""
+        with open(sidecar_filename(self.filename), 'rb') as f:
+            self._parse(f.read(), overlay=True)
+        self._sidecar_loaded = True
+        if self._loaded_state is None:
+            self._loaded_state = self.filename, self.wav_params  # sidecar without a .WAV
+
+    def _parse(self, metadata_str, overlay=False):
+        """
+        Parse metadata and populate our internal mappings. If `overlay`, then fields with an
+        empty value delete that field (as written to sidecar files for deleted fields).
+        """
         if not isinstance(metadata_str, str):
             try:
                 metadata_str = metadata_str.decode('utf-8')
@@ -295,18 +1136,82 @@ class GuanoFile(object):
                 log.warning('GUANO metadata is not UTF-8 encoded! Attempting to coerce. %s', repr(self))
                 metadata_str = metadata_str.decode('latin-1')
 
+        md, index, coerce, tables = self._md, self._keys, self._coerce, self.registry.coercers
+        fields, namespaces = self._fields, self._namespaces
+        selective = fields is not None or namespaces is not None
+        remaining = set(fields) if fields and namespaces is None else None
+
+        # this is the hot loop when reading large vendor namespaces, so it's `iter_fields()` inlined
+        # with as few method calls and new strings per line as we can. Stripping the key and value
+        # strips all of our WHITESPACE but NUL, so lines only need stripping first if there are
+        # NULs. A namespace is usually repeated on many lines in a row, so it's only stripped when
+        # it differs from the previous line's, and a line's key is reused as its full key when
+        # it's already normalized (`strip()` returns the very same string when there's nothing to
+        # strip). As the original parser did, coercion rules only apply to full keys without any
+        # whitespace around their `|`.
+        strip_lines = '\0' in metadata_str
+        raw_namespace, namespace, prefix, normal = None, '', '', False
+        current, data, table = None, None, None  # the namespace we're in, its fields, and its rules
         for line in metadata_str.split('\n'):
-            line = line.strip(WHITESPACE)
-            if not line:
+            if strip_lines:
+                line = line.strip(WHITESPACE)
+            head, sep, val = line.partition(':')
+            if not sep:
+                line = line.strip(WHITESPACE)
+                if line:
+                    raise ValueError('Malformed GUANO metadata line, expected "key: value" but found %r' % line)
                 continue
-            full_key, val = line.split(':', 1)
-            namespace, key = full_key.split('|', 1) if '|' in full_key else ('', full_key)
-            namespace, key, full_key, val = namespace.strip(), key.strip(), full_key.strip(), val.strip()
-            if not key or not val:
+            val = val.strip()
+            raw, sep, key = head.partition('|')
+            if sep:
+                if raw != raw_namespace:
+                    raw_namespace, ns = raw, raw.strip()
+                    namespace, prefix, normal = ns, ns + '|' if ns else '', ns is raw and ns != ''
+                stripped = key.strip()
+                if not stripped:
+                    continue
+                elif stripped is key and normal:
+                    full_key, rules = head, True
+                else:
+                    key, full_key = stripped, prefix + stripped
+                    rules = head.strip() == full_key
+                ns = namespace
+            else:
+                ns, key = '', raw.strip()
+                if not key:
+                    continue
+                full_key, rules = key, True
+            if not val:
+                if overlay and index.pop(full_key, None) is not None:
+                    del md[ns][key]
+                    if not md[ns]:
+                        del md[ns]
+                    current = None
                 continue
-            if namespace not in self._md:
-                self._md[namespace] = OrderedDict()
-            self._md[namespace][key] = self._coerce(full_key, val)
+            if selective:
+                if not ((fields and full_key in fields) or (namespaces and ns in namespaces)):
+                    continue
+                if remaining is not None:
+                    remaining.discard(full_key)
+            if ns is not current:  # a namespace's fields are usually together, so look up once
+                current, table = ns, tables.get(ns)
+                data = md.get(ns)
+                if data is None:
+                    data = md[ns] = OrderedDict()
+            if table is not None and rules:
+                function = table.get(key)
+                if function is not None:
+                    val = coerce(full_key, val, function)
+            data[key] = val
+            index[full_key] = ns, key
+            if remaining is not None and not remaining:
+                # we've found all the fields we're looking for, but the last of a repeated field
+                # wins, so stop only if none of their keys occur after this line (searching from
+                # this line's first occurrence, which may be earlier, to be sure)
+                tail = metadata_str[metadata_str.find(line) + len(line):]
+                if not any(f[f.find('|') + 1:] in tail for f in fields):
+                    break
+                remaining = None
         return self
 
     @classmethod
@@ -324,9 +1229,11 @@ class GuanoFile(object):
         return GuanoFile(*args, **kwargs)._parse(metadata_str)
 
     @classmethod
-    def register(cls, namespace: str, keys: Union[str, Iterable[str]], coerce_function: Callable, serialize_function: Callable = str):
+    def register(cls, namespace: str, keys: 'Union[str, Iterable[str]]', coerce_function: 'Callable', serialize_function: 'Callable' = str):
         """
-        Configure the GUANO parser to recognize new namespaced keys.
+        Configure the GUANO parser to recognize new namespaced keys. The rules are added to the
+        shared :attr:`registry`, so they apply to every `GuanoFile` which doesn't have its own
+        :class:`Registry`.
 
         :param namespace:  vendor namespace which the keys belong to
         :param keys:  a key or sequence of keys under the specified vendor namespace
@@ -335,14 +1242,13 @@ class GuanoFile(object):
         :param serialize_function:  an optional function for serializing the value to UTF-8 string
         :type serialize_function:  callable
         """
-        if isinstance(keys, str):
-            keys = [keys]
-        for k in keys:
-            full_key = namespace+'|'+k if namespace else k
-            cls._coersion_rules[full_key] = coerce_function
-            cls._serialization_rules[full_key] = serialize_function
+        cls.registry.register(namespace, keys, coerce_function, serialize_function)
 
-    def _split_key(self, item) -> Tuple[str, str]:
+    def _split_key(self, item) -> 'Tuple[str, str]':
+        try:
+            return self._keys[item]  # a full key which we hold, without splitting it again
+        except (KeyError, TypeError):
+            pass
         if isinstance(item, tuple):
             namespace, key = item[0], item[1]
         elif '|' in item:
@@ -351,11 +1257,11 @@ class GuanoFile(object):
             namespace, key = '', item
         return namespace, key
 
-    def __getitem__(self, item) -> Any:
+    def __getitem__(self, item) -> 'Any':
         namespace, key = self._split_key(item)
         return self._md[namespace][key]
 
-    def get(self, item, default=None) -> Any:
+    def get(self, item, default=None) -> 'Any':
         try:
             return self[item]
         except KeyError:
@@ -363,13 +1269,42 @@ class GuanoFile(object):
 
     def __setitem__(self, key, value):
         if not self._md:
-            self._md['GUANO'] = {}
-            self._md['GUANO']['Version'] = '1.0'
+            self._set('GUANO', 'Version', '1.0')
+        self._set(*self._split_key(key), value)
 
-        namespace, key = self._split_key(key)
-        if namespace not in self._md:
-            self._md[namespace] = {}
-        self._md[namespace][key] = value
+    def update(self, other=(), **kwargs):
+        """
+        Assign many fields at once, like :meth:`dict.update`, from a mapping or an iterable of
+        (key, value) pairs, and from keyword arguments. Keys are resolved through our index of
+        full keys, and a "new" file gets its `GUANO|Version` field only once.
+        """
+        if isinstance(other, Mapping):
+            other = other.items()
+        elif hasattr(other, 'keys'):
+            other = [(k, other[k]) for k in other.keys()]
+        pairs = list(other) + list(kwargs.items())
+        if pairs and not self._md:
+            self._set('GUANO', 'Version', '1.0')
+        split_key, set_ = self._split_key, self._set
+        for key, value in pairs:
+            set_(*split_key(key), value)
+
+    def _set(self, namespace: str, key: str, value: 'Any'):
+        """Assign a single field, indexing it if it's new and marking it as modified if it changed"""
+        data = self._md.get(namespace)
+        if data is None:
+            data = self._md[namespace] = {}
+        if key not in data:
+            self._keys['%s|%s' % (namespace, key) if namespace else key] = namespace, key
+        elif data[key] == value:
+            return  # unchanged, so don't bother marking it as modified
+        data[key] = value
+        self._touch(namespace, key)
+
+    def _touch(self, namespace: str, key: str):
+        """Mark a field as modified, invalidating any cached serialization of it"""
+        self._dirty.add((namespace, key))
+        self._lines.pop((namespace, key), None)
 
     def __contains__(self, item) -> bool:
         namespace, key = self._split_key(item)
@@ -378,15 +1313,46 @@ class GuanoFile(object):
     def __delitem__(self, key):
         namespace, key = self._split_key(key)
         del self._md[namespace][key]
+        del self._keys['%s|%s' % (namespace, key) if namespace else key]
         if not self._md[namespace]:
             del self._md[namespace]
+        self._touch(namespace, key)
+
+    def __iter__(self) -> 'Iterable[str]':
+        return iter(self._keys)
+
+    def __len__(self) -> int:
+        return len(self._keys)
 
-    def __bool__(self) -> bool:
-        return bool(self._md)
+    # a `GuanoFile` stands for a file rather than a value, so unlike a `dict` it's only equal
+    # to itself, and remains hashable
+    __eq__ = object.__eq__
+    __hash__ = object.__hash__
 
     def __repr__(self) -> str:
         return '%s(%s)' % (self.__class__.__name__, self.filename or self._file)
 
+    @property
+    def partial(self) -> bool:
+        """Whether only selected `fields` or `namespaces` were loaded (see :meth:`__init__`)"""
+        return self._fields is not None or self._namespaces is not None
+
+    @property
+    def modified(self) -> bool:
+        """
+        Whether this file's metadata or audio has been changed since it was loaded or last written.
+        A "new" file which wasn't loaded from disk is always considered modified.
+        """
+        if self._loaded_state is None:
+            return True
+        if self._sidecar_loaded and not self.sidecar:
+            return True  # sidecar metadata isn't yet embedded
+        return bool(self._dirty) or self._wav_data_modified or self._loaded_state != (self.filename, self.wav_params)
+
+    def modified_keys(self) -> set:
+        """Get the set of full keys which were changed or deleted since loading or last writing"""
+        return set('%s|%s' % (namespace, k) if namespace else k for namespace, k in self._dirty)
+
     def get_namespaces(self) -> list:
         """
         Get list of all namespaces represented by this metadata.
@@ -394,69 +1360,314 @@ class GuanoFile(object):
         """
         return list(self._md.keys())
 
-    def items(self, namespace: str = None) -> Iterable[Tuple[str, Any]]:
+    def items(self, namespace: str = None) -> 'Iterable[Tuple[str, Any]]':
         """Iterate over (key, value) for entire metadata or for specified namespace of fields"""
         if namespace is not None:
             for k, v in self._md[namespace].items():
                 yield k, v
         else:
-            for namespace, data in self._md.items():
-                for k, v in data.items():
-                    k = '%s|%s' % (namespace, k) if namespace else k
-                    yield k, v
+            md = self._md
+            for full_key, (namespace, k) in self._keys.items():
+                yield full_key, md[namespace][k]
 
-    def items_namespaced(self) -> Iterable[Tuple[str, str, Any]]:
+    def items_namespaced(self) -> 'Iterable[Tuple[str, str, Any]]':
         """Iterate over (namespace, key, value) for entire metadata"""
         for namespace, data in self._md.items():
             for k, v in data.items():
                 yield namespace, k, v
 
-    def well_known_items(self) -> Iterable[Tuple[str, Any]]:
+    def well_known_items(self) -> 'Iterable[Tuple[str, Any]]':
         """Iterate over (key, value) for all the well-known (defined) fields"""
         return self.items('')
 
     def to_string(self) -> str:
         """Represent the GUANO metadata as a Unicode string"""
         lines = []
+        cache, tables = self._lines, self.registry.serializers
         for namespace, data in self._md.items():
+            table = tables.get(namespace) or {}
             for k, v in data.items():
-                k = u'%s|%s' % (namespace, k) if namespace else k
-                v = self._serialize(k, v)
-                lines.append(u'%s: %s' % (k, v))
+                line = cache.get((namespace, k))
+                if line is None:
+                    full_key = u'%s|%s' % (namespace, k) if namespace else k
+                    serialized = self._serialize(full_key, v, table.get(k, str))
+                    line = cache[(namespace, k)] = u'%s: %s' % (full_key, serialized)
+                lines.append(line)
         return u'\n'.join(lines)
 
+    def _raw_md_reusable(self) -> bool:
+        """Whether the `guan` subchunk as loaded may be written back verbatim"""
+        if self._raw_md is None or self._dirty or self._sidecar_loaded:
+            return False
+        try:
+            self._raw_md.decode('utf-8')
+        except UnicodeDecodeError:
+            return False  # re-encode as proper UTF-8
+        return True
+
     def serialize(self, pad='\n') -> bytes:
-        """Serialize the GUANO metadata as UTF-8 encoded bytes"""
-        md_bytes = bytearray(self.to_string(), 'utf-8')
+        """
+        Serialize the GUANO metadata as UTF-8 encoded bytes.
+        If the metadata is unmodified since it was loaded, the original bytes are reused verbatim.
+        """
+        if self._raw_md_reusable():
+            md_bytes = bytearray(self._raw_md)
+        else:
+            md_bytes = bytearray(self.to_string(), 'utf-8')
         if pad is not None and len(md_bytes) % 2:
             # pad for alignment on even word boundary
             md_bytes.append(ord(pad))
         return md_bytes
 
+    def _audio_cache_key(self) -> 'Optional[tuple]':
+        if self.audio_cache is None or self._source_identity is None:
+            return None
+        return self._source_identity + (self._wav_data_offset, self._wav_data_size)
+
+    def _loaded_wav_data(self) -> 'Optional[bytes]':
+        """Get our audio data if it's already in memory, without reading it"""
+        if self._wav_data is not None:
+            return self._wav_data
+        key = self._audio_cache_key()
+        return self.audio_cache.get(key) if key is not None else None
+
     @property
     def wav_data(self) -> bytes:
-        """Actual audio data from the wav `data` chunk. Lazily loaded and cached."""
+        """
+        Actual audio data from the wav `data` chunk. Lazily loaded, and cached in the shared
+        :attr:`audio_cache`; audio data which is larger than the cache's whole budget, or which
+        can't be cached, is kept by this object instead, so it's only read once.
+        """
         if not self._wav_data_size:
             raise ValueError()
-        if not self._wav_data:
-            opener = open(self.filename, 'rb') if self._file is None else nullcontext(self._file)
-            with opener as f:
-                f.seek(self._wav_data_offset)
-                self._wav_data = f.read(self._wav_data_size)
-
-        return self._wav_data
+        data = self._loaded_wav_data()
+        if data is None:
+            # read from the file we were loaded from, even if we've since been given a new filename
+            with self._open_source() as f:
+                data = _pread(f, self._wav_data_offset, self._wav_data_size)
+                identity = _file_identity(f)
+            key = self._audio_cache_key()
+            # never cache data under a key which doesn't identify the file we actually read
+            if key is None or identity != self._source_identity or not self.audio_cache.put(key, data):
+                self._wav_data = data
+        return data
 
     @wav_data.setter
     def wav_data(self, data: bytes):
         self._wav_data_size = len(data)
         self._wav_data = data
+        self._wav_data_modified = True
 
-    def write(self, make_backup=True):
+    def _frame_format(self) -> 'Tuple[int, int, int]':
+        """Get the (sample width, number of channels, number of whole frames) of our audio data"""
+        if not self.wav_params:
+            raise ValueError('Cannot interpret audio data without appropriate self.wav_params')
+        sampwidth, nchannels = self.wav_params.sampwidth, self.wav_params.nchannels
+        if sampwidth not in (1, 2, 3, 4):
+            raise ValueError('Unsupported sample width: %d bytes' % sampwidth)
+        return sampwidth, nchannels, self._wav_data_size // (sampwidth * nchannels)
+
+    def _samples(self, buf, nchannels: int, sampwidth: int) -> 'numpy.ndarray':
+        """Interpret a buffer of whole frames as a NumPy array of shape (nframes, nchannels)"""
+        np = _import_numpy()
+        if sampwidth == 3:
+            # no native 24-bit dtype: place each sample in the upper 3 bytes of an int32, then
+            # shift right to sign-extend it
+            raw = np.frombuffer(buf, dtype=np.uint8).reshape(-1, 3)
+            padded = np.zeros((raw.shape[0], 4), dtype=np.uint8)
+            padded[:, 1:] = raw
+            samples = padded.view('<i4').reshape(-1) >> 8
+        else:
+            samples = np.frombuffer(buf, dtype=_SAMPLE_DTYPES[sampwidth])
+        return samples.reshape(-1, nchannels)
+
+    def frames(self, mmap=True) -> 'numpy.ndarray':
+        """
+        Get the audio data as a NumPy array of shape (nframes, nchannels), with dtype `uint8`
+        (8-bit), `int16`, or `int32` (24-bit and 32-bit) according to the sample width.
+        Requires NumPy.
+
+        Where possible this doesn't copy the audio data: a view of already-loaded `wav_data` is
+        returned, or else the `data` subchunk is memory-mapped read-only from disk. 24-bit audio
+        must always be converted to a new array.
+
+        :param bool mmap:  memory-map the file rather than reading the audio data (default: True)
+        """
+        np = _import_numpy()
+        sampwidth, nchannels, nframes = self._frame_format()
+        if not nframes:
+            return np.zeros((0, nchannels), dtype=_SAMPLE_DTYPES.get(sampwidth, '<i4'))
+        if mmap and sampwidth != 3 and self._file is None and self._loaded_state and self._loaded_wav_data() is None:
+            return np.memmap(self._loaded_state[0], dtype=_SAMPLE_DTYPES[sampwidth], mode='r',
+                             offset=self._wav_data_offset, shape=(nframes, nchannels))
+        data = memoryview(self.wav_data)[:nframes * nchannels * sampwidth]
+        return self._samples(data, nchannels, sampwidth)
+
+    def audio_digest(self, algorithm: str = 'sha256', bufsize: int = 1 << 20) -> str:
         """
-        Write the GUANO .WAV file to disk.
+        Compute a hash of just the audio data (the `data` subchunk), so that recordings with the
+        same audio but different metadata have the same digest. Unless `wav_data` is already
+        loaded, the audio data is streamed from disk rather than read into memory.
+
+        :param str algorithm:  `crc32`, an `xxh*` algorithm (requires `xxhash`), or a :mod:`hashlib` algorithm name
+        :param int bufsize:  number of bytes to read and hash at a time
+        :return:  hexadecimal digest
+        """
+        h = _new_hash(algorithm)
+        data = self._loaded_wav_data()
+        if data:
+            h.update(data)
+            return h.hexdigest()
+        if not self._wav_data_size:
+            raise ValueError('No audio data to hash')
+        with self._open_source() as f:
+            offset, end = self._wav_data_offset, self._wav_data_offset + self._wav_data_size
+            while offset < end:
+                buf = _pread(f, offset, min(bufsize, end - offset))
+                if not buf:
+                    raise ValueError('Unexpected end of file hashing audio data at offset %d' % offset)
+                h.update(buf)
+                offset += len(buf)
+        return h.hexdigest()
+
+    def verify_checksum(self, bufsize: int = 1 << 20) -> 'Optional[bool]':
+        """
+        Re-hash the audio data and compare it with the checksum recorded by :meth:`write` in
+        the `Checksum|Data` field.
+
+        :return:  whether the audio data matches its checksum, or `None` if it has no checksum
+        :raises ValueError:  if the checksum field is malformed
+        """
+        value = self.get(CHECKSUM_KEY)
+        if not value:
+            return None
+        algorithm, sep, digest = value.partition(':')
+        if not sep or not digest:
+            raise ValueError('Malformed %s value: %s' % (CHECKSUM_KEY, value))
+        return self.audio_digest(algorithm, bufsize) == digest.lower()
+
+    def iter_blocks(self, nframes: int, overlap: int = 0) -> 'Iterable[numpy.ndarray]':
+        """
+        Iterate over fixed-size windows of the audio data as NumPy arrays of shape
+        (nframes, nchannels), reading only one window at a time from disk. The final window
+        may be shorter. Requires NumPy.
+
+        :param int nframes:  number of frames in each window
+        :param int overlap:  number of frames by which consecutive windows overlap
+        """
+        if nframes < 1 or not 0 <= overlap < nframes:
+            raise ValueError('Expected nframes >= 1 and 0 <= overlap < nframes')
+        sampwidth, nchannels, total = self._frame_format()
+        framesize = sampwidth * nchannels
+        step = nframes - overlap
+
+        if self._loaded_wav_data():
+            # already in memory, so just return views
+            samples = self.frames()
+            start = 0
+            while start < total:
+                yield samples[start:start + nframes]
+                if start + nframes >= total:
+                    break
+                start += step
+            return
+
+        with self._open_source() as f:
+            start = 0
+            while start < total:
+                n = min(nframes, total - start)
+                buf = _pread(f, self._wav_data_offset + start * framesize, n * framesize)
+                yield self._samples(buf, nchannels, sampwidth)
+                if start + n >= total:
+                    break
+                start += step
+
+    def extract(self, filename: str, start: float, end: 'Optional[float]' = None) -> 'GuanoFile':
+        """
+        Write a time range of this recording to a new .WAV file.
+
+        Only the needed byte range of the `data` subchunk is copied, directly from our file, so
+        the recording is never loaded into memory. The new file carries over all our metadata,
+        with its `Timestamp` shifted to the start of the range and its `Length` recomputed. If
+        we have a `Checksum|Data` field, the new file gets a checksum of its own audio data, using
+        the same algorithm, computed as the audio data is copied.
+
+        Times are seconds of real time (accounting for `TE`) from the start of the recording,
+        and are rounded to the nearest frame.
+
+        :param str filename:  path of the new .WAV file
+        :param float start:  start time of the range
+        :param float end:  end time of the range (default: end of recording)
+        :return:  the new file
+        :raises ValueError:  if the time range doesn't contain any audio data
+        """
+        sampwidth, nchannels, nframes = self._frame_format()
+        te = self.get('TE', 1)
+        if not isinstance(te, (int, float)) or te <= 0:
+            te = 1
+        rate = float(self.wav_params.framerate * te)  # frames per second of real time
+        first = max(0, int(round(start * rate)))
+        last = nframes if end is None else min(nframes, int(round(end * rate)))
+        if first >= last:
+            raise ValueError('Time range %s-%s contains no audio data' % (start, end))
+        framesize = sampwidth * nchannels
+        size = (last - first) * framesize
+
+        clip = GuanoFile(strict=self.strict_mode, registry=self.registry)
+        clip.update((key, value) for key, value in self.items() if key != CHECKSUM_KEY)  # not our audio's
+        timestamp = self.get('Timestamp')
+        if isinstance(timestamp, datetime):
+            clip['Timestamp'] = timestamp + timedelta(seconds=first / rate)
+        clip['Length'] = (last - first) / rate
+        md_bytes = clip.serialize()
+        checksum = (self.get(CHECKSUM_KEY) or '').partition(':')[0]
+        hasher = _new_hash(checksum) if checksum else None
+
+        rf64 = size + len(md_bytes) + (256 if checksum else 128) > _MAX_CHUNK_SIZE
+        with open(filename, 'wb') as out:
+            out.write(_wav_header(nchannels, sampwidth, self.wav_params.framerate, size, rf64))
+            data = self._loaded_wav_data()
+            if data:
+                data = memoryview(data)[first * framesize:last * framesize]
+                out.write(data)
+                if hasher:
+                    hasher.update(data)
+            else:
+                with self._open_source() as src:
+                    _copy_range(src, out, self._wav_data_offset + first * framesize, size, hasher=hasher)
+            if size % 2:
+                out.write(b'\0')  # align to 16-bit boundary
+            if hasher:
+                clip[CHECKSUM_KEY] = '%s:%s' % (checksum, hasher.hexdigest())
+                md_bytes = clip.serialize()
+            out.write(_chunkhdr.pack(b'guan', len(md_bytes)))
+            out.write(md_bytes)
+            _patch_riff_size(out, out.tell(), rf64)
+
+        return GuanoFile(filename, strict=self.strict_mode, registry=self.registry)
+
+    def write(self, make_backup=True, rf64: 'Optional[bool]' = None, checksum: 'Optional[str]' = None,
+              durability: 'Union[Durability, str, None]' = None) -> bool:
+        """
+        Write the GUANO .WAV file to disk. Files which are unmodified since being loaded (see
+        :attr:`modified`) are not rewritten.
+
+        Unless `wav_data` has been loaded or replaced, the audio data is streamed directly from
+        our original file rather than being read into memory. A file object which this
+        `GuanoFile` was created with is closed once the file has been replaced, and later reads
+        use our `filename`.
 
         :param bool make_backup:  create a backup file copy before writing changes or not (default: True);
                                   backups will be saved to a folder named `GUANO_BACKUP`
+        :param bool rf64:  write an RF64 file rather than RIFF; by default, RF64 is used only if the
+                           file would exceed the 4 GB limit of RIFF
+        :param str checksum:  record a checksum of the audio data in the `Checksum|Data` field,
+                              using this algorithm (see :meth:`audio_digest`); the audio is hashed
+                              as it is written, without reading it again. A file which already has
+                              a checksum keeps it up to date when its audio is changed.
+        :param durability:  a :class:`Durability` policy, or the name of a policy (`none` or
+                            `per-file`), for flushing the written file to stable storage
+        :return:  whether the file was written
         :raises ValueError:  if this `GuanoFile` doesn't represent a valid .WAV by having
             appropriate values for `self.wav_params` (see :meth:`wave.Wave_write.setparams()`)
             and `self.wav_data` (see :meth:`wave.Wave_write.writeframes()`)
@@ -465,36 +1676,84 @@ class GuanoFile(object):
 
         if not self.filename:
             raise ValueError('Cannot write .WAV file without a self.filename!')
+        if self.partial:
+            raise ValueError('Cannot write .WAV file which was loaded with only selected fields or namespaces')
+        durability = _durability(durability)
+        recorded = self.get(CHECKSUM_KEY) or ''
+        if checksum is None and recorded and self._wav_data_modified:
+            checksum = recorded.partition(':')[0]  # keep an existing checksum up to date
+        if checksum and not recorded.startswith(checksum + ':'):
+            self._dirty.add(('Checksum', 'Data'))  # adding a checksum is itself a modification
+        elif checksum and not self._wav_data_modified:
+            checksum = None  # the existing checksum is still valid for our unchanged audio
+        if not self.modified:
+            log.debug('Skipping write of unmodified file: %s', self.filename)
+            return False
+        if self.sidecar:
+            if self._wav_data_modified:
+                raise ValueError('Cannot save changed audio data to a sidecar file')
+            if checksum:
+                self[CHECKSUM_KEY] = '%s:%s' % (checksum, self.audio_digest(checksum))
+            self._write_sidecar(durability)
+            return True
         if not self.wav_params:
             raise ValueError('Cannot write .WAV file without appropriate self.wav_params (see `wavfile.setparams()`)')
-        if not self.wav_data:
+        if not self._wav_data_size:
             raise ValueError('Cannot write .WAV file without appropriate self.wav_data (see `wavfile.writeframes()`)')
 
         # prepare our metadata for a byte-wise representation
         md_bytes = self.serialize()
-
-        # create tempfile and write our vanilla .WAV ('data' sub-chunk only)
-        tempfile = NamedTemporaryFile(mode='w+b', prefix='guano_temp-', suffix='.wav', delete=False)
-        if os.path.isfile(self.filename):
-            shutil.copystat(self.filename, tempfile.name)
-
-        with closing(wave.Wave_write(tempfile)) as wavfile:
-            wavfile.setparams(self.wav_params)
-            wavfile.writeframes(self.wav_data)
-
-        # add the 'guan' sub-chunk after the 'data' sub-chunk
-        tempfile.write(_chunkid.pack(b'guan'))
-        tempfile.write(_chunksz.pack(len(md_bytes)))
-        tempfile.write(md_bytes)
-
-        # fix the RIFF file length
-        total_size = tempfile.tell()
-        tempfile.seek(0x04)
-        tempfile.write(_chunksz.pack(total_size - 8))
-        tempfile.close()
-
-        # verify it by re-parsing the new version
-        GuanoFile(tempfile.name)
+        size = self._wav_data_size
+        if rf64 is None:
+            rf64 = size + len(md_bytes) + (256 if checksum else 128) > _MAX_CHUNK_SIZE
+        hasher = _new_hash(checksum) if checksum else None
+
+        import shutil
+        from tempfile import NamedTemporaryFile
+
+        # create tempfile alongside the original, so that it can be renamed into place rather than
+        # copied across filesystems; it's hidden, and not named .wav, so scans will ignore it
+        dirname, basename = os.path.split(os.path.abspath(self.filename))
+        tempfile = NamedTemporaryFile(mode='w+b', dir=dirname, prefix='.%s.' % basename, suffix='.guano_tmp',
+                                      delete=False)
+        try:
+            if os.path.isfile(self.filename):
+                shutil.copystat(self.filename, tempfile.name)
+
+            params = self.wav_params
+            tempfile.write(_wav_header(params.nchannels, params.sampwidth, params.framerate, size, rf64))
+            wav_data_offset = tempfile.tell()
+            data = self._loaded_wav_data()
+            if data:
+                tempfile.write(data)
+                if hasher:
+                    hasher.update(data)
+            else:
+                with self._open_source() as src:
+                    _copy_range(src, tempfile, self._wav_data_offset, size, hasher=hasher)
+            if size % 2:
+                tempfile.write(b'\0')  # align to 16-bit boundary
+            if hasher:
+                # the 'guan' sub-chunk follows the audio, so its checksum can still be included
+                self[CHECKSUM_KEY] = '%s:%s' % (checksum, hasher.hexdigest())
+                md_bytes = self.serialize()
+
+            # add the 'guan' sub-chunk after the 'data' sub-chunk
+            tempfile.write(_chunkhdr.pack(b'guan', len(md_bytes)))
+            tempfile.write(md_bytes)
+
+            # fix the RIFF file length
+            _patch_riff_size(tempfile, tempfile.tell(), rf64)
+            if durability:
+                durability.sync_file(tempfile)
+            tempfile.close()
+
+            # verify it by re-parsing the new version
+            GuanoFile(tempfile.name)
+        except BaseException:
+            tempfile.close()
+            os.remove(tempfile.name)
+            raise
 
         # finally overwrite the original with our new version (and optionally back up first)
         if make_backup and os.path.exists(self.filename):
@@ -505,8 +1764,625 @@ class GuanoFile(object):
                 os.mkdir(backup_dir)
             if os.path.exists(backup_file):
                 os.remove(backup_file)
-            shutil.move(self.filename, backup_file)
-        shutil.move(tempfile.name, self.filename)
+            try:
+                os.link(self.filename, backup_file)  # so the original stays in place until it's replaced
+            except OSError:
+                shutil.copy2(self.filename, backup_file)
+        os.replace(tempfile.name, self.filename)
+        if self._file is not None:
+            # our file object is still open on the replaced file, whose layout no longer matches
+            self._file.close()
+            self._file = None
+        if self.file_pool is not None:
+            self.file_pool.discard(self.filename)
+        if durability:
+            durability.commit(self.filename)
+
+        # our in-memory state now reflects what's on disk
+        self._raw_md = bytes(md_bytes)
+        self._loaded_state = self.filename, self.wav_params
+        self._wav_data_offset = wav_data_offset
+        self._dirty.clear()
+        self._wav_data_modified = False
+        st = os.stat(self.filename)
+        self._source_identity = st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns
+        if self._wav_data is not None and self.audio_cache is not None:
+            if self.audio_cache.put(self._audio_cache_key(), self._wav_data):
+                self._wav_data = None  # rather than holding it forever
+        self._embedded_keys = set((ns, k) for ns, data in self._md.items() for k in data)
+        self._sidecar_loaded = False
+        return True
+
+    def _write_sidecar(self, durability: 'Optional[Durability]' = None):
+        """Write our metadata to our sidecar file, rather than rewriting the .WAV file"""
+        lines = [self.to_string()]
+        # embedded fields which we've deleted are written with an empty value
+        for namespace, key in sorted(self._embedded_keys):
+            if namespace not in self._md or key not in self._md[namespace]:
+                lines.append('%s|%s:' % (namespace, key) if namespace else '%s:' % key)
+        fname = sidecar_filename(self.filename)
+        with open(fname + '.tmp', 'wb') as f:
+            f.write('\n'.join(lines).encode('utf-8'))
+            if durability:
+                durability.sync_file(f)
+        os.replace(fname + '.tmp', fname)
+        if durability:
+            durability.commit(fname)
+        self._loaded_state = self.filename, self.wav_params
+        self._dirty.clear()
+        self._sidecar_loaded = True
+
+
+class edit(object):
+    """
+    Edit a .WAV file's GUANO metadata as a transaction: changes made within the `with` block
+    are written when it exits normally, replacing the file in a single step, and are discarded
+    if it raises an exception::
+
+        with guano.edit('myfile.wav') as g:
+            g['Species Manual ID'] = 'Mylu'
+
+    :param str path:  the .WAV file to edit
+    :param durability:  a :class:`Durability` policy, or the name of a policy, for flushing the
+                        written file to stable storage
+    :param bool make_backup:  see :meth:`GuanoFile.write`
+    :param str checksum:  see :meth:`GuanoFile.write`
+    :param kwargs:  passed on to :class:`GuanoFile`, like `strict` or `sidecar`
+    :ivar bool written:  whether the transaction's changes were written, once it has exited
+    """
+
+    def __init__(self, path: str, durability: 'Union[Durability, str, None]' = None, make_backup=True,
+                 checksum: 'Optional[str]' = None, **kwargs):
+        self.path = path
+        self.durability = _durability(durability)
+        self.make_backup = make_backup
+        self.checksum = checksum
+        self.kwargs = kwargs
+        self.gfile = None
+        self.written = False
+
+    def __enter__(self) -> 'GuanoFile':
+        self.gfile = GuanoFile(self.path, **self.kwargs)
+        return self.gfile
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None:
+                self.written = self.gfile.write(make_backup=self.make_backup, checksum=self.checksum,
+                                                durability=self.durability)
+            else:
+                log.debug('Discarding changes to %s after %s', self.path, exc_type.__name__)
+        finally:
+            self.gfile.close()
+
+
+def iter_wav_paths(paths: 'Union[str, Iterable[str]]') -> 'Iterable[str]':
+    """
+    Iterate over the paths of .WAV files, recursively descending into any directories.
+
+    :param paths:  a file or directory path, or an iterable of them
+    """
+    if isinstance(paths, str):
+        paths = [paths]
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirnames, filenames in os.walk(path):
+                dirnames[:] = sorted(d for d in dirnames if d != 'GUANO_BACKUP')
+                for filename in sorted(filenames):
+                    if filename.lower().endswith('.wav'):
+                        yield os.path.join(root, filename)
+        else:
+            yield path
+
+
+def _parallel_map(function: 'Callable', items: 'Iterable', workers: 'Optional[int]' = None) -> 'Iterable':
+    """
+    Like the builtin :func:`map`, but calls `function` concurrently from a pool of threads.
+    Results are produced in order, and only a bounded number of `items` are consumed ahead.
+    """
+    if workers == 1:
+        for item in items:
+            yield function(item)
+        return
+    from concurrent.futures import ThreadPoolExecutor
+    workers = workers or min(32, (os.cpu_count() or 1) + 4)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = []
+        for item in items:
+            pending.append(executor.submit(function, item))
+            if len(pending) >= workers * 4:
+                yield pending.pop(0).result()
+        for future in pending:
+            yield future.result()
+
+
+def _load_or_none(args) -> 'Optional[GuanoFile]':
+    fname, strict = args
+    if not os.path.isfile(fname):
+        log.debug('Skipping %s: not a file', fname)
+        return None
+    try:
+        return GuanoFile(fname, strict=strict)
+    except (ValueError, EnvironmentError) as e:
+        log.debug('Skipping %s: %s', fname, e)
+        return None
+
+
+def scan(paths: 'Union[str, Iterable[str]]', strict=False, workers: 'Optional[int]' = None) -> 'Iterable[GuanoFile]':
+    """
+    Load many .WAV files concurrently, skipping any which can't be read.
+
+    :param paths:  a file or directory path, or an iterable of them; directories are searched recursively
+    :param bool strict:  whether files are parsed in strict mode (files which fail are skipped)
+    :param int workers:  number of concurrent worker threads (default: based on CPU count)
+    :return:  iterable of :class:`GuanoFile`, in the same order as `paths`
+    """
+    items = ((fname, strict) for fname in iter_wav_paths(paths))
+    for gfile in _parallel_map(_load_or_none, items, workers):
+        if gfile is not None:
+            yield gfile
+
+
+def _is_wav_member(name: str) -> bool:
+    """Whether an archive member name looks like a .WAV file, excluding backups"""
+    return name.lower().endswith('.wav') and 'GUANO_BACKUP' not in name.split('/')[:-1]
+
+
+class _ArchiveMember(object):
+    """
+    Minimal read-only file-like view of a member of a zip or tar archive.
+
+    If `offset` is given, the member is stored uncompressed at that offset within the archive
+    file `f`, and reads are simply reads of the archive. Otherwise `f` is a stream of the
+    member's (decompressed) contents which we can only read forwards, skipping over data by
+    reading and discarding it. Seeking is lazy in both cases, so that seeking to the end of
+    the member to learn its size is free.
+    """
+
+    def __init__(self, f: 'BinaryIO', size: int, offset: 'Optional[int]' = None):
+        self._f = f
+        self._size = size
+        self._offset = offset
+        self._pos = 0
+        self._stream_pos = 0
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        if whence == 1:
+            offset += self._pos
+        elif whence == 2:
+            offset += self._size
+        self._pos = max(0, offset)
+        return self._pos
+
+    def tell(self) -> int:
+        return self._pos
+
+    def read(self, n: int = -1) -> bytes:
+        n = self._size - self._pos if n < 0 else max(0, min(n, self._size - self._pos))
+        if self._offset is not None:
+            buf = _pread(self._f, self._offset + self._pos, n)
+        else:
+            if self._pos < self._stream_pos:
+                raise ValueError('Cannot seek backwards within a compressed archive member')
+            while self._stream_pos < self._pos:
+                skipped = self._f.read(min(1 << 20, self._pos - self._stream_pos))
+                if not skipped:
+                    break
+                self._stream_pos += len(skipped)
+            buf = self._f.read(n)
+            self._stream_pos += len(buf)
+        self._pos += len(buf)
+        return buf
+
+
+def _load_archive_member(f: '_ArchiveMember', name: str, strict=False) -> 'GuanoFile':
+    """Load the GUANO metadata and .WAV parameters of an archive member, reading front to back"""
+    fsize, rf64 = _check_riff(f)
+    fmt, data_size, metadata = None, None, b''
+    for chunkid, offset, size in _iter_chunks(f, fsize):
+        if chunkid == b'fmt ':
+            fmt = _pread(f, offset, min(size, 40))
+        elif chunkid == b'data':
+            data_size = size
+        elif chunkid == b'guan':
+            metadata = _pread(f, offset, size)
+    if fmt is None or data_size is None:
+        raise ValueError('No FMT or DATA sub-chunk found in .WAV file')
+
+    gfile = GuanoFile(strict=strict)
+    gfile.filename = name
+    gfile.wav_params = _parse_fmt(fmt, data_size)
+    gfile._parse(metadata)
+    gfile._raw_md = metadata
+    return gfile
+
+
+def _iter_zip_members(archive: str, raw: 'BinaryIO') -> 'Iterable[Tuple[str, _ArchiveMember]]':
+    import zipfile
+    with zipfile.ZipFile(raw) as zf:
+        for info in zf.infolist():
+            if info.is_dir() or not _is_wav_member(info.filename):
+                continue
+            name = os.path.join(archive, info.filename)
+            if info.flag_bits & 0x1:
+                log.debug('Skipping %s: encrypted', name)
+                continue
+            if info.compress_type == zipfile.ZIP_STORED:
+                # the local file header's "extra" field may differ from the central directory's
+                name_len, extra_len = struct.unpack('< H H', _pread(raw, info.header_offset + 26, 4))
+                offset = info.header_offset + 30 + name_len + extra_len
+                yield name, _ArchiveMember(raw, info.file_size, offset)
+            else:
+                with zf.open(info) as member:
+                    yield name, _ArchiveMember(member, info.file_size)
+
+
+def _iter_tar_members(archive: str, raw: 'BinaryIO') -> 'Iterable[Tuple[str, _ArchiveMember]]':
+    import tarfile
+    try:
+        tf = tarfile.open(fileobj=raw, mode='r:')
+        stream = False
+    except tarfile.ReadError:
+        raw.seek(0)
+        tf = tarfile.open(fileobj=raw, mode='r|*')  # compressed, so we can only read it front to back
+        stream = True
+    with tf:
+        for info in tf:
+            if not info.isreg() or not _is_wav_member(info.name):
+                continue
+            name = os.path.join(archive, info.name)
+            if not stream and not info.issparse():
+                yield name, _ArchiveMember(raw, info.size, info.offset_data)
+            else:
+                yield name, _ArchiveMember(tf.extractfile(info), info.size)
+
+
+def scan_archive(archive: str, strict=False) -> 'Iterable[GuanoFile]':
+    """
+    Load the GUANO metadata of the .WAV files within a zip or tar archive, without extracting them.
+
+    Members which are stored uncompressed (in a zip file or plain tar file) are read in place,
+    seeking past their audio data, so that scanning even a very large archive reads only a few
+    kilobytes per file. Compressed members must be streamed through, but are never written to
+    disk.
+
+    The resulting :class:`GuanoFile` objects have a `filename` like `archive.zip/path/file.wav`,
+    and their `wav_data` is not available.
+
+    :param str archive:  path to a zip or tar archive; tar archives may be compressed
+    :param bool strict:  whether files are parsed in strict mode (files which fail are skipped)
+    :return:  iterable of :class:`GuanoFile`, in the order they're stored in the archive
+    :raises ValueError:  if the file isn't a zip or tar archive
+    """
+    import tarfile
+    import zipfile
+    with open(archive, 'rb') as raw:
+        if zipfile.is_zipfile(raw):
+            members = _iter_zip_members(archive, raw)
+        else:
+            raw.seek(0)
+            try:
+                tarfile.open(fileobj=raw, mode='r:*').close()
+            except tarfile.TarError:
+                raise ValueError('Expected a zip or tar archive: %s' % archive)
+            raw.seek(0)
+            members = _iter_tar_members(archive, raw)
+        for name, member in members:
+            try:
+                yield _load_archive_member(member, name, strict=strict)
+            except (ValueError, EnvironmentError, zipfile.BadZipFile, tarfile.TarError) as e:
+                log.debug('Skipping %s: %s', name, e)
+
+
+INDEX_FILENAME = '.guano_index.jsonl'
+
+
+def read_index(fname: str) -> 'Dict[str, dict]':
+    """
+    Read a GUANO metadata index file, as written by :func:`write_index`.
+
+    :param fname:  path to the index file
+    :return:  a mapping of absolute file path to its index entry, a dict with keys `path`,
+              `size`, `mtime`, and `guano` (the metadata as produced by :meth:`GuanoFile.to_string`)
+    """
+    import json
+    index = {}
+    basedir = os.path.dirname(os.path.abspath(fname))
+    with open(fname, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            index[os.path.normpath(os.path.join(basedir, entry['path']))] = entry
+    return index
+
+
+def write_index(fname: str, gfiles: 'Iterable[GuanoFile]', append=False) -> int:
+    """
+    Write the metadata of many files to a GUANO metadata index file.
+
+    The index is a JSON Lines file with one entry per .WAV file, recording the file's size and
+    modification time so that stale entries may be detected. File paths are stored relative to
+    the index file.
+
+    :param fname:  path to the index file
+    :param gfiles:  iterable of :class:`GuanoFile` which represent files on disk
+    :param bool append:  append to an existing index rather than overwriting it
+    :return:  number of entries written
+    """
+    import json
+    basedir = os.path.dirname(os.path.abspath(fname))
+    count = 0
+    with open(fname, 'a' if append else 'w', encoding='utf-8') as f:
+        for gfile in gfiles:
+            st = os.stat(gfile.filename)
+            entry = {
+                'path': os.path.relpath(os.path.abspath(gfile.filename), basedir),
+                'size': st.st_size,
+                'mtime': st.st_mtime,
+                'guano': gfile.to_string(),
+            }
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            count += 1
+    return count
+
+
+def is_index_current(entry: dict, st: os.stat_result) -> bool:
+    """Whether an index entry still reflects the file with the specified :func:`os.stat` result"""
+    return entry['size'] == st.st_size and entry['mtime'] == st.st_mtime
+
+
+def read_indexes(paths: 'Union[str, Iterable[str]]', index_fname: 'Optional[str]' = None) -> 'Dict[str, dict]':
+    """
+    Read the metadata index to use for some paths: the specified index file, or else the default
+    index file (named :data:`INDEX_FILENAME`, as built by `guano_index.py`) of any directories
+    among `paths`. Pass it to :func:`read_guano_chunk` to skip reading unchanged files.
+
+    :param paths:  a file or directory path, or an iterable of them
+    :param str index_fname:  an explicit index file to read instead
+    :return:  a mapping of absolute file path to its index entry, as for :func:`read_index`
+    """
+    if isinstance(paths, str):
+        paths = [paths]
+    index = {}
+    fnames = [index_fname] if index_fname else \
+        [os.path.join(path, INDEX_FILENAME) for path in paths if os.path.isdir(path)]
+    for fname in fnames:
+        if os.path.isfile(fname):
+            index.update(read_index(fname))
+    return index
+
+
+def read_cache(fname: str, **fields) -> 'Dict[str, dict]':
+    """
+    Read a cache of per-file entries, as written by :func:`write_cache`.
+
+    :param fname:  path to the cache file
+    :param fields:  only entries written with these same `fields` are read, so that entries
+                    computed with other settings are ignored
+    :return:  a mapping of absolute file path to its entry, which is empty if there's no cache file
+    """
+    if not os.path.isfile(fname):
+        return {}
+    return dict((path, entry) for path, entry in read_index(fname).items()
+                if all(entry.get(k) == v for k, v in fields.items()))
+
+
+def write_cache(fname: str, cache: 'Dict[str, dict]', **fields):
+    """
+    Write a cache of per-file entries, such as digests or summaries of their metadata, which is
+    kept up to date with :func:`update_cache`. It's a JSON Lines file like a metadata index (see
+    :func:`write_index`), with paths relative to it, and is replaced in a single step.
+
+    :param fname:  path to the cache file
+    :param cache:  mapping of absolute file path to its entry
+    :param fields:  added to every entry, to be matched by :func:`read_cache`
+    """
+    import json
+    basedir = os.path.dirname(os.path.abspath(fname))
+    with open(fname + '.tmp', 'w', encoding='utf-8') as f:
+        for path, entry in sorted(cache.items()):
+            entry = dict(entry, path=os.path.relpath(path, basedir), **fields)
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+    os.replace(fname + '.tmp', fname)
+
+
+def update_cache(cache: 'Dict[str, dict]', paths: 'Union[str, Iterable[str]]', read: 'Callable[[str], Optional[dict]]',
+                 workers: 'Optional[int]' = None) -> 'Iterable[Tuple[str, Optional[dict], bool]]':
+    """
+    Find the .WAV files under `paths`, and the changes which would bring a cache of per-file
+    entries up to date with them. Only files which are new, or have changed since they were
+    cached (by their size and modification time), are read again, concurrently. The cache
+    itself isn't modified, so that callers may also update anything derived from it.
+
+    :param cache:  mapping of absolute file path to its entry, as read by :func:`read_cache`
+    :param paths:  a file or directory path, or an iterable of them; directories are searched recursively
+    :param read:  function called with the path of a new or changed file, which returns its new
+                  entry (to which the file's `size` and `mtime` are added), or `None` if the
+                  file can't be read
+    :param int workers:  number of concurrent worker threads
+    :return:  iterable of (path, entry, changed) for each file found, with the cached entry if
+              it's current, or else the new entry (`None` if the file couldn't be read); then
+              (absolute path, `None`, `True`) for each cached file which no longer exists
+    """
+    def check(fname):
+        try:
+            st = os.stat(fname)
+        except EnvironmentError as e:
+            log.debug('Skipping %s: %s', fname, e)
+            return fname, None, False
+        entry = cache.get(os.path.abspath(fname))
+        if entry is not None and is_index_current(entry, st):
+            return fname, entry, False
+        entry = read(fname)
+        if entry is None:
+            return fname, None, False
+        return fname, dict(entry, size=st.st_size, mtime=st.st_mtime), True
+
+    found = set()
+    for fname, entry, changed in _parallel_map(check, iter_wav_paths(paths), workers):
+        found.add(os.path.abspath(fname))
+        yield fname, entry, changed
+    for path in [path for path in cache if path not in found and not os.path.exists(path)]:
+        yield path, None, True
+
+
+class RangeFile(object):
+    """
+    A read-only, seekable file-like object over a remote file which is fetched by byte ranges,
+    for reading GUANO metadata from HTTP servers or object storage with few round trips.
+
+    The head and tail of the file, where .WAV headers and the `guan` subchunk usually live,
+    are prefetched when opened. Data is fetched in whole blocks; the missing blocks of each read
+    are coalesced into a single request, and fetched blocks are cached with LRU eviction.
+
+    Subclasses implement :meth:`_fetch`. See :class:`HTTPRangeFile`.
+
+    :ivar int requests:  number of fetch requests made
+    :ivar int bytes_fetched:  total number of bytes fetched
+    """
+
+    def __init__(self, name: 'Optional[str]' = None, block_size: int = 64 * 1024, cache_blocks: int = 64,
+                 prefetch: int = 64 * 1024):
+        """
+        :param str name:  name of the remote file, such as its URL
+        :param int block_size:  size in bytes of the blocks which are fetched and cached
+        :param int cache_blocks:  maximum number of blocks to cache
+        :param int prefetch:  number of bytes to prefetch from the head and tail of the file
+        """
+        self.name = name
+        self.block_size = block_size
+        self.cache_blocks = cache_blocks
+        self.requests = 0
+        self.bytes_fetched = 0
+        self.closed = False
+        self._size = None
+        self._pos = 0
+        self._cache = OrderedDict()  # block index -> bytes
+
+        nblocks = max(1, -(-prefetch // block_size))
+        self._fetch_blocks(0, nblocks - 1)  # this also tells us the file size
+        if self._size is None:
+            raise ValueError('Unable to determine the size of remote file %s' % name)
+        if prefetch and self._size > nblocks * block_size:
+            last = (self._size - 1) // block_size
+            self._fetch_blocks(max(nblocks, last - nblocks + 1), last)
+
+    def _fetch(self, start: int, end: int) -> 'Tuple[bytes, Optional[int]]':
+        """
+        Fetch the bytes in range [start, end) of the remote file, which may be fewer if the
+        range extends beyond the end of the file.
+
+        :return:  tuple of (the bytes, total size of the remote file if known)
+        """
+        raise NotImplementedError()
+
+    def _fetch_blocks(self, first: int, last: int) -> 'Dict[int, bytes]':
+        """Fetch the range of blocks `first` to `last` inclusive with a single request, and cache them"""
+        bs = self.block_size
+        end = (last + 1) * bs if self._size is None else min((last + 1) * bs, self._size)
+        data, size = self._fetch(first * bs, end)
+        self.requests += 1
+        self.bytes_fetched += len(data)
+        if size is not None:
+            self._size = size
+        elif self._size is None and len(data) < end - first * bs:
+            self._size = first * bs + len(data)  # we've reached the end of the file
+        blocks = {}
+        for i in range(first, last + 1):
+            blocks[i] = data[(i - first) * bs:(i - first + 1) * bs]
+            self._cache[i] = blocks[i]
+            self._cache.move_to_end(i)
+        while len(self._cache) > self.cache_blocks:
+            self._cache.popitem(last=False)
+        return blocks
+
+    def read(self, n: int = -1) -> bytes:
+        size = self._size
+        end = size if n is None or n < 0 else min(self._pos + n, size)
+        if self._pos >= end:
+            return b''
+        bs = self.block_size
+        first, last = self._pos // bs, (end - 1) // bs
+        blocks = {}
+        for i in range(first, last + 1):
+            if i in self._cache:
+                self._cache.move_to_end(i)
+                blocks[i] = self._cache[i]
+        missing = [i for i in range(first, last + 1) if i not in blocks]
+        if missing:
+            blocks.update(self._fetch_blocks(missing[0], missing[-1]))
+        buf = b''.join(blocks[i] for i in range(first, last + 1))
+        start = self._pos - first * bs
+        self._pos = end
+        return buf[start:end - first * bs]
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        if whence == 1:
+            offset += self._pos
+        elif whence == 2:
+            offset += self._size
+        if offset < 0:
+            raise ValueError('Negative seek position %d' % offset)
+        self._pos = offset
+        return offset
+
+    def tell(self) -> int:
+        return self._pos
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def close(self):
+        self._cache.clear()
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excinfo):
+        self.close()
+
+    def __repr__(self) -> str:
+        return '%s(%s)' % (self.__class__.__name__, self.name)
+
+
+class HTTPRangeFile(RangeFile):
+    """
+    A :class:`RangeFile` which reads a remote file over HTTP(S) with `Range` requests.
+
+    Example usage::
+
+        with HTTPRangeFile('https://example.org/recordings/myfile.wav') as f:
+            gfile = GuanoFile(f)
+            print(gfile['Species Manual ID'], f.requests, f.bytes_fetched)
+    """
+
+    def __init__(self, url: str, headers: 'Optional[dict]' = None, timeout: float = 30, **kwargs):
+        """
+        :param str url:  URL of the remote file
+        :param dict headers:  additional HTTP request headers, such as for authorization
+        :param float timeout:  timeout in seconds for each request
+        :param kwargs:  see :class:`RangeFile`
+        """
+        self.url = url
+        self.headers = dict(headers or {})
+        self.timeout = timeout
+        RangeFile.__init__(self, name=url, **kwargs)
+
+    def _fetch(self, start: int, end: int) -> 'Tuple[bytes, Optional[int]]':
+        from urllib.request import Request, urlopen
+        headers = dict(self.headers, Range='bytes=%d-%d' % (start, end - 1))
+        with urlopen(Request(self.url, headers=headers), timeout=self.timeout) as response:
+            data = response.read()
+            if response.status != 206:  # server ignored our range and sent the whole file
+                return data[start:end], len(data)
+            content_range = response.headers.get('Content-Range', '')
+            total = content_range.rsplit('/', 1)[-1]
+            return data, int(total) if total.isdigit() else None
 
 
 class nullcontext():
@@ -521,6 +2397,3 @@ class nullcontext():
     def __exit__(self, *excinfo):
         pass
 
-
-# prevents a warning if application-level code doesn't configure logging
-log.addHandler(logging.NullHandler())
@@ -0,0 +1,212 @@
+"""
+The `guano` commandline tool, a single entry point to the GUANO utilities.
+
+Each subcommand runs one of the utility scripts (see :doc:`utils`), which are only imported
+when their subcommand is used, so starting `guano` costs little more than starting Python.
+
+usage::
+
+    $> guano [-0] SUBCOMMAND [ARGS...]
+
+    # equivalent to `guano_dump.py --strict recording.wav`
+    $> guano dump --strict recording.wav
+
+    # convert SonoBat files to GUANO, equivalent to `sb2guano.py *.wav`
+    $> guano convert sb *.wav
+
+In place of file paths, a single `-` argument reads paths from stdin, one per line (or
+NUL-delimited, with `-0`). Paths are processed in batches within a single process, so
+feeding many thousands of paths from another tool avoids starting Python for each file::
+
+    $> find ~/bat_calls/ -name '*.wav' -newer last_run | guano dump -
+    $> guano query -0 -w "Species Auto ID = Epfu" ~/bat_calls/ | guano -0 edit "Note: Auto-ID'd" -
+"""
+
+from __future__ import print_function
+
+import os
+import os.path
+import sys
+
+
+# subcommand -> (script, description); the script is only found and imported when it's run
+SUBCOMMANDS = {
+    'dump': ('guano_dump.py', 'print the GUANO metadata of files'),
+    'edit': ('guano_edit.py', 'change the GUANO metadata of files'),
+    'query': ('guano_query.py', 'find files whose metadata matches some conditions'),
+    'geo': ('guano_geo.py', 'find files within a bounding box or radius, or nearest a position'),
+    'validate': ('guano_validate.py', 'check the metadata of many files and report failures'),
+    'activity': ('guano_activity.py', 'report passes per species, per night, per site'),
+    'index': ('guano_index.py', 'build a metadata index of a directory'),
+    'watch': ('guano_watch.py', 'watch directories and ingest the metadata of new files'),
+    'triage': ('guano_triage.py', 'compute and cache audio statistics for triaging recordings'),
+    'split': ('guano_split.py', 'cut recordings into shorter clips'),
+    'dedupe': ('guano_dedupe.py', 'find recordings with identical audio data'),
+    'verify': ('guano_verify.py', 'check the audio data of files against their embedded checksums'),
+    'compact': ('guano_compact.py', 'embed sidecar metadata files into their .WAV files'),
+    'disperse': ('disperse.py', 'move files to folders by their species field'),
+    'convert': (None, 'convert vendor metadata to GUANO, with a FORMAT of: %s'),
+}
+
+# `convert` format -> script
+CONVERTERS = {
+    'batlogger': 'batlogger2guano.py',
+    'd500x': 'd500x2guano.py',
+    'sb': 'sb2guano.py',
+    'wamd': 'wamd2guano.py',
+}
+
+STDIN_PATHS = '-'
+BATCH_SIZE = 1000  # max paths passed to a subcommand at a time when reading them from stdin
+
+
+def _usage(file=None):
+    file = file or sys.stdout
+    print('usage: guano [-0] SUBCOMMAND [ARGS...]', file=file)
+    print(file=file)
+    print('subcommands:', file=file)
+    for name in sorted(SUBCOMMANDS):
+        description = SUBCOMMANDS[name][1]
+        if name == 'convert':
+            name, description = 'convert FORMAT', description % ', '.join(sorted(CONVERTERS))
+        print('  %-16s %s' % (name, description), file=file)
+    print(file=file)
+    print('Use `guano SUBCOMMAND --help` for help with a subcommand. In place of file paths,', file=file)
+    print('a `-` argument reads paths from stdin, one per line (NUL-delimited with `-0`).', file=file)
+
+
+def find_script(script):
+    """
+    Find the path of a utility script: alongside the running `guano` tool (where they're
+    installed), in the `bin` directory of a source checkout, or in Python's scripts directory.
+    """
+    dirs = [os.path.dirname(os.path.abspath(sys.argv[0])),
+            os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bin')]
+    for d in dirs:
+        if os.path.isfile(os.path.join(d, script)):
+            return os.path.join(d, script)
+    import sysconfig
+    fname = os.path.join(sysconfig.get_path('scripts'), script)
+    if os.path.isfile(fname):
+        return fname
+    raise ValueError('Cannot find the %s script' % script)
+
+
+def load_script(script):
+    """Import a utility script as a module, without running its commandline interface"""
+    import importlib.util
+    name = os.path.splitext(script)[0]
+    if name in sys.modules:
+        return sys.modules[name]
+    fname = find_script(script)
+    scriptdir = os.path.dirname(fname)
+    if scriptdir not in sys.path:
+        sys.path.insert(0, scriptdir)  # as if the script were run directly
+    spec = importlib.util.spec_from_file_location(name, fname)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def iter_path_batches(stream, null=False, batch_size=BATCH_SIZE):
+    """
+    Read paths from a binary stream like stdin, producing them in lists of up to `batch_size`.
+    A batch is produced early whenever no more input is immediately available, so that slowly
+    arriving paths (eg. from `guano watch`) aren't held back.
+    """
+    sep = b'\0' if null else b'\n'
+    batch, buf = [], b''
+    while True:
+        data = stream.read1(64 * 1024) if hasattr(stream, 'read1') else stream.read(64 * 1024)
+        if not data:
+            break
+        buf += data
+        *paths, buf = buf.split(sep)
+        batch.extend(_decode_path(p, null) for p in paths if p.strip())
+        while len(batch) >= batch_size:
+            yield batch[:batch_size]
+            batch = batch[batch_size:]
+        if batch and not _input_ready(stream):
+            yield batch
+            batch = []
+    if buf.strip():
+        batch.append(_decode_path(buf, null))
+    if batch:
+        yield batch
+
+
+def _decode_path(path, null=False):
+    return os.fsdecode(path if null else path.rstrip(b'\r'))
+
+
+def _input_ready(stream):
+    """Whether more input is immediately available from a stream (assume so if we can't tell)"""
+    try:
+        import select
+        readable, _, _ = select.select([stream], [], [], 0)
+        return bool(readable)
+    except (ImportError, ValueError, OSError, TypeError):
+        return True
+
+
+def run(script, args, prog):
+    """Run a utility script's commandline interface in this process with the specified arguments"""
+    module = load_script(script)
+    argv = sys.argv
+    sys.argv = [prog] + list(args)
+    try:
+        return module.main()
+    finally:
+        sys.argv = argv
+
+
+def main(argv=None):
+    """Commandline interface"""
+    args = list(sys.argv[1:] if argv is None else argv)
+
+    null = False
+    while args and args[0].startswith('-'):
+        opt = args.pop(0)
+        if opt in ('-0', '--null'):
+            null = True
+        elif opt in ('-h', '--help'):
+            _usage()
+            return 0
+        elif opt == '--version':
+            import guano
+            print('guano', guano.__version__)
+            return 0
+        else:
+            print('guano: unknown option %s' % opt, file=sys.stderr)
+            _usage(sys.stderr)
+            return 2
+    if not args or args[0] not in SUBCOMMANDS:
+        if args:
+            print('guano: unknown subcommand %s' % args[0], file=sys.stderr)
+        _usage(sys.stderr)
+        return 2
+
+    subcommand = args.pop(0)
+    script, prog = SUBCOMMANDS[subcommand][0], 'guano ' + subcommand
+    if subcommand == 'convert':
+        if not args or args[0] not in CONVERTERS:
+            print('usage: guano convert FORMAT FILE...  (FORMAT is one of: %s)' % ', '.join(sorted(CONVERTERS)),
+                  file=sys.stderr)
+            return 2
+        fmt = args.pop(0)
+        script, prog = CONVERTERS[fmt], 'guano convert ' + fmt
+
+    if STDIN_PATHS not in args:
+        return run(script, args, prog)
+    args.remove(STDIN_PATHS)
+    stdin = getattr(sys.stdin, 'buffer', sys.stdin)
+    status = 0
+    for batch in iter_path_batches(stdin, null=null):
+        status = run(script, args + batch, prog) or status
+        sys.stdout.flush()
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
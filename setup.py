@@ -23,6 +23,13 @@ setup(
         'Programming Language :: Python :: 3',
     ],
     keywords='bats acoustics metadata guano',
-    py_modules=['guano'],
+    py_modules=['guano', 'guano_cli'],
+    extras_require={
+        'numpy': ['numpy'],
+        'xxhash': ['xxhash'],
+    },
     scripts=glob('bin/*.py'),
+    entry_points={
+        'console_scripts': ['guano = guano_cli:main'],
+    },
 )
@@ -0,0 +1,99 @@
+"""
+Fixtures shared by our unit tests
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from collections import OrderedDict
+from typing import Any
+
+from guano import GuanoFile, wavparams, log, WHITESPACE
+
+
+def write_wav(fname, md, data=b'\x01\x02\x03\x04', params=None, **kwargs):
+    """
+    Write a small .WAV file with the specified GUANO metadata string. By default its audio is
+    mono 16-bit; other `kwargs` are passed to :meth:`GuanoFile.write`.
+    """
+    g = GuanoFile.from_string(md)
+    g.filename = fname
+    g.wav_params = params or wavparams(1, 2, 250000, len(data) // 2, 'NONE', None)
+    g.wav_data = data
+    g.write(make_backup=False, **kwargs)
+    return g
+
+
+class TempDirTestCase(unittest.TestCase):
+    """
+    A test case with its own temporary directory, `self.tmpdir`, which is removed after each test.
+    Subclasses which write their fixture files in `setUp()` must call this one first.
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
+    def path(self, *names):
+        """The path of a file within our temporary directory"""
+        return os.path.join(self.tmpdir, *names)
+
+    def write_wav(self, name, md, *args, **kwargs):
+        """Write a small .WAV file to our temporary directory with :func:`write_wav`, returning its path"""
+        fname = self.path(name)
+        write_wav(fname, md, *args, **kwargs)
+        return fname
+
+
+def coersion_rules(registry):
+    """Flatten a :class:`guano.Registry` to the original map of full key -> coerce function"""
+    return {'%s|%s' % (namespace, key) if namespace else key: function
+            for namespace, table in registry.coercers.items() for key, function in table.items()}
+
+
+class ReferenceParser(object):
+    """
+    The original GUANO metadata parser: `GuanoFile._parse()` and `GuanoFile._coerce()` verbatim
+    from before they were optimized, for differential testing and benchmarking.
+    """
+
+    def __init__(self, coersion_rules, strict=False):
+        self._coersion_rules = coersion_rules
+        self.strict_mode = strict
+        self._md = OrderedDict()
+
+    def _coerce(self, key: str, value: str) -> Any:
+        """Coerce a value from its Unicode representation to a specific data type"""
+        if key in self._coersion_rules:
+            try:
+                return self._coersion_rules[key](value)
+            except (ValueError, TypeError) as e:
+                if self.strict_mode:
+                    raise
+                else:
+                    log.warning('Failed coercing "%s": %s', key, e)
+        return value  # default should already be a Unicode string
+
+    def _parse(self, metadata_str):
+        """Parse metadata and populate our internal mappings"""
+        if not isinstance(metadata_str, str):
+            try:
+                metadata_str = metadata_str.decode('utf-8')
+            except UnicodeDecodeError as e:
+                log.warning('GUANO metadata is not UTF-8 encoded! Attempting to coerce. %s', repr(self))
+                metadata_str = metadata_str.decode('latin-1')
+
+        for line in metadata_str.split('\n'):
+            line = line.strip(WHITESPACE)
+            if not line:
+                continue
+            full_key, val = line.split(':', 1)
+            namespace, key = full_key.split('|', 1) if '|' in full_key else ('', full_key)
+            namespace, key, full_key, val = namespace.strip(), key.strip(), full_key.strip(), val.strip()
+            if not key or not val:
+                continue
+            if namespace not in self._md:
+                self._md[namespace] = OrderedDict()
+            self._md[namespace][key] = self._coerce(full_key, val)
+        return self
@@ -1,9 +1,23 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import hashlib
+import os
+import random
+import struct
+import tarfile
+import threading
 import unittest
+import zipfile
+import zlib
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from datetime import timedelta
 
-from guano import GuanoFile, wavparams, parse_timestamp, tzoffset
+import guano
+from guano import GuanoFile, wavparams, parse_timestamp, tzoffset, iter_fields
+from helpers import write_wav, coersion_rules, ReferenceParser, TempDirTestCase
 
 
 class UnicodeTest(unittest.TestCase):
@@ -190,6 +204,83 @@ class GeneralTest(unittest.TestCase):
         self.assertTrue('Foo|Bar2' in g)
         self.assertTrue('Foo' in g.get_namespaces())
 
+    def test_mapping(self):
+        """Verify that metadata supports the full mapping protocol, keyed by full keys"""
+        keys = ['GUANO|Version', 'Timestamp', 'Note', 'User|Haiku', 'User|Answer', 'MSFT|Transect|Version']
+        self.assertIsInstance(self.md, MutableMapping)
+        self.assertEqual(keys, list(self.md))
+        self.assertEqual(keys, list(self.md.keys()))
+        self.assertEqual(6, len(self.md))
+        self.assertEqual(42, list(self.md.values())[4])
+        self.assertEqual(dict(self.md.items()), dict(self.md))
+        self.assertEqual(42, self.md.pop('User|Answer'))
+        self.assertEqual(5, len(self.md))
+        self.assertNotIn('User|Answer', self.md)
+        self.assertEqual('1.0.16', self.md['MSFT', 'Transect|Version'])
+        self.assertEqual({self.md}, {self.md})  # still hashable, by identity
+        self.assertNotEqual(self.md, GuanoFile.from_string(self.MD))
+
+    def test_update(self):
+        """Verify that many fields can be assigned at once"""
+        g = GuanoFile()
+        g.update({'Species Manual ID': 'Mylu', ('User', 'Answer'): 42}, Note='bulk')
+        self.assertEqual(['GUANO|Version', 'Species Manual ID', 'User|Answer', 'Note'], list(g))
+        self.assertEqual(42, g['User|Answer'])
+        g.update([('User|Answer', 43)])
+        self.assertEqual(43, g['User|Answer'])
+        self.assertEqual(4, len(g))
+        g.update(self.md)
+        self.assertEqual('1.0.16', g['MSFT|Transect|Version'])
+        g = GuanoFile()
+        g.update({})
+        self.assertFalse(g)  # not given a `GUANO|Version` field
+
+    def test_spaced_keys(self):
+        """Verify that keys with whitespace around the namespace separator are indexed by their normal full key"""
+        g = GuanoFile.from_string('GUANO|Version: 1.0\nFoo | Bar: x\nFoo|Bar: y')
+        self.assertEqual(['GUANO|Version', 'Foo|Bar'], list(g))
+        self.assertEqual(2, len(g))
+        self.assertEqual('y', g['Foo|Bar'])
+        del g['Foo|Bar']
+        self.assertEqual(['GUANO|Version'], list(g))
+        g = GuanoFile.from_string('GUANO|Version: 1.0\nFoo|Bar: x')._parse('Foo | Bar:', overlay=True)
+        self.assertEqual(['GUANO|Version'], list(g))
+
+
+class RegistryTest(unittest.TestCase):
+
+    MD = 'GUANO|Version: 1.0\nLength: 1.5\nAcme|Gain: 12\nAcme|Mode: auto\nOther|Gain: 3'
+
+    def test_scoped(self):
+        """Different registries apply different rules within one process"""
+        registry = guano.Registry(GuanoFile.registry)
+        registry.register('Acme', 'Gain', int, lambda value: '%d dB' % value)
+        scoped = GuanoFile.from_string(self.MD, registry=registry)
+        shared = GuanoFile.from_string(self.MD)
+        self.assertEqual(12, scoped['Acme|Gain'])
+        self.assertEqual('12', shared['Acme|Gain'])
+        self.assertEqual('3', scoped['Other|Gain'])
+        self.assertEqual(1.5, scoped['Length'])  # copied from the shared registry
+        self.assertIn('Acme|Gain: 12 dB', scoped.to_string())
+        self.assertIsNone(GuanoFile.registry.coercer('Acme', 'Gain'))
+
+    def test_register(self):
+        """`GuanoFile.register()` adds to the shared registry"""
+        registry = guano.Registry()
+        GuanoFile.register('RegistryTest', 'Count', int)
+        try:
+            self.assertEqual(7, GuanoFile.from_string('RegistryTest|Count: 7')['RegistryTest|Count'])
+            self.assertEqual('7', GuanoFile.from_string('RegistryTest|Count: 7', registry=registry)['RegistryTest|Count'])
+            self.assertIn('RegistryTest|Count', set(GuanoFile.registry.keys()))
+        finally:
+            del GuanoFile.registry.coercers['RegistryTest']
+            del GuanoFile.registry.serializers['RegistryTest']
+
+    def test_empty_registry(self):
+        """With no rules, even well-known values are left as strings"""
+        gfile = GuanoFile.from_string(self.MD, registry=guano.Registry())
+        self.assertEqual('1.5', gfile['Length'])
+
 
 class BadDataTest(unittest.TestCase):
     """
@@ -256,5 +347,821 @@ class StrictParsingTest(unittest.TestCase):
         self.assertEqual(g.get('Loc Position', None), '10N 567288E 4584472N')
 
 
+class DirtyTrackingTest(TempDirTestCase):
+
+    MD = b'GUANO|Version:  1.0\nSpecies Manual ID: Mylu\nLength:  2.50\n'  # even length
+
+    def setUp(self):
+        super().setUp()
+        self.fname = self.path('dirty.wav')
+        self.assertTrue(GuanoFile.from_string(self.MD).modified)
+        self.assertFalse(write_wav(self.fname, self.MD).modified)
+
+    def test_unmodified(self):
+        """Unmodified files aren't rewritten"""
+        g = GuanoFile(self.fname)
+        self.assertFalse(g.modified)
+        mtime = os.stat(self.fname).st_mtime_ns
+        self.assertFalse(g.write(make_backup=False))
+        self.assertEqual(mtime, os.stat(self.fname).st_mtime_ns)
+
+    def test_verbatim(self):
+        """Unmodified metadata is serialized exactly as it was loaded"""
+        with open(self.fname, 'rb') as f:
+            data = f.read()
+        i = data.index(b'guan')
+        data = data[:i] + b'guan' + struct.pack('<L', len(self.MD)) + self.MD  # with unnormalized whitespace
+        with open(self.fname, 'wb') as f:
+            f.write(data[:4] + struct.pack('<L', len(data) - 8) + data[8:])
+        g = GuanoFile(self.fname)
+        self.assertEqual(self.MD, bytes(g.serialize()))
+        self.assertNotIn('  ', g.to_string())
+
+    def test_same_value(self):
+        """Assigning a field its existing value doesn't modify the file"""
+        g = GuanoFile(self.fname)
+        g['Species Manual ID'] = 'Mylu'
+        g['Length'] = 2.5
+        self.assertFalse(g.modified)
+        self.assertEqual(set(), g.modified_keys())
+
+    def test_modified(self):
+        g = GuanoFile(self.fname)
+        before = g.to_string()
+        g['Species Manual ID'] = 'Epfu'
+        del g['Length']
+        self.assertTrue(g.modified)
+        self.assertEqual({'Species Manual ID', 'Length'}, g.modified_keys())
+        self.assertNotEqual(before, g.to_string())
+        self.assertIn('Species Manual ID: Epfu', g.to_string())
+        self.assertTrue(g.write(make_backup=False))
+        self.assertFalse(g.modified)
+        self.assertEqual('Epfu', GuanoFile(self.fname)['Species Manual ID'])
+
+    def test_new_filename(self):
+        """Writing an unmodified file to a new location isn't skipped"""
+        g = GuanoFile(self.fname)
+        g.filename = self.path('copy.wav')
+        self.assertTrue(g.modified)
+        self.assertTrue(g.write(make_backup=False))
+        self.assertEqual('Mylu', GuanoFile(g.filename)['Species Manual ID'])
+
+    def test_replace(self):
+        """The new version is written alongside the original and renamed over it"""
+        replaced, replace = [], os.replace
+        os.replace = lambda src, dst: replaced.append((src, dst)) or replace(src, dst)
+        try:
+            g = GuanoFile(self.fname)
+            g['Species Manual ID'] = 'Epfu'
+            g.write()
+        finally:
+            os.replace = replace
+        self.assertEqual(1, len(replaced))
+        self.assertEqual(self.tmpdir, os.path.dirname(replaced[0][0]))
+        self.assertEqual('Mylu', GuanoFile(self.path('GUANO_BACKUP', 'dirty.wav'))['Species Manual ID'])
+        self.assertEqual(['GUANO_BACKUP', 'dirty.wav'], sorted(os.listdir(self.tmpdir)))
+
+    def test_failed_write(self):
+        """A failed write leaves the original untouched, and no temporary file behind"""
+        g = GuanoFile(self.fname)
+        g['Species Manual ID'] = 'Epfu'
+        g._wav_data_size += 100  # more audio data than the file has
+        with self.assertRaises(ValueError):
+            g.write(make_backup=False)
+        self.assertEqual(['dirty.wav'], os.listdir(self.tmpdir))
+        self.assertEqual('Mylu', GuanoFile(self.fname)['Species Manual ID'])
+
+    def test_file_object(self):
+        """After rewriting a file loaded from a file object, its audio is read from the new file"""
+        fmt = struct.pack('<HHIIHH', 1, 1, 250000, 500000, 2, 16)
+        body = (b'WAVE' + b'fmt ' + struct.pack('<I', len(fmt)) + fmt +
+                b'LIST' + struct.pack('<I', 8) + b'INFOjunk' +  # moves `data` from where we'd write it
+                b'data' + struct.pack('<I', 4) + b'\x01\x02\x03\x04')
+        with open(self.fname, 'wb') as f:
+            f.write(b'RIFF' + struct.pack('<I', len(body)) + body)
+        with open(self.fname, 'rb') as f:
+            g = GuanoFile(f)
+            g['Species Manual ID'] = 'Epfu'
+            g.write(make_backup=False)
+            self.assertTrue(f.closed)
+            self.assertEqual(b'\x01\x02\x03\x04', g.wav_data)
+        self.assertEqual(b'\x01\x02\x03\x04', GuanoFile(self.fname).wav_data)
+
+
+class SelectiveLoadTest(TempDirTestCase):
+
+    MD = 'GUANO|Version: 1.0\nSpecies Manual ID: Mylu\nTimestamp: 2017-04-20T01:23:45-07:00\n' \
+         'Loc Position: 41.7 -121.5\nUser|Answer: 42\nUser|Question: unknown\nMSFT|Foo: bar'
+
+    def setUp(self):
+        super().setUp()
+        self.fname = self.write_wav('select.wav', self.MD)
+
+    def test_fields(self):
+        g = GuanoFile(self.fname, fields=['Species Manual ID', ('User', 'Answer')])
+        self.assertEqual(['Species Manual ID', 'User|Answer'], [k for k, v in g.items()])
+        self.assertTrue(g.partial)
+        self.assertRaises(ValueError, g.write)
+
+    def test_namespaces(self):
+        g = GuanoFile(self.fname, namespaces=['User'], fields=['Timestamp'])
+        self.assertEqual({'', 'User'}, set(g.get_namespaces()))
+        self.assertEqual(2017, g['Timestamp'].year)
+        self.assertEqual('unknown', g['User|Question'])
+        self.assertNotIn('Species Manual ID', g)
+
+    def test_peek(self):
+        self.assertEqual('Mylu', guano.peek(self.fname, 'Species Manual ID'))
+        self.assertEqual((41.7, -121.5), guano.peek(self.fname, 'Loc Position'))
+        self.assertEqual('bar', guano.peek(self.fname, ('MSFT', 'Foo')))
+        self.assertEqual(None, guano.peek(self.fname, 'Species Auto ID'))
+        self.assertEqual('?', guano.peek(self.fname, 'Species Auto ID', '?'))
+        with open(self.fname, 'rb') as f:
+            self.assertEqual('1.0', guano.peek(f, 'GUANO|Version'))
+
+    def test_duplicates(self):
+        """Selective loading gives the same value for a repeated field as a full load: the last one"""
+        write_wav(self.fname, self.MD + '\nSpecies Manual ID: Epfu\nMSFT | Foo: baz\nSpecies Manual IDs: x')
+        g = GuanoFile(self.fname)
+        self.assertEqual(('Epfu', 'baz'), (g['Species Manual ID'], g['MSFT|Foo']))
+        g = GuanoFile(self.fname, fields=['Species Manual ID', 'MSFT|Foo'])
+        self.assertEqual(('Epfu', 'baz'), (g['Species Manual ID'], g['MSFT|Foo']))
+        self.assertEqual('Epfu', guano.peek(self.fname, 'Species Manual ID'))
+        self.assertEqual('baz', guano.peek(self.fname, ('MSFT', 'Foo')))
+        md = self.MD + '\nMSFT | Foo: baz'  # written files normalize keys, so check the parser too
+        self.assertEqual('baz', GuanoFile.from_string(md, fields=['MSFT|Foo'])['MSFT|Foo'])
+
+        # parsing still stops early once a field can't occur again, so a later bad line is never seen
+        md = self.MD + '\nthis line is malformed'
+        self.assertRaises(ValueError, GuanoFile.from_string, md)
+        self.assertEqual('Mylu', GuanoFile.from_string(md, fields=['Species Manual ID'])['Species Manual ID'])
+
+
+class ExtractTest(TempDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.data = bytes(bytearray(i % 256 for i in range(4000)))  # 1000 stereo 16-bit frames
+        self.fname = self.write_wav('long.wav', 'GUANO|Version: 1.0\nTimestamp: 2017-04-20T01:23:45-07:00\n'
+                                    'TE: 10\nSpecies Manual ID: Mylu\nLength: 0.01',
+                                    self.data, wavparams(2, 2, 10000, 1000, 'NONE', None))  # 100 kHz real time
+
+    def check_clip(self, clip, first, last):
+        self.assertEqual(self.data[first * 4:last * 4], clip.wav_data)
+        self.assertEqual(last - first, clip.wav_params.nframes)
+        self.assertEqual((2, 2, 10000), clip.wav_params[:3])
+        self.assertEqual('Mylu', clip['Species Manual ID'])
+        self.assertAlmostEqual((last - first) / 100000.0, clip['Length'], places=2)  # serialized as %.2f
+        self.assertEqual(parse_timestamp('2017-04-20T01:23:45-07:00') + timedelta(seconds=first / 100000.0),
+                         clip['Timestamp'])
+
+    def test_extract(self):
+        g = GuanoFile(self.fname)
+        clip = g.extract(self.path('clip.wav'), 0.001, 0.0025)
+        self.check_clip(clip, 100, 250)
+        self.check_clip(GuanoFile(clip.filename), 100, 250)
+
+    def test_extract_loaded(self):
+        """Extract from audio data which is already in memory"""
+        g = GuanoFile(self.fname)
+        g.wav_data
+        self.check_clip(g.extract(self.path('clip.wav'), 0.0095), 950, 1000)
+
+    def test_extract_empty(self):
+        g = GuanoFile(self.fname)
+        self.assertRaises(ValueError, g.extract, self.path('clip.wav'), 0.02)
+
+    def test_extract_checksum(self):
+        """A clip of a file with a checksum gets a checksum of its own audio data"""
+        g = GuanoFile(self.fname)
+        g.write(make_backup=False, checksum='crc32')
+        clip = GuanoFile(self.fname).extract(self.path('clip.wav'), 0.001, 0.0025)
+        self.assertTrue(GuanoFile(clip.filename).verify_checksum())
+        g.wav_data
+        clip = g.extract(self.path('clip2.wav'), 0.0095)
+        self.assertEqual(clip['Checksum|Data'], GuanoFile(clip.filename)['Checksum|Data'])
+        self.assertTrue(GuanoFile(clip.filename).verify_checksum())
+
+    def test_extract_registry(self):
+        """A clip is written and loaded with the same registry as the file it was extracted from"""
+        registry = guano.Registry(GuanoFile.registry)
+        registry.register('Acme', 'Gain', lambda value: int(value.split()[0]), lambda value: '%d dB' % value)
+        g = GuanoFile(self.fname, registry=registry)
+        g['Acme|Gain'] = 12
+        clip = g.extract(self.path('clip.wav'), 0.001)
+        self.assertEqual(12, clip['Acme|Gain'])
+        self.assertIn(b'Acme|Gain: 12 dB', guano.read_guano_chunk(clip.filename))
+
+
+class SidecarTest(TempDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.fname = self.write_wav('archived.wav',
+                                    'GUANO|Version: 1.0\nSpecies Manual ID: Mylu\nNote: embedded\nMisc|Answer: 42')
+        with open(self.fname, 'rb') as f:
+            self.wav_bytes = f.read()
+
+    def test_write_sidecar(self):
+        g = GuanoFile(self.fname, sidecar=True)
+        g['Species Manual ID'] = 'Epfu'
+        del g['Note']
+        self.assertTrue(g.write())
+        self.assertFalse(g.write())  # unchanged
+        with open(self.fname, 'rb') as f:
+            self.assertEqual(self.wav_bytes, f.read())
+        self.assertTrue(os.path.isfile(guano.sidecar_filename(self.fname)))
+        self.assertFalse(os.path.isdir(self.path('GUANO_BACKUP')))
+
+        g = GuanoFile(self.fname, sidecar=True)
+        self.assertEqual('Epfu', g['Species Manual ID'])
+        self.assertNotIn('Note', g)
+        self.assertEqual('42', g['Misc|Answer'])
+        self.assertFalse(g.modified)
+
+        # without sidecar mode, we only see embedded metadata
+        g = GuanoFile(self.fname)
+        self.assertEqual('Mylu', g['Species Manual ID'])
+        self.assertEqual('embedded', g['Note'])
+
+    def test_overlay(self):
+        """A hand-written sidecar only overrides the fields it mentions"""
+        with open(guano.sidecar_filename(self.fname), 'wb') as f:
+            f.write(b'Note: from sidecar\nMisc|Answer:\n')
+        g = GuanoFile(self.fname, sidecar=True)
+        self.assertEqual('from sidecar', g['Note'])
+        self.assertEqual('Mylu', g['Species Manual ID'])
+        self.assertNotIn('Misc|Answer', g)
+
+    def test_embed(self):
+        g = GuanoFile(self.fname, sidecar=True)
+        g['Note'] = 'to embed'
+        g.write()
+        g = GuanoFile(self.fname, sidecar=True)
+        g.sidecar = False
+        self.assertTrue(g.modified)
+        g.write(make_backup=False)
+        self.assertEqual('to embed', GuanoFile(self.fname)['Note'])
+
+
+class RF64Test(TempDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.data = bytes(bytearray(i % 256 for i in range(3000)))
+        self.fname = self.write_wav('rf64.wav', 'GUANO|Version: 1.0\nSpecies Manual ID: Mylu', self.data,
+                                    wavparams(2, 3, 384000, 500, 'NONE', None), rf64=True)
+
+    def test_read(self):
+        with open(self.fname, 'rb') as f:
+            header = f.read(16)
+        self.assertEqual(b'RF64', header[:4])
+        self.assertEqual(b'WAVEds64', header[8:16])
+        g = GuanoFile(self.fname)
+        self.assertEqual(wavparams(2, 3, 384000, 500, 'NONE', 'not compressed'), g.wav_params)
+        self.assertEqual(self.data, g.wav_data)
+        self.assertEqual('Mylu', g['Species Manual ID'])
+        self.assertEqual('Mylu', guano.peek(self.fname, 'Species Manual ID'))
+
+    def test_rewrite(self):
+        """Rewriting streams the audio data from the original file, and keeps RF64 only if asked"""
+        g = GuanoFile(self.fname)
+        g['Species Manual ID'] = 'Epfu'
+        g.write(make_backup=False)
+        self.assertIsNone(g._wav_data)  # never loaded into memory
+        with open(self.fname, 'rb') as f:
+            self.assertEqual(b'RIFF', f.read(4))
+        g = GuanoFile(self.fname)
+        self.assertEqual('Epfu', g['Species Manual ID'])
+        self.assertEqual(self.data, g.wav_data)
+
+
+class ChecksumTest(TempDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.data = bytes(bytearray(i % 256 for i in range(3000)))
+        self.fname = self.write_wav('checksum.wav', 'GUANO|Version: 1.0\nSpecies Manual ID: Mylu', self.data)
+
+    def test_streamed(self):
+        """A checksum is computed while streaming the audio, and added even to an otherwise unmodified file"""
+        g = GuanoFile(self.fname)
+        self.assertIsNone(g.verify_checksum())
+        self.assertTrue(g.write(make_backup=False, checksum='crc32'))
+        self.assertIsNone(g._wav_data)
+        self.assertEqual('crc32:%08x' % zlib.crc32(self.data), GuanoFile(self.fname)['Checksum|Data'])
+        self.assertTrue(GuanoFile(self.fname).verify_checksum())
+        self.assertFalse(g.write(make_backup=False, checksum='crc32'))  # already has a valid one
+
+    def test_algorithms(self):
+        g = GuanoFile(self.fname)
+        g.write(make_backup=False, checksum='sha256')
+        g = GuanoFile(self.fname)
+        self.assertEqual('sha256:' + hashlib.sha256(self.data).hexdigest(), g['Checksum|Data'])
+        self.assertTrue(g.verify_checksum())
+        with self.assertRaises(ValueError):
+            g.audio_digest('nonsense')
+
+    def test_updated(self):
+        """An existing checksum is kept up to date when the audio changes"""
+        GuanoFile(self.fname).write(make_backup=False, checksum='crc32')
+        g = GuanoFile(self.fname)
+        g.wav_data = self.data[::-1]
+        g.write(make_backup=False)
+        self.assertEqual('crc32:%08x' % zlib.crc32(self.data[::-1]), GuanoFile(self.fname)['Checksum|Data'])
+
+    def test_mismatch(self):
+        GuanoFile(self.fname).write(make_backup=False, checksum='crc32')
+        with open(self.fname, 'r+b') as f:
+            f.seek(100)
+            f.write(b'\xff')
+        self.assertFalse(GuanoFile(self.fname).verify_checksum())
+
+
+class EditTest(TempDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.fnames = [self.write_wav('edit%d.wav' % i, 'GUANO|Version: 1.0\nSpecies Manual ID: Mylu')
+                       for i in range(5)]
+        self.fsynced = []
+        self._fsync, os.fsync = os.fsync, self.fsynced.append
+
+    def tearDown(self):
+        os.fsync = self._fsync
+
+    def test_commit(self):
+        with guano.edit(self.fnames[0], make_backup=False) as g:
+            g['Species Manual ID'] = 'Epfu'
+        self.assertEqual('Epfu', GuanoFile(self.fnames[0])['Species Manual ID'])
+        self.assertEqual([], self.fsynced)
+
+    def test_rollback(self):
+        """Changes are discarded if the transaction raises an exception"""
+        with self.assertRaises(KeyError):
+            with guano.edit(self.fnames[0], make_backup=False) as g:
+                g['Species Manual ID'] = 'Epfu'
+                g['Nonexistent']
+        self.assertEqual('Mylu', GuanoFile(self.fnames[0])['Species Manual ID'])
+
+    def test_per_file(self):
+        """Each file, and then its directory, is fsynced before the write returns"""
+        with guano.edit(self.fnames[0], durability='per-file', make_backup=False) as g:
+            g['Species Manual ID'] = 'Epfu'
+        self.assertEqual(2, len(self.fsynced))  # the new file before it's renamed into place, then its directory
+
+    def test_group(self):
+        """Each file is fsynced before it's renamed into place, and their directory in batches"""
+        with guano.Durability('group', group_size=2) as durability:
+            for i, fname in enumerate(self.fnames):
+                with guano.edit(fname, durability=durability, make_backup=False) as g:
+                    g['Species Manual ID'] = 'Epfu'
+                self.assertEqual(i + 1 + (i + 1) // 2, len(self.fsynced))  # every file, and a directory per batch
+        self.assertEqual(5 + 3, len(self.fsynced))
+        with self.assertRaises(ValueError):
+            GuanoFile(self.fnames[0]).write(durability='group')
+
+
+class ArchiveScanTest(TempDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.wavs = [self.write_wav('rec%d.wav' % i, 'GUANO|Version: 1.0\nSpecies Manual ID: %s' % species,
+                                    os.urandom(2 * (5000 + i)))
+                     for i, species in enumerate(['Mylu', 'Epfu', 'Lano'])]
+
+    def assertScanned(self, archive):
+        gfiles = list(guano.scan_archive(archive))
+        self.assertEqual(['Mylu', 'Epfu', 'Lano'], [g['Species Manual ID'] for g in gfiles])
+        self.assertEqual(os.path.join(archive, 'night1', 'rec1.wav'), gfiles[1].filename)
+        self.assertEqual(5001, gfiles[1].wav_params.nframes)
+        self.assertEqual(250000, gfiles[1].wav_params.framerate)
+
+    def test_zip(self):
+        for compression in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+            archive = self.path('bundle%d.zip' % compression)
+            with zipfile.ZipFile(archive, 'w', compression) as zf:
+                zf.writestr('night1/notes.txt', 'not a .WAV')
+                for fname in self.wavs:
+                    zf.write(fname, 'night1/' + os.path.basename(fname))
+                zf.write(self.wavs[0], 'night1/GUANO_BACKUP/rec0.wav')
+            self.assertScanned(archive)
+
+    def test_tar(self):
+        for mode, ext in (('w', '.tar'), ('w:gz', '.tar.gz')):
+            archive = self.path('bundle' + ext)
+            with tarfile.open(archive, mode) as tf:
+                for fname in self.wavs:
+                    tf.add(fname, 'night1/' + os.path.basename(fname))
+            self.assertScanned(archive)
+
+    def test_bad_member(self):
+        archive = self.path('bundle.zip')
+        with zipfile.ZipFile(archive, 'w') as zf:
+            zf.writestr('bad.wav', b'RIFF\0\0\0\0JUNKJUNK')
+            zf.write(self.wavs[0], 'good.wav')
+        self.assertEqual(['Mylu'], [g['Species Manual ID'] for g in guano.scan_archive(archive)])
+
+    def test_not_archive(self):
+        with self.assertRaises(ValueError):
+            list(guano.scan_archive(self.wavs[0]))
+
+
+class FileCacheTest(TempDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.fnames = [self.write_wav(name, 'GUANO|Version: 1.0\nSpecies Manual ID: Mylu')
+                       for name in ('a.wav', 'b.wav', 'c.wav')]
+
+    def read(self, fname):
+        self.reads.append(fname)
+        return {'species': GuanoFile(fname)['Species Manual ID']}
+
+    def update(self, cache):
+        self.reads = []
+        changes = [change for change in guano.update_cache(cache, self.tmpdir, self.read, workers=2) if change[2]]
+        for path, entry, changed in changes:
+            if entry is None:
+                del cache[path]
+            else:
+                cache[os.path.abspath(path)] = entry
+        return changes
+
+    def test_update(self):
+        cache = {}
+        self.assertEqual(3, len(self.update(cache)))
+        fname = self.path('cache.jsonl')
+        guano.write_cache(fname, cache, species_key='Species Manual ID')
+        self.assertEqual({}, guano.read_cache(fname, species_key='Species Auto ID'))
+        cache = guano.read_cache(fname, species_key='Species Manual ID')
+        self.assertEqual(set(self.fnames), set(cache))
+
+        self.assertEqual([], self.update(cache))
+        self.assertEqual([], self.reads)
+        write_wav(self.fnames[1], 'GUANO|Version: 1.0\nSpecies Manual ID: Epfu')
+        os.utime(self.fnames[1], (0, 0))  # ensure the mtime changes, however coarse the filesystem's
+        os.remove(self.fnames[2])
+        self.assertEqual([(self.fnames[1], 'Epfu'), (self.fnames[2], None)],
+                         [(path, entry and entry['species']) for path, entry, changed in self.update(cache)])
+        self.assertEqual([self.fnames[1]], self.reads)
+        self.assertEqual(self.fnames[:2], sorted(cache))
+
+    def test_index(self):
+        index = guano.read_indexes([self.tmpdir])
+        self.assertEqual({}, index)
+        guano.write_index(self.path(guano.INDEX_FILENAME), [GuanoFile(self.fnames[0])])
+        index = guano.read_indexes(self.tmpdir)
+        self.assertEqual([self.fnames[0]], list(index))
+        self.assertIn('Species Manual ID: Mylu', guano.read_guano_chunk(self.fnames[0], index=index))
+        self.assertIsInstance(guano.read_guano_chunk(self.fnames[1], index=index), bytes)  # not indexed
+
+
+class SharedFileTest(TempDirTestCase):
+    """Threads sharing one open file object mustn't disturb each other's reads"""
+
+    def setUp(self):
+        super().setUp()
+        self.data = os.urandom(2 * 100000)
+        self.fname = self.write_wav('shared.wav', 'GUANO|Version: 1.0\nSpecies Manual ID: Mylu', self.data)
+
+    def test_position_unchanged(self):
+        with open(self.fname, 'rb') as f:
+            f.seek(123)
+            g = GuanoFile(f)
+            self.assertEqual(self.data, g.wav_data)
+            self.assertEqual('Mylu', guano.peek(f, 'Species Manual ID'))
+            self.assertEqual(123, f.tell())
+
+    def test_wrapped_file(self):
+        """Audio is copied from a wrapper like `gzip.GzipFile`, not from the file it wraps"""
+        import gzip
+        gzname = self.fname + '.gz'
+        with open(self.fname, 'rb') as f, gzip.open(gzname, 'wb') as gz:
+            gz.write(f.read())
+        try:
+            with gzip.open(gzname, 'rb') as gz:
+                g = GuanoFile(gz)
+                g.filename = self.fname
+                g['Species Manual ID'] = 'Epfu'
+                g.write(make_backup=False)
+            self.assertEqual(self.data, GuanoFile(self.fname).wav_data)
+        finally:
+            os.remove(gzname)
+
+    def test_concurrent(self):
+        errors = []
+        with open(self.fname, 'rb') as f:
+            def worker():
+                try:
+                    for _ in range(50):
+                        g = GuanoFile(f)
+                        if g['Species Manual ID'] != 'Mylu' or g.wav_data != self.data:
+                            errors.append(g)
+                except Exception as e:
+                    errors.append(e)
+            threads = [threading.Thread(target=worker) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual([], errors)
+
+
+class FilePoolTest(TempDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.fnames = [self.write_wav('pool%d.wav' % i, 'GUANO|Version: 1.0\nSpecies Manual ID: Mylu')
+                       for i in range(4)]
+        self.pool = guano.FilePool(max_open=2)
+        GuanoFile.audio_cache.clear()  # so that audio data is read through our pool
+
+    def tearDown(self):
+        self.pool.close()
+
+    def test_reuse(self):
+        """A file is opened once for loading, reading audio, and rewriting"""
+        g = GuanoFile(self.fnames[0], file_pool=self.pool)
+        self.assertEqual(64, len(g.audio_digest()))
+        self.assertEqual(b'\x01\x02\x03\x04', g.wav_data)
+        self.assertEqual((2, 1), (self.pool.hits, self.pool.misses))
+        g.wav_data = g.wav_data[::-1]
+        g.write(make_backup=False)
+        self.assertEqual(0, len(self.pool))  # the replaced file's handle was closed
+        self.assertEqual(b'\x04\x03\x02\x01', GuanoFile(self.fnames[0], file_pool=self.pool).wav_data)
+
+    def test_bounded(self):
+        for fname in self.fnames * 2:
+            GuanoFile(fname, file_pool=self.pool).audio_digest()
+        self.assertEqual(2, len(self.pool))
+        with self.pool.open(self.fnames[0]) as f0, self.pool.open(self.fnames[1]) as f1, \
+                self.pool.open(self.fnames[2]) as f2:
+            self.assertEqual(3, len(self.pool))  # handles in use aren't closed
+        self.assertEqual(2, len(self.pool))
+        self.assertEqual(1, [f0.closed, f1.closed, f2.closed].count(True))
+
+    def test_changed(self):
+        """A handle is reopened if its file has changed"""
+        GuanoFile(self.fnames[0], file_pool=self.pool)
+        with GuanoFile(self.fnames[0]) as g:
+            g['Species Manual ID'] = 'Epfu'
+            g.write(make_backup=False)  # not through our pool
+        self.assertEqual('Epfu', GuanoFile(self.fnames[0], file_pool=self.pool)['Species Manual ID'])
+        self.assertEqual(2, self.pool.misses)
+
+    def test_close(self):
+        """Closing a `GuanoFile` closes the file object it was created with, and drops loaded audio"""
+        with open(self.fnames[0], 'rb') as f:
+            with GuanoFile(f) as g:
+                g.wav_data
+            self.assertTrue(f.closed)
+            self.assertIsNone(g._wav_data)
+            self.assertEqual('Mylu', g['Species Manual ID'])
+
+
+class AudioCacheTest(TempDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.fnames = [self.write_wav('cache%d.wav' % i, 'GUANO|Version: 1.0', bytes(bytearray([i])) * 1000)
+                       for i in range(3)]
+        self._audio_cache = GuanoFile.audio_cache
+        GuanoFile.audio_cache = self.cache = guano.AudioCache(max_bytes=2500)
+
+    def tearDown(self):
+        GuanoFile.audio_cache = self._audio_cache
+
+    def test_shared(self):
+        """Audio data is cached once for all instances, not on each instance"""
+        g = GuanoFile(self.fnames[0])
+        self.assertEqual(b'\0' * 1000, g.wav_data)
+        self.assertIsNone(g._wav_data)
+        self.assertEqual(b'\0' * 1000, GuanoFile(self.fnames[0]).wav_data)
+        self.assertEqual((1, 1), (self.cache.hits, self.cache.misses))
+
+    def test_budget(self):
+        for fname in self.fnames:
+            GuanoFile(fname).wav_data
+        self.assertEqual((2, 2000), (len(self.cache), self.cache.size))
+        GuanoFile(self.fnames[0]).wav_data  # was evicted
+        self.assertEqual(0, self.cache.hits)
+        big = GuanoFile(self.fnames[1])
+        big.wav_data = b'\1' * 3000
+        big.write(make_backup=False)
+        self.assertEqual(b'\1' * 3000, big._wav_data)  # can't be cached, so it's kept rather than re-read
+        self.assertEqual(b'\1' * 3000, big.wav_data)
+        big = GuanoFile(self.fnames[1])
+        self.assertEqual(b'\1' * 3000, big.wav_data)
+        self.assertEqual(b'\1' * 3000, big._wav_data)
+        self.assertNotIn(3000, [len(data) for data in self.cache._entries.values()])
+
+    def test_replaced(self):
+        """Audio data read from a file replaced since it was loaded isn't cached under the old file's identity"""
+        g = GuanoFile(self.fnames[0])
+        write_wav(self.fnames[0], 'GUANO|Version: 1.0', b'\2' * 1000)
+        self.cache.clear()
+        g.wav_data
+        self.assertEqual(0, len(self.cache))
+        self.assertEqual(b'\2' * 1000, g._wav_data)
+
+    def test_changed(self):
+        """A rewritten file's audio data isn't served from the cache"""
+        g = GuanoFile(self.fnames[0])
+        g.wav_data
+        g2 = GuanoFile(self.fnames[0])
+        g2.wav_data = b'\2' * 1000
+        g2.write(make_backup=False)
+        self.assertEqual(b'\2' * 1000, GuanoFile(self.fnames[0]).wav_data)
+
+    def test_disabled(self):
+        GuanoFile.audio_cache = None
+        g = GuanoFile(self.fnames[2])
+        self.assertEqual(b'\2' * 1000, g.wav_data)
+        self.assertIsNotNone(g._wav_data)
+
+
+class RangeRequestHandler(BaseHTTPRequestHandler):
+    """Minimal HTTP server handler supporting `Range` requests, for testing"""
+
+    root = None
+
+    def do_GET(self):
+        with open(os.path.join(self.root, self.path.lstrip('/')), 'rb') as f:
+            data = f.read()
+        rng = self.headers.get('Range')
+        if rng:
+            start, end = (int(v) for v in rng.split('=')[1].split('-'))
+            end = min(end, len(data) - 1)
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes %d-%d/%d' % (start, end, len(data)))
+            data = data[start:end + 1]
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class RangeFileTest(TempDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.data = bytes(bytearray(i % 251 for i in range(200000)))
+        self.write_wav('remote.wav', 'GUANO|Version: 1.0\nSpecies Manual ID: Mylu', self.data)
+
+        RangeRequestHandler.root = self.tmpdir
+        self.server = HTTPServer(('127.0.0.1', 0), RangeRequestHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = 'http://127.0.0.1:%d/remote.wav' % self.server.server_port
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_metadata(self):
+        """Reading metadata only needs the prefetched head and tail"""
+        with guano.HTTPRangeFile(self.url, block_size=4096, prefetch=4096) as f:
+            g = GuanoFile(f)
+            self.assertEqual('Mylu', g['Species Manual ID'])
+            self.assertEqual(2, f.requests)
+            self.assertLess(f.bytes_fetched, 10000)
+            self.assertEqual(self.data, g.wav_data)
+            self.assertEqual(3, f.requests)
+
+    def test_coalesce(self):
+        with guano.HTTPRangeFile(self.url, block_size=1000, prefetch=1000, cache_blocks=100) as f:
+            requests = f.requests
+            f.seek(5000)
+            f.read(1000)  # block 5
+            f.seek(3000)
+            self.assertEqual(self.data[3000 - 44:8000 - 44], f.read(5000))  # blocks 3-7, only one more request
+            self.assertEqual(requests + 2, f.requests)
+            f.seek(3500)
+            f.read(4000)  # cached
+            self.assertEqual(requests + 2, f.requests)
+
+    def test_eviction(self):
+        with guano.HTTPRangeFile(self.url, block_size=1000, prefetch=0, cache_blocks=2) as f:
+            for offset in (0, 1000, 2000, 0):
+                f.seek(offset)
+                f.read(10)
+            self.assertEqual(4, f.requests)  # block 0 was evicted
+
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+@unittest.skipUnless(numpy, 'NumPy is not installed')
+class FramesTest(TempDirTestCase):
+
+    def make_file(self, nchannels, sampwidth, samples):
+        """Write a .WAV file from a sequence of integer samples, interleaved by channel"""
+        fname = self.path('frames_%d_%d.wav' % (nchannels, sampwidth))
+        if sampwidth == 1:
+            data = bytes(bytearray(samples))
+        else:
+            data = b''.join(s.to_bytes(sampwidth, 'little', signed=True) for s in samples)
+        write_wav(fname, 'GUANO|Version: 1.0\nNote: frames', data,
+                  wavparams(nchannels, sampwidth, 250000, len(samples) // nchannels, 'NONE', None))
+        return fname
+
+    def test_dtypes(self):
+        samples = [0, 1, -1, 100, -100, 32767, -32768, 5]
+        for sampwidth, dtype in [(2, numpy.int16), (4, numpy.int32)]:
+            g = GuanoFile(self.make_file(2, sampwidth, samples))
+            frames = g.frames()
+            self.assertEqual(dtype, frames.dtype)
+            self.assertEqual((4, 2), frames.shape)
+            self.assertEqual(samples, frames.reshape(-1).tolist())
+            self.assertEqual(samples, g.frames(mmap=False).reshape(-1).tolist())
+
+    def test_8bit(self):
+        g = GuanoFile(self.make_file(1, 1, [0, 128, 255, 7]))
+        self.assertEqual(numpy.uint8, g.frames().dtype)
+        self.assertEqual([0, 128, 255, 7], g.frames()[:, 0].tolist())
+
+    def test_24bit(self):
+        samples = [0, 1, -1, 8388607, -8388608, 12345]
+        g = GuanoFile(self.make_file(3, 3, samples))
+        self.assertEqual((2, 3), g.frames().shape)
+        self.assertEqual(samples, g.frames().reshape(-1).tolist())
+
+    def test_iter_blocks(self):
+        samples = list(range(20))
+        fname = self.make_file(2, 2, samples)  # 10 frames
+        blocks = [b[:, 0].tolist() for b in GuanoFile(fname).iter_blocks(4, overlap=1)]
+        self.assertEqual([[0, 2, 4, 6], [6, 8, 10, 12], [12, 14, 16, 18]], blocks)
+        blocks = [b[:, 1].tolist() for b in GuanoFile(fname).iter_blocks(3)]
+        self.assertEqual([[1, 3, 5], [7, 9, 11], [13, 15, 17], [19]], blocks)
+
+        g = GuanoFile(fname)
+        g.wav_data  # already loaded, so blocks are views
+        self.assertEqual([[0, 2, 4, 6], [6, 8, 10, 12], [12, 14, 16, 18]],
+                         [b[:, 0].tolist() for b in g.iter_blocks(4, overlap=1)])
+        self.assertRaises(ValueError, lambda: list(g.iter_blocks(4, overlap=4)))
+
+
+class ParserDifferentialTest(unittest.TestCase):
+    """Verify that our optimized parser gives identical results to the original parser"""
+
+    ALPHABET = ['a', 'B', ' ', ' ', '\t', '\r', '\0', '\x0b', '\xa0', '\u2003', ':', ':', '|', '|', '\n', '\n', 'é', '1']
+    @staticmethod
+    def contents(md):
+        return [(namespace, list(data.items())) for namespace, data in md.items()]
+
+    def check(self, md, strict=False):
+        try:
+            expected = ReferenceParser(coersion_rules(GuanoFile.registry), strict)._parse(md)._md
+        except ValueError:
+            self.assertRaises(ValueError, GuanoFile.from_string, md, strict=strict)
+        else:
+            g = GuanoFile.from_string(md, strict=strict)
+            self.assertEqual(self.contents(expected), self.contents(g._md), repr(md))
+            for namespace, data in expected.items():
+                for key, val in data.items():
+                    self.assertEqual(val, g[(namespace, key)], repr(md))
+
+        # iter_fields() gives the same uncoerced values, with the last of any duplicate key winning
+        try:
+            expected = ReferenceParser({})._parse(md)._md
+        except ValueError:
+            self.assertRaises(ValueError, lambda: list(iter_fields(md)))
+            return
+        fields = OrderedDict()
+        for namespace, key, full_key, val in iter_fields(md):
+            fields.setdefault(namespace, OrderedDict())[key] = val
+        self.assertEqual(self.contents(expected), self.contents(fields), repr(md))
+
+    def test_examples(self):
+        for md in [
+            GeneralTest.MD,
+            UnicodeTest.MD,
+            b'GUANO|Version:  1.0\nNote:  Mobile transect with mic 4\xd5 above roof.\n\x00\x00',
+            b'GUANO|Version:  1.0:\n1.0:\n',
+            'GUANO|Version: 1.0\n :\n| : x\nNS | Key : value \nNS|: x\n\x00Key\x00: \x00val\x00\n',
+            'GUANO|Version: 1.0\nno colon here\n',
+            'GUANO | Version: 1.0\n Length : 2.5\n|Length: 3\nLength|: 4\nLength:\nSamplerate: 250000\n',
+            'GUANO|Version: 1.0\nTimestamp: 2017-04-20T01:23:45-07:00\nTimestamp : 2018-04-20T01:23:45\n',
+            'GUANO|Version: 1.0\nFoo|Bar: 1\nFoo | Bar: 2\nBaz: 0\nFoo|Bar : 3\n Foo| Bar: 4\nFoo\t|Bar\t: 5\n',
+            'GUANO|Version: 1.0\nLength: 2.5\nLength: not a number\nFoo|Bar: x\n\nFoo|Baz: y\nFoo|Bar: z\n',
+        ]:
+            self.check(md)
+        self.check('GUANO|Version: 1.0\nLength: not a number\n', strict=True)
+
+    def test_fuzz(self):
+        rand = random.Random(42)
+        for i in range(2000):
+            md = ''.join(rand.choice(self.ALPHABET) for _ in range(rand.randint(0, 40)))
+            self.check(md)
+            self.check(md.encode('latin-1', 'replace'))
+
+
 if __name__ == '__main__':
     unittest.main()
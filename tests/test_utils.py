@@ -8,15 +8,32 @@ from __future__ import print_function
 import sys
 import os
 import os.path
+import io
+import shutil
+import subprocess
 import unittest
-from itertools import chain
+from contextlib import redirect_stdout
 
-from guano import GuanoFile
+import guano
+import guano_cli
+from guano import GuanoFile, wavparams
+from helpers import write_wav, TempDirTestCase
 
 bin_path = os.path.normpath(os.path.join(os.path.abspath(__file__), '..', '..', 'bin'))
 sys.path.insert(0, bin_path)
 import sb2guano
 import wamd2guano
+import guano_index
+import guano_query
+import guano_watch
+import guano_triage
+import guano_split
+import guano_compact
+import guano_validate
+import guano_dedupe
+import guano_verify
+import guano_activity
+import guano_geo
 from guano_edit import GuanoTemplate
 
 
@@ -85,12 +102,420 @@ class GuanoEditTest(unittest.TestCase):
     def test_well_known(self):
         # pretend this is an exhaustive list of well-known fields!
         # FIXME: because these are class attributes, we "accumulate" fields within the unit testing process
-        keys = set(chain(GuanoFile._coersion_rules.keys(), GuanoFile._serialization_rules.keys()))
+        keys = set(GuanoFile.registry.keys())
         for key in keys:
             self.g[key] = key
             s = GuanoTemplate('${'+key+'}').substitute(self.g)
             self.assertEqual(s, key)
 
 
+class QueryTest(TempDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.write_wav('a.wav', 'GUANO|Version: 1.0\nSpecies Manual ID: Mylu\n'
+                       'Timestamp: 2017-04-20T01:23:45-07:00\nLoc Position: 41.7 -121.5\nLength: 2.5')
+        self.write_wav('b.wav', 'GUANO|Version: 1.0\nSpecies Manual ID: Mylu\n'
+                       'Timestamp: 2017-05-20T01:23:45-07:00\nLoc Position: 45.0 -121.5\nLength: 12')
+        self.write_wav('c.wav', 'GUANO|Version: 1.0\nSpecies Manual ID: Epfu\n'
+                       'Timestamp: 2017-04-21T01:23:45')
+
+    def query(self, *exprs, **kwargs):
+        predicates = [guano_query.Predicate.parse(expr) for expr in exprs]
+        return [os.path.basename(f) for f in guano_query.query(self.tmpdir, predicates, **kwargs)]
+
+    def test_predicate_parse(self):
+        p = guano_query.Predicate.parse('Timestamp >= 2017-04-01T00:00:00')
+        self.assertEqual(('Timestamp', '>='), (p.key, p.op))
+        p = guano_query.Predicate.parse('Loc Position within 42,-121,41,-122')
+        self.assertEqual((41.0, -122.0, 42.0, -121.0), p.operand)
+        self.assertRaises(ValueError, guano_query.Predicate.parse, 'Species Manual ID')
+
+    def test_equality(self):
+        self.assertEqual(['a.wav', 'b.wav'], self.query('Species Manual ID = Mylu'))
+        self.assertEqual(['c.wav'], self.query('Species Manual ID != Mylu'))
+
+    def test_typed(self):
+        self.assertEqual(['b.wav'], self.query('Length > 10'))  # numeric, not lexical comparison
+        self.assertEqual(['a.wav', 'c.wav'], self.query('Timestamp < 2017-05-01T00:00:00'))
+        self.assertEqual(['a.wav'], self.query('Species Manual ID = Mylu', 'Timestamp < 2017-04-20T09:00:00Z'))
+
+    def test_bbox(self):
+        self.assertEqual(['a.wav'], self.query('Loc Position within 41.5,-121.6,41.9,-121.4'))
+
+    def test_missing_field(self):
+        self.assertEqual([], self.query('Species Auto ID = Mylu'))
+
+    def test_index(self):
+        index_fname, count = guano_index.build_index(self.tmpdir)
+        self.assertEqual(3, count)
+        index = guano.read_index(index_fname)
+        self.assertEqual(3, len(index))
+        self.assertEqual(['a.wav', 'b.wav'], self.query('Species Manual ID = Mylu'))
+
+        # an index entry is ignored if its file has changed since being indexed
+        self.write_wav('c.wav', 'GUANO|Version: 1.0\nSpecies Manual ID: Mylu\nLength: 99')
+        self.assertEqual(['a.wav', 'b.wav', 'c.wav'], self.query('Species Manual ID = Mylu'))
+
+
+class WatchTest(TempDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.write_wav('old.wav', 'GUANO|Version: 1.0\nSpecies Manual ID: Mylu')
+        self.ingested = []
+
+    def ingest(self, watcher, settle=0):
+        ingester = guano_watch.Ingester(watcher, lambda g: self.ingested.append(os.path.basename(g.filename)),
+                                        settle=settle, workers=2)
+        return ingester
+
+    def check_watcher(self, watcher):
+        ingester = self.ingest(watcher)
+        try:
+            self.write_wav('new.wav', 'GUANO|Version: 1.0\nSpecies Manual ID: Epfu')
+            os.mkdir(self.path('sub'))
+            write_wav(self.path('sub', 'deeper.wav'), 'GUANO|Version: 1.0\nSpecies Manual ID: Epfu')
+            for i in range(5):
+                ingester.step(timeout=0.05)
+        finally:
+            ingester.close()
+        self.assertEqual(['deeper.wav', 'new.wav'], sorted(set(self.ingested)))
+
+    def test_polling(self):
+        self.check_watcher(guano_watch.PollingWatcher([self.tmpdir], interval=0))
+
+    @unittest.skipUnless(sys.platform.startswith('linux'), 'inotify requires Linux')
+    def test_inotify(self):
+        self.check_watcher(guano_watch.InotifyWatcher([self.tmpdir]))
+
+    def test_settle(self):
+        """Files which are still changing aren't ingested until they settle"""
+        ingester = self.ingest(guano_watch.PollingWatcher([self.tmpdir], interval=0), settle=60)
+        try:
+            self.write_wav('new.wav', 'GUANO|Version: 1.0')
+            ingester.step(timeout=0)
+            self.assertEqual([], self.ingested)
+            ingester.settle = 0
+            ingester.step(timeout=0)
+        finally:
+            ingester.close()
+        self.assertEqual(['new.wav'], self.ingested)
+
+
+class SplitTest(TempDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.fname = self.write_wav('long.wav', 'GUANO|Version: 1.0\nTimestamp: 2017-04-20T01:23:45',
+                                    data=b'\x00\x01' * 2500, params=wavparams(1, 2, 1000, 2500, 'NONE', None))
+
+    def test_duration(self):
+        clips = list(guano_split.split(self.fname, duration=1.0))
+        self.assertEqual([1.0, 1.0, 0.5], [c['Length'] for c in clips])
+        self.assertEqual([45, 46, 47], [c['Timestamp'].second for c in clips])
+        self.assertEqual('long_0002.000.wav', os.path.basename(clips[2].filename))
+
+    def test_ranges(self):
+        outdir = self.path('clips')
+        os.mkdir(outdir)
+        clips = list(guano_split.split(self.fname, ranges=[(0.5, 0.75)], outdir=outdir))
+        self.assertEqual(1, len(clips))
+        self.assertEqual(outdir, os.path.dirname(clips[0].filename))
+        self.assertEqual(250, clips[0].wav_params.nframes)
+
+
+class CompactTest(TempDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.fname = self.write_wav('a.wav', 'GUANO|Version: 1.0\nSpecies Manual ID: Mylu')
+
+    def test_compact(self):
+        self.assertFalse(guano_compact.compact(self.fname))
+        g = GuanoFile(self.fname, sidecar=True)
+        g['Species Manual ID'] = 'Epfu'
+        g.write()
+        self.assertEqual('Mylu', GuanoFile(self.fname)['Species Manual ID'])
+
+        self.assertTrue(guano_compact.compact(self.fname))
+        self.assertFalse(os.path.exists(guano.sidecar_filename(self.fname)))
+        self.assertEqual('Epfu', GuanoFile(self.fname)['Species Manual ID'])
+
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+@unittest.skipUnless(numpy, 'NumPy is not installed')
+class TriageTest(TempDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        # 40 kHz tone at half scale, with one clipped sample
+        t = numpy.arange(25000) / 250000.0
+        samples = (numpy.sin(2 * numpy.pi * 40000 * t) * 16384).astype('<i2')
+        samples[100] = 32767
+        self.fname = self.write_wav('tone.wav', 'GUANO|Version: 1.0', data=samples.tobytes())
+
+    def test_triage(self):
+        stats, cached = guano_triage.triage(self.fname, block=4096)
+        self.assertFalse(cached)
+        self.assertAlmostEqual(0.0, stats['Peak'], places=3)
+        self.assertAlmostEqual(-9.03, stats['RMS'], places=1)  # half-scale sine is -6 dB peak, -9 dB RMS
+        self.assertAlmostEqual(1 / 25000.0, stats['Clipping'])
+        self.assertGreater(stats['Band Energy'], 0.99)
+
+        g = GuanoFile(self.fname)
+        self.assertAlmostEqual(stats['Band Energy'], g['Triage|Band Energy'], places=4)
+        self.assertEqual((15000.0, 120000.0), g['Triage|Band'])
+
+        stats, cached = guano_triage.triage(self.fname)
+        self.assertTrue(cached)
+        stats, cached = guano_triage.triage(self.fname, band=(1000, 10000))
+        self.assertFalse(cached)
+        self.assertLess(stats['Band Energy'], 0.05)
+
+
+class ValidateTest(TempDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        files = {
+            'good.wav': 'GUANO|Version: 1.0\nLoc Position: 41.7 -121.5\nSamplerate: 250000\nTE: 1',
+            'noversion.wav': 'Samplerate: 250000',
+            'badpos.wav': 'GUANO|Version: 1.0\nLoc Position: 141.7 -121.5',
+            'badtypes.wav': 'GUANO|Version: 1.0\nSamplerate: fast\nLoc Accuracy: far\nTE: 0',
+        }
+        for fname, md in files.items():
+            self.write_wav(fname, md)
+        with open(self.path('dupe.wav'), 'wb') as f:
+            md = b'GUANO|Version: 1.0\nNote: one\nNote: two'  # GuanoFile can't write repeated fields
+            f.write(guano._wav_header(1, 2, 250000, 4) + b'\x01\x02\x03\x04')
+            f.write(guano._chunkhdr.pack(b'guan', len(md)) + md)
+            guano._patch_riff_size(f, f.tell())
+        with open(self.path('junk.wav'), 'wb') as f:
+            f.write(b'not a .WAV file')
+
+    def test_rules(self):
+        self.assertEqual([], guano_validate.validate_metadata('GUANO|Version: 1.0\nLoc Position: -33.9 151.2'))
+        self.assertEqual(['samplerate-range'], guano_validate.validate_metadata('GUANO|Version: 1.0\nSamplerate: -1'))
+        self.assertEqual(['encoding', 'version-missing'], guano_validate.validate_metadata(b'Note: caf\xe9'))
+        self.assertEqual(['unreadable'], guano_validate.validate_metadata('GUANO|Version: 1.0\nno colon'))
+        self.assertEqual(['type:Timestamp'], guano_validate.validate_metadata('GUANO|Version: 1.0\nTimestamp: yesterday'))
+
+    def test_report(self):
+        report = guano_validate.validate(self.tmpdir, samples=1)
+        self.assertEqual(6, report.files)
+        self.assertEqual(5, report.failed_files)
+        self.assertEqual({'version-missing': 1, 'loc-position-range': 1, 'type:Samplerate': 1, 'type:Loc Accuracy': 1,
+                          'te-range': 1, 'duplicate': 1, 'unreadable': 1}, report.counts)
+        self.assertEqual([self.path('badpos.wav')], report.examples['loc-position-range'])
+        self.assertIn('WGS84', report.to_text())
+
+
+class DedupeTest(TempDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.a = self.write_wav('a.wav', 'GUANO|Version: 1.0\nSpecies Manual ID: Mylu', data=b'\x01\x02' * 1000)
+        self.b = self.write_wav('b.wav', 'GUANO|Version: 1.0\nSpecies Manual ID: Epfu', data=b'\x01\x02' * 1000)
+        self.c = self.path('sub', 'c.wav')
+        os.mkdir(os.path.dirname(self.c))
+        shutil.copy(self.a, self.c)
+        self.d = self.write_wav('d.wav', 'GUANO|Version: 1.0\nSpecies Manual ID: Mylu', data=b'\x02\x01' * 1000)
+        self.cache = self.path(guano_dedupe.HASH_CACHE_FILENAME)
+
+    def test_groups(self):
+        digests = guano_dedupe.digests(self.tmpdir)
+        self.assertEqual([[self.a, self.b, self.c]], guano_dedupe.duplicate_groups(digests))
+        self.assertEqual(GuanoFile(self.a).audio_digest(), digests[self.a])
+
+    def test_cache(self):
+        guano_dedupe.digests(self.tmpdir, self.cache)
+        hash_file, hashed = guano_dedupe.hash_file, []
+        guano_dedupe.hash_file = lambda fname: hashed.append(fname) or hash_file(fname)
+        try:
+            write_wav(self.d, 'GUANO|Version: 1.0', data=b'\x01\x02' * 1000)
+            os.utime(self.d, (0, 0))  # ensure the mtime changes, however coarse the filesystem's
+            digests = guano_dedupe.digests(self.tmpdir, self.cache)
+        finally:
+            guano_dedupe.hash_file = hash_file
+        self.assertEqual([self.d], hashed)
+        self.assertEqual([[self.a, self.b, self.d, self.c]], guano_dedupe.duplicate_groups(digests))
+
+    def test_link(self):
+        group = guano_dedupe.duplicate_groups(guano_dedupe.digests(self.tmpdir))[0]
+        self.assertEqual([self.c], guano_dedupe.link_duplicates(group))
+        self.assertTrue(os.path.samefile(self.a, self.c))
+        self.assertFalse(os.path.samefile(self.a, self.b))  # metadata differs
+        self.assertEqual('Epfu', GuanoFile(self.b)['Species Manual ID'])
+
+
+class VerifyTest(TempDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.fnames = [self.write_wav(name, 'GUANO|Version: 1.0', data=b'\x01\x02' * 1000)
+                       for name in ('a.wav', 'b.wav', 'c.wav')]
+        for fname in self.fnames[:2]:
+            GuanoFile(fname).write(make_backup=False, checksum='crc32')
+        with open(self.fnames[1], 'r+b') as f:
+            f.seek(60)
+            f.write(b'\xff')
+
+    def test_verify(self):
+        results = list(guano_verify.verify(self.tmpdir, workers=2))
+        self.assertEqual(list(zip(self.fnames, [guano_verify.OK, guano_verify.MISMATCH, guano_verify.MISSING])),
+                         results)
+
+
+class ActivityTest(TempDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.write('a.wav', '2017-04-20T21:00:00-07:00', 'Mylu', 'Site A', 2.5)
+        self.write('b.wav', '2017-04-21T03:00:00-07:00', 'Mylu', 'Site A', 1.5)  # after midnight, same night
+        self.write('c.wav', '2017-04-21T13:00:00-07:00', 'Mylu', 'Site A', 1.0)  # next night
+        self.write('d.wav', '2017-04-20T22:00:00', 'Epfu', 'Site B', 3.0)
+
+    def write(self, name, timestamp, species, site, length):
+        md = 'GUANO|Version: 1.0\nTimestamp: %s\nSpecies Auto ID: %s\nSite Name: %s\nLength: %s' % \
+             (timestamp, species, site, length)
+        self.write_wav(name, md)
+
+    def test_night(self):
+        self.assertEqual('2017-04-20', guano_activity.night_of(guano.parse_timestamp('2017-04-21T11:59:59+10:00')))
+        self.assertEqual('2017-04-21', guano_activity.night_of(guano.parse_timestamp('2017-04-21T12:00:00+10:00')))
+
+    def test_rows(self):
+        activity = guano_activity.Activity(site_key='Site Name')
+        self.assertEqual(4, activity.update(self.tmpdir, workers=2))
+        self.assertEqual([('Site A', '2017-04-20', 'Mylu', 2, 4.0),
+                          ('Site A', '2017-04-21', 'Mylu', 1, 1.0),
+                          ('Site B', '2017-04-20', 'Epfu', 1, 3.0)], activity.rows())
+
+    def test_incremental(self):
+        """Only new, changed, and removed files update the cached aggregates"""
+        cache = self.path(guano_activity.ACTIVITY_CACHE_FILENAME)
+        activity = guano_activity.Activity()
+        activity.update(self.tmpdir)
+        activity.save(cache)
+
+        activity = guano_activity.Activity()
+        activity.load(cache)
+        self.assertEqual(0, activity.update(self.tmpdir))
+        self.write('e.wav', '2017-04-20T23:00:00', 'Epfu', 'Site B', 2.0)
+        os.remove(self.path('a.wav'))
+        self.assertEqual(2, activity.update(self.tmpdir))
+        self.assertEqual([('', '2017-04-20', 'Epfu', 2, 5.0),
+                          ('', '2017-04-20', 'Mylu', 1, 1.5),
+                          ('', '2017-04-21', 'Mylu', 1, 1.0)], activity.rows())
+
+        other = guano_activity.Activity(site_key='Site Name')
+        other.load(cache)  # cached with different grouping fields
+        self.assertEqual({}, other.files)
+
+
+class GeoTest(TempDirTestCase):
+
+    POSITIONS = {'roost.wav': (41.7, -121.5), 'near.wav': (41.73, -121.5), 'far.wav': (41.9, -121.5),
+                 'east.wav': (41.7, 179.99), 'west.wav': (41.7, -179.99)}
+
+    def setUp(self):
+        super().setUp()
+        for name, position in self.POSITIONS.items():
+            self.write_wav(name, 'GUANO|Version: 1.0\nLoc Position: %s %s' % position)
+        self.write_wav('nowhere.wav', 'GUANO|Version: 1.0')
+        self.spatial = guano_geo.SpatialIndex()
+        self.assertEqual(6, self.spatial.update(self.tmpdir, workers=2))
+
+    def test_bbox(self):
+        self.assertEqual([self.path('near.wav'), self.path('roost.wav')],
+                         self.spatial.within_bbox(41.6, -121.6, 41.8, -121.4))
+
+    def test_radius(self):
+        results = self.spatial.within_radius(41.7, -121.5, 5)
+        self.assertEqual([self.path('roost.wav'), self.path('near.wav')], [path for d, path in results])
+        self.assertAlmostEqual(3.34, results[1][0], places=2)
+        # across the antimeridian
+        self.assertEqual([self.path('east.wav'), self.path('west.wav')],
+                         [path for d, path in self.spatial.within_radius(41.7, 179.99, 5)])
+
+    def test_nearest(self):
+        self.assertEqual([self.path('far.wav'), self.path('near.wav')],
+                         [path for d, path in self.spatial.nearest(41.85, -121.5, 2)])
+        self.assertEqual(5, len(self.spatial.nearest(0, 0, 10)))
+
+    def test_persist(self):
+        fname = self.path(guano_geo.GEO_CACHE_FILENAME)
+        self.spatial.save(fname)
+        spatial = guano_geo.SpatialIndex()
+        spatial.load(fname)
+        self.assertEqual(0, spatial.update(self.tmpdir))
+        self.assertEqual([self.path('roost.wav')], [path for d, path in spatial.nearest(41.7, -121.5)])
+
+    def test_geojson(self):
+        geojson = self.spatial.to_geojson(self.spatial.within_radius(41.7, -121.5, 1))
+        self.assertEqual('FeatureCollection', geojson['type'])
+        feature, = geojson['features']
+        self.assertEqual({'type': 'Point', 'coordinates': [-121.5, 41.7]}, feature['geometry'])
+        self.assertEqual({'path': self.path('roost.wav'), 'distance_km': 0.0}, feature['properties'])
+
+
+class CliTest(TempDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.fnames = [self.write_wav(species + '.wav', 'GUANO|Version: 1.0\nSpecies Manual ID: %s' % species)
+                       for species in ('Mylu', 'Epfu', 'Lano')]
+
+    def run_cli(self, args, stdin=b''):
+        out, stdin_orig = io.StringIO(), sys.stdin
+        sys.stdin = io.TextIOWrapper(io.BytesIO(stdin))
+        try:
+            with redirect_stdout(out):
+                status = guano_cli.main(args)
+        finally:
+            sys.stdin = stdin_orig
+        return status, out.getvalue()
+
+    def test_dump(self):
+        status, out = self.run_cli(['dump', self.fnames[1]])
+        self.assertFalse(status)
+        self.assertIn('Species Manual ID: Epfu', out)
+
+    def test_stdin(self):
+        status, out = self.run_cli(['dump', '-'], stdin='\n'.join(self.fnames).encode())
+        self.assertEqual(3, out.count('Species Manual ID'))
+        status, out = self.run_cli(['-0', 'dump', '-'], stdin=b'\0'.join(f.encode() for f in self.fnames[:2]))
+        self.assertEqual(2, out.count('Species Manual ID'))
+
+    def test_path_batches(self):
+        paths = b'a.wav\nb.wav\r\n\nc.wav'
+        self.assertEqual([['a.wav', 'b.wav'], ['c.wav']],
+                         list(guano_cli.iter_path_batches(io.BytesIO(paths), batch_size=2)))
+
+    def test_usage(self):
+        self.assertEqual(2, self.run_cli(['bogus'])[0])
+        self.assertEqual(2, self.run_cli(['convert', 'bogus'])[0])
+        status, out = self.run_cli(['--help'])
+        self.assertIn('convert FORMAT', out)
+        for subcommand in 'edit', 'compact':
+            with self.assertRaises(SystemExit) as cm:
+                self.run_cli([subcommand, '--durability=bogus', self.fnames[0]])
+            self.assertEqual(2, cm.exception.code)
+
+    def test_lazy_imports(self):
+        """Importing guano doesn't import modules which are only needed by some features"""
+        code = 'import sys, guano; print(" ".join(m for m in ("logging", "typing", "tempfile", "shutil", ' \
+               '"zipfile", "tarfile", "json", "concurrent.futures", "threading") if m in sys.modules))'
+        out = subprocess.check_output([sys.executable, '-c', code], universal_newlines=True,
+                                      cwd=os.path.dirname(bin_path))
+        self.assertEqual('', out.strip())
+
+
 if __name__ == '__main__':
     unittest.main()